@@ -0,0 +1,153 @@
+"""
+Keyset-paginated, filterable view of the user activity log.
+
+Pages are ordered newest first on (timestamp, id) and continue below the
+last row of the previous page, so fetching page 1000 costs the same as
+page 1. Every filter has an index leading with the filtered column and
+followed by timestamp, so a filtered page is an index range scan as well.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import or_
+
+from extensions import db
+from models import User, UserActivity
+
+def encode_activity_cursor(timestamp: datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp.isoformat(), id]).encode()).decode()
+
+def decode_activity_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    try:
+        timestamp, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, TypeError):
+        return None
+
+def _parse_time(value: str, end: bool = False) -> datetime:
+    # A bare date covers the whole day, so 'until' includes it
+    if len(value) == 10:
+        day = datetime.strptime(value, '%Y-%m-%d')
+        return day + timedelta(days=1) if end else day
+    return datetime.fromisoformat(value)
+
+def parse_activity_filters(args: Mapping[str, str]) -> Dict:
+    """
+    Validate activity log filters from query string arguments. Must run in an app context.
+    
+    Args:
+        args: Mapping with any of user (id or email), type, suspicious (1/0),
+            ip, since and until (YYYY-MM-DD or ISO datetime, until is exclusive
+            for datetimes and inclusive for dates)
+    
+    Returns:
+        Dict of filters for get_activity_page
+    
+    Raises:
+        ValueError: With a message for the client if a filter is malformed
+    """
+    filters = {}
+    
+    user = args.get('user', '').strip()
+    if user:
+        if user.isdigit():
+            filters['user_id'] = int(user)
+        else:
+            user_id = db.session.query(User.id).filter_by(email=user).scalar()
+            # An unknown email matches nothing rather than everything
+            filters['user_id'] = user_id if user_id is not None else 0
+    
+    if args.get('type', '').strip():
+        filters['activity_type'] = args['type'].strip()
+    
+    suspicious = args.get('suspicious', '').strip().lower()
+    if suspicious:
+        if suspicious not in ('1', '0', 'true', 'false'):
+            raise ValueError('suspicious must be 1 or 0')
+        filters['is_suspicious'] = suspicious in ('1', 'true')
+    
+    if args.get('ip', '').strip():
+        filters['ip_address'] = args['ip'].strip()
+    
+    try:
+        if args.get('since', '').strip():
+            filters['since'] = _parse_time(args['since'].strip())
+        if args.get('until', '').strip():
+            filters['until'] = _parse_time(args['until'].strip(), end=True)
+    except ValueError:
+        raise ValueError('since and until must be YYYY-MM-DD or ISO datetimes')
+    
+    return filters
+
+def activity_page_query(filters: Dict, after: Optional[Tuple[datetime, int]] = None, limit: int = 50):
+    """
+    Build the query for one page of the activity log, newest first.
+    
+    Args:
+        filters: Output of parse_activity_filters
+        after: Decoded cursor of the previous page
+        limit: Rows per page
+    
+    Returns:
+        The query, fetching one extra row to tell whether there is another page
+    """
+    query = db.session.query(
+        UserActivity.id, UserActivity.timestamp, UserActivity.user_id, User.email,
+        UserActivity.activity_type, UserActivity.description,
+        UserActivity.ip_address, UserActivity.is_suspicious
+    ).join(User, User.id == UserActivity.user_id).filter(
+        UserActivity.timestamp.isnot(None)  # Can't be ordered or paged past
+    )
+    
+    if 'user_id' in filters:
+        query = query.filter(UserActivity.user_id == filters['user_id'])
+    if 'activity_type' in filters:
+        query = query.filter(UserActivity.activity_type == filters['activity_type'])
+    if 'is_suspicious' in filters:
+        query = query.filter(UserActivity.is_suspicious == filters['is_suspicious'])
+    if 'ip_address' in filters:
+        query = query.filter(UserActivity.ip_address == filters['ip_address'])
+    if 'since' in filters:
+        query = query.filter(UserActivity.timestamp >= filters['since'])
+    if 'until' in filters:
+        query = query.filter(UserActivity.timestamp < filters['until'])
+    
+    if after:
+        after_timestamp, after_id = after
+        query = query.filter(
+            UserActivity.timestamp <= after_timestamp,  # Lets the planner seek the index on timestamp
+            or_(UserActivity.timestamp < after_timestamp, UserActivity.id < after_id)
+        )
+    
+    return query.order_by(UserActivity.timestamp.desc(), UserActivity.id.desc()).limit(limit + 1)
+
+def get_activity_page(filters: Dict, after: Optional[Tuple[datetime, int]] = None, limit: int = 50) -> Dict:
+    """
+    Get one page of the activity log, newest first.
+    
+    Args:
+        filters: Output of parse_activity_filters
+        after: Decoded cursor of the previous page
+        limit: Rows per page
+    
+    Returns:
+        Dict with the page's activities and the cursor of the next page, or None on the last page
+    """
+    rows = activity_page_query(filters, after, limit).all()
+    next_cursor = encode_activity_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    
+    return {
+        'activities': [{
+            'id': row.id,
+            'timestamp': row.timestamp.isoformat(),
+            'user_id': row.user_id,
+            'user_email': row.email,
+            'activity_type': row.activity_type,
+            'description': row.description,
+            'ip_address': row.ip_address,
+            'is_suspicious': bool(row.is_suspicious)
+        } for row in rows[:limit]],
+        'next_cursor': next_cursor
+    }
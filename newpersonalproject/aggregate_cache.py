@@ -0,0 +1,239 @@
+"""
+Shared TTL cache for expensive aggregates.
+
+Values are computed by a callback and stored as JSON in the aggregate_cache
+table, so every worker shares one computation, with a short-lived
+in-process tier in front of it. An entry is fresh until its TTL runs out or
+a write invalidates it by bumping its generation.
+
+Recomputation is guarded by a lease on the row: concurrent requests, in
+this process or any other, trigger a single recomputation and wait for it.
+With stale_seconds set, a stale value keeps being served while a
+refresh_aggregate background job recomputes it, so readers never wait on
+the aggregate. The job only carries the key; its compute callback is
+looked up from register(), so every process registers its keys at import.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from jobs import background_task
+from models import AggregateCache as AggregateCacheEntry, Job
+
+logger = logging.getLogger(__name__)
+
+# Cache key -> (cache, compute), for refresh_aggregate jobs
+_registry: Dict[str, Tuple['AggregateCache', Callable[[], Any]]] = {}
+
+class AggregateCache:
+    def __init__(self, ttl_seconds: float = 300, stale_seconds: float = 0,
+                 local_seconds: float = 5, lease_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.local_seconds = local_seconds
+        self.lease_seconds = lease_seconds
+        # key -> (value, computed_at, fresh, checked_at)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+    
+    def register(self, key: str, compute: Callable[[], Any]):
+        """
+        Register the computation of a key, so a job in any worker can refresh it.
+        
+        Args:
+            key: Cache key
+            compute: Returns the JSON-serializable value; runs in an app context
+        """
+        _registry[key] = (self, compute)
+    
+    def get(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Get a cached aggregate, computing it if missing or stale.
+        
+        Args:
+            key: Cache key
+            compute: Returns the JSON-serializable value; runs in an app context
+        
+        Returns:
+            The value
+        """
+        entry = self._get_memory(key)
+        if entry is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return entry[0]
+        
+        entry = self._load(key)
+        if entry is not None:
+            value, computed_at, fresh = entry
+            if fresh:
+                with self._lock:
+                    self.db_hits += 1
+                return value
+            
+            if self.stale_seconds and datetime.utcnow() - computed_at < timedelta(seconds=self.ttl_seconds + self.stale_seconds):
+                # Stale-while-revalidate: answer now, recompute off the request
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(key, compute)
+                return value
+        
+        return self._refresh(key, compute, wait=True)
+    
+    def invalidate(self, *keys: str):
+        """
+        Mark aggregates stale, in the caller's database transaction.
+        
+        Other workers notice within local_seconds.
+        
+        Args:
+            *keys: Cache keys
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        AggregateCacheEntry.query.filter(AggregateCacheEntry.key.in_(keys)).update(
+            {AggregateCacheEntry.generation: AggregateCacheEntry.generation + 1}, synchronize_session=False
+        )
+    
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters for monitoring.
+        
+        Returns:
+            Dict of per-tier hits, stale hits, recomputations and settings
+        """
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'ttl_seconds': self.ttl_seconds,
+                'stale_seconds': self.stale_seconds,
+            }
+    
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, computed_at, fresh, checked_at = entry
+        now = datetime.utcnow()
+        # Re-check the shared row now and then to see other workers' invalidations
+        if not fresh or now - checked_at >= timedelta(seconds=self.local_seconds) \
+                or now - computed_at >= timedelta(seconds=self.ttl_seconds):
+            return None
+        return entry
+    
+    def _load(self, key: str):
+        row = db.session.query(
+            AggregateCacheEntry.value, AggregateCacheEntry.computed_at,
+            AggregateCacheEntry.generation, AggregateCacheEntry.value_generation
+        ).filter_by(key=key).first()
+        if row is None or row.value is None:
+            return None
+        
+        now = datetime.utcnow()
+        value = json.loads(row.value)
+        fresh = row.value_generation == row.generation and now - row.computed_at < timedelta(seconds=self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = (value, row.computed_at, fresh, now)
+        return value, row.computed_at, fresh
+    
+    def _claim(self, key: str) -> Optional[int]:
+        # Take the recompute lease; returns the generation being computed, or None if someone else holds it
+        now = datetime.utcnow()
+        db.session.execute(insert(AggregateCacheEntry).values(key=key, generation=0).on_conflict_do_nothing(
+            index_elements=[AggregateCacheEntry.key]
+        ))
+        claimed = AggregateCacheEntry.query.filter(
+            AggregateCacheEntry.key == key,
+            or_(AggregateCacheEntry.refreshing_until.is_(None), AggregateCacheEntry.refreshing_until < now)
+        ).update({AggregateCacheEntry.refreshing_until: now + timedelta(seconds=self.lease_seconds)},
+                 synchronize_session=False)
+        generation = db.session.query(AggregateCacheEntry.generation).filter_by(key=key).scalar()
+        db.session.commit()
+        return generation if claimed else None
+    
+    def _refresh(self, key: str, compute: Callable[[], Any], wait: bool) -> Any:
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        with key_lock:
+            # Another thread may have refreshed it while we waited for the lock
+            entry = self._get_memory(key)
+            if entry is not None:
+                return entry[0]
+            
+            deadline = time.monotonic() + self.lease_seconds
+            while True:
+                generation = self._claim(key)
+                if generation is not None:
+                    break
+                if not wait:
+                    return None
+                # Another worker is recomputing it, use its result once stored
+                time.sleep(0.05)
+                entry = self._load(key)
+                if entry is not None and entry[2]:
+                    return entry[0]
+                if time.monotonic() > deadline:
+                    # The lease holder should have finished by now; compute it ourselves
+                    generation = db.session.query(AggregateCacheEntry.generation).filter_by(key=key).scalar()
+                    break
+            
+            with self._lock:
+                self.misses += 1
+            try:
+                value = compute()
+            except Exception:
+                db.session.rollback()
+                AggregateCacheEntry.query.filter_by(key=key).update(
+                    {AggregateCacheEntry.refreshing_until: None}, synchronize_session=False
+                )
+                db.session.commit()
+                raise
+            
+            now = datetime.utcnow()
+            # A write during the computation left generation ahead of value_generation, so the value stays stale
+            AggregateCacheEntry.query.filter_by(key=key).update({
+                AggregateCacheEntry.value: json.dumps(value),
+                AggregateCacheEntry.computed_at: now,
+                AggregateCacheEntry.value_generation: generation,
+                AggregateCacheEntry.refreshing_until: None
+            }, synchronize_session=False)
+            db.session.commit()
+            self._load(key)
+            return value
+    
+    def _refresh_in_background(self, key: str, compute: Callable[[], Any]):
+        _registry.setdefault(key, (self, compute))
+        # One queued refresh per key; across processes the row lease keeps it to one computation
+        pending = Job.query.filter_by(
+            type=refresh_aggregate.name, status='pending',
+            payload=json.dumps({'args': [key], 'kwargs': {}})
+        ).first()
+        if pending is None:
+            refresh_aggregate.delay(key)
+
+@background_task(max_attempts=3)
+def refresh_aggregate(key: str):
+    """Recompute a stale cached aggregate off the request"""
+    if key not in _registry:
+        logger.warning('No computation registered for cached aggregate %s', key)
+        return
+    cache, compute = _registry[key]
+    cache._refresh(key, compute, wait=False)
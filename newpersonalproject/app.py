@@ -1,24 +1,60 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, Response, stream_with_context, has_request_context
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from functools import wraps
-from sqlalchemy import func
+import click
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
 from flask_migrate import Migrate
+import base64
+import hashlib
+import io
+import json
+import math
 import os
 
 from extensions import db, login_manager, mail
-from models import User, Transaction, UserActivity, Analytics
-from expense_categorizer import categorize_expense_nlp
-from expense_forecaster import ExpenseForecaster
+from models import User, Transaction, UserActivity, Analytics, Forecast, MonthlyRollup, UserCategorizer
+from expense_categorizer import categorize_expense, categorize_expenses, categorization_stats, predict_zero_shot
+from categorization_cache import CategorizationCache
+from user_categorizer import UserCategorizerStore, evaluate_categorizer
+from expense_forecaster import ExpenseForecaster, get_monthly_aggregates
+from incremental_forecaster import ForecastStateStore, extrema_query
+from monthly_rollup import apply_transaction, check_rollups, get_rollup_rows, month_key, rebuild_rollups, refresh_rollup_months, rollup_row_queries
+from transaction_export import EXPORT_FORMATS, export_query, export_transactions
+from transaction_import import import_transactions, parse_statement
+from query_plans import check_query_plans
+from daily_analytics import (active_users_query, analytics_row_query, day_totals_query, most_common_category_query,
+                             record_transaction, record_transactions, refresh_daily_analytics, schedule_analytics_refresh)
+from aggregate_cache import AggregateCache
+from activity_log import activity_page_query, decode_activity_cursor, get_activity_page, parse_activity_filters
+from query_budget import query_budget
+from jobs import JobRunner, background_task, due_job_query, job_metrics, run_pending_jobs
 from email_utils import send_verification_email
+from recategorize import recategorize_transactions
+from batch_forecast import ForecastHitCounter, forecast_all_users, get_cutoff_date, schedule_forecasts, store_forecast
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///finance.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///finance.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_LOGIN_ATTEMPTS'] = 5
 app.config['ACCOUNT_LOCKOUT_MINUTES'] = 30
+app.config['CATEGORY_CACHE_SIZE'] = 10000  # In-process LRU entries per worker
+app.config['TRANSACTIONS_PAGE_SIZE'] = 50
+app.config['MAX_TRANSACTIONS_PAGE_SIZE'] = 200
+app.config['IMPORT_BATCH_SIZE'] = 1000  # Rows per import transaction
+app.config['ACTIVITY_LOG_PAGE_SIZE'] = 50
+app.config['MAX_ACTIVITY_LOG_PAGE_SIZE'] = 500
+app.config['FORECAST_SCHEDULE_HOURS'] = float(os.environ.get('FORECAST_SCHEDULE_HOURS', 0))  # 0 disables
+app.config['ANALYTICS_REFRESH_MINUTES'] = float(os.environ.get('ANALYTICS_REFRESH_MINUTES', 15))  # 0 disables
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # 0 runs background tasks inline
+app.config['JOB_POLL_SECONDS'] = float(os.environ.get('JOB_POLL_SECONDS', 1))
+app.config['JOB_LEASE_SECONDS'] = float(os.environ.get('JOB_LEASE_SECONDS', 600))  # Longest a job may run
+app.config['JOB_RETENTION_DAYS'] = float(os.environ.get('JOB_RETENTION_DAYS', 7))
+app.config['ADMIN_CACHE_TTL_SECONDS'] = float(os.environ.get('ADMIN_CACHE_TTL_SECONDS', 300))
+app.config['ADMIN_CACHE_STALE_SECONDS'] = float(os.environ.get('ADMIN_CACHE_STALE_SECONDS', 600))  # 0 disables stale-while-revalidate
 
 # Email configuration
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
@@ -33,6 +69,21 @@ db.init_app(app)
 login_manager.init_app(app)
 mail.init_app(app)
 migrate = Migrate(app, db)
+category_cache = CategorizationCache(max_size=app.config['CATEGORY_CACHE_SIZE'])
+user_categorizers = UserCategorizerStore(train_later=lambda user_id: train_user_categorizer.delay(user_id))
+forecast_states = ForecastStateStore()
+forecast_hits = ForecastHitCounter()
+admin_cache = AggregateCache(
+    ttl_seconds=app.config['ADMIN_CACHE_TTL_SECONDS'],
+    stale_seconds=app.config['ADMIN_CACHE_STALE_SECONDS']
+)
+ADMIN_STATS_KEY = 'admin_dashboard_stats'
+job_runner = JobRunner(
+    workers=app.config['JOB_WORKERS'],
+    poll_seconds=app.config['JOB_POLL_SECONDS'],
+    lease_seconds=app.config['JOB_LEASE_SECONDS'],
+    retention_days=app.config['JOB_RETENTION_DAYS']
+)
 
 def admin_required(f):
     @wraps(f)
@@ -43,103 +94,214 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def log_activity(user_id, activity_type, description, is_suspicious=False):
+def conditional_on_data_version(f):
+    """Answer If-None-Match from the user's data version before the view runs any query"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Relative ranges ('month', forecast periods) depend on today's date too
+        key = (request.path, current_user.id, current_user.data_version,
+               datetime.now().date().isoformat(), sorted(request.args.items(multi=True)))
+        etag = hashlib.sha1(repr(key).encode()).hexdigest()
+        
+        # If-None-Match uses the weak comparison (RFC 9110)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+        
+        response.set_etag(etag)
+        # Per-user data, and the browser must revalidate before reusing it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
+def log_activity(user_id, activity_type, description, is_suspicious=False, commit=True):
     activity = UserActivity(
         user_id=user_id,
         activity_type=activity_type,
         description=description,
-        ip_address=request.remote_addr,
+        ip_address=request.remote_addr if has_request_context() else None,
         is_suspicious=is_suspicious
     )
     db.session.add(activity)
-    db.session.commit()
+    # Pass commit=False to ride along with the caller's own commit
+    if commit:
+        db.session.commit()
 
-def update_daily_analytics():
-    today = datetime.now().date()
-    analytics = Analytics.query.filter_by(date=today).first()
+def categorize_for_user(user_id, note, run_model=True):
+    # Keyword rules first, then the user's own learned model, then the
+    # (cached) zero-shot transformer. With run_model=False a cache miss
+    # returns None instead of running the transformer.
+    category = categorize_expense(note)
+    if category != 'Uncategorized':
+        return category
     
-    if not analytics:
-        analytics = Analytics(date=today)
-        db.session.add(analytics)
+    learned_category = user_categorizers.predict(user_id, note)
+    if learned_category:
+        return learned_category
     
-    # Update analytics
-    analytics.total_users = User.query.count()
-    analytics.active_users = UserActivity.query.filter(
-        func.date(UserActivity.timestamp) == today
-    ).distinct(UserActivity.user_id).count()
+    if not run_model:
+        return category_cache.lookup(note)
+    return category_cache.categorize(note)
+
+def categorize_many_for_user(user_id, notes, run_model=True):
+    # Same order as categorize_for_user, with one call per stage for the whole batch.
+    # With run_model=False cache misses come back as None.
+    categories = categorize_expenses(notes)
     
-    today_transactions = Transaction.query.filter(
-        func.date(Transaction.date) == today
-    ).all()
+    pending = []
+    for i, (note, category) in enumerate(zip(notes, categories)):
+        if category == 'Uncategorized' and note:
+            learned_category = user_categorizers.predict(user_id, note)
+            if learned_category:
+                categories[i] = learned_category
+            else:
+                pending.append(i)
     
-    analytics.total_transactions = len(today_transactions)
-    analytics.total_income = sum(t.amount for t in today_transactions if t.type == 'income')
-    analytics.total_expense = sum(t.amount for t in today_transactions if t.type == 'expense')
+    if pending:
+        pending_notes = [notes[i] for i in pending]
+        if run_model:
+            found = category_cache.categorize_many(pending_notes)
+        else:
+            found = category_cache.lookup_many(pending_notes)
+        for i, category in zip(pending, found):
+            categories[i] = category
+    return categories
+
+@background_task(max_attempts=3)
+def learn_category(user_id, note, category):
+    """Update the user's categorizer with a category they chose"""
+    user_categorizers.learn(user_id, note, category)
+
+@background_task(max_attempts=3)
+def train_user_categorizer(user_id):
+    """Build a user's categorizer from their labelled history, the first time it is needed"""
+    if db.session.query(UserCategorizer.id).filter_by(user_id=user_id).first() is None:
+        user_categorizers.train_from_history(user_id)
+
+@background_task(max_attempts=3)
+def categorize_transaction(transaction_id):
+    """Run the transformer for a transaction added while its note was not in the cache"""
+    transaction = db.session.get(Transaction, transaction_id)
+    if transaction is None or transaction.category != 'Uncategorized' or not transaction.note:
+        return  # Deleted or already categorized
     
-    if today_transactions:
-        analytics.avg_transaction_amount = sum(t.amount for t in today_transactions) / len(today_transactions)
-        
-        # Find most common category
-        category_counts = {}
-        for t in today_transactions:
-            category_counts[t.category] = category_counts.get(t.category, 0) + 1
-        if category_counts:
-            analytics.most_common_category = max(category_counts.items(), key=lambda x: x[1])[0]
+    # Raises while the model is unavailable, so the job is retried instead of done
+    category = category_cache.categorize(transaction.note, strict=True)
+    if category == 'Uncategorized':
+        return
     
+    # Move the amount to the new category in today's analytics and the month's rollup
+    record_transactions([(transaction.date, transaction.type, transaction.category, transaction.amount)], -1)
+    transaction.category = category
+    transaction.category_source = 'auto'
+    record_transactions([(transaction.date, transaction.type, transaction.category, transaction.amount)], 1)
+    db.session.flush()
+    refresh_rollup_months([(transaction.user_id, month_key(transaction.date))])
+    User.bump_data_version(transaction.user_id)
+    admin_cache.invalidate(ADMIN_STATS_KEY)
     db.session.commit()
 
-@app.route('/admin')
-@login_required
-@admin_required
-def admin_dashboard():
-    # Get overall statistics
-    total_users = User.query.count()
-    total_transactions = Transaction.query.count()
-    
-    # Get recent activities
-    recent_activities = UserActivity.query.order_by(UserActivity.timestamp.desc()).limit(10).all()
-    
-    # Get suspicious activities
-    suspicious_activities = UserActivity.query.filter_by(is_suspicious=True)\
-        .order_by(UserActivity.timestamp.desc()).limit(5).all()
-    
-    # Get user statistics
-    user_stats = db.session.query(
+@background_task(max_attempts=3)
+def categorize_imported(transaction_ids):
+    """Run the transformer for imported transactions whose notes were not in the cache"""
+    # Already categorized rows are skipped, so a retry redoes only the rest
+    for transaction_id in transaction_ids:
+        categorize_transaction(transaction_id)
+
+def user_stats_query():
+    return db.session.query(
         User.id,
         User.email,
         func.count(Transaction.id).label('transaction_count'),
         func.sum(Transaction.amount).label('total_amount')
-    ).join(Transaction).group_by(User.id).all()
-    
-    # Get popular categories
-    category_stats = db.session.query(
+    ).join(Transaction).group_by(User.id)
+
+def category_stats_query():
+    return db.session.query(
         Transaction.category,
         func.count(Transaction.id).label('count'),
         func.sum(Transaction.amount).label('total_amount')
-    ).group_by(Transaction.category).all()
+    ).group_by(Transaction.category)
+
+def recent_activities_query():
+    # With the users the template shows, in the same query
+    return UserActivity.query.options(joinedload(UserActivity.user, innerjoin=True))\
+        .order_by(UserActivity.timestamp.desc()).limit(10)
+
+def suspicious_activities_query():
+    return UserActivity.query.options(joinedload(UserActivity.user, innerjoin=True))\
+        .filter_by(is_suspicious=True).order_by(UserActivity.timestamp.desc()).limit(5)
+
+def analytics_trend_query():
+    return Analytics.query.order_by(Analytics.date.desc()).limit(7)
+
+def compute_admin_stats():
+    # Full-table aggregates behind the admin dashboard, as JSON for admin_cache
+    user_stats = user_stats_query().all()
+    category_stats = category_stats_query().all()
+    
+    return {
+        'total_users': User.query.count(),
+        'total_transactions': Transaction.query.count(),
+        'user_stats': [row._asdict() for row in user_stats],
+        'category_stats': [row._asdict() for row in category_stats]
+    }
+
+# Job workers refresh it by key when it goes stale
+admin_cache.register(ADMIN_STATS_KEY, compute_admin_stats)
+
+@app.route('/admin')
+@login_required
+@admin_required
+@query_budget(14)  # Cache miss included, whose commits make the template reload current_user; 3 once cached
+def admin_dashboard():
+    # Overall, per-user and per-category statistics, cached
+    stats = admin_cache.get(ADMIN_STATS_KEY, compute_admin_stats)
+    
+    # Get recent and suspicious activities
+    recent_activities = recent_activities_query().all()
+    suspicious_activities = suspicious_activities_query().all()
     
-    # Get analytics trend
-    analytics_trend = Analytics.query.order_by(Analytics.date.desc()).limit(7).all()
+    # Get analytics trend, as plain dicts for the chart's JSON
+    analytics_trend = [{
+        'date': day.date.isoformat(),
+        'active_users': day.active_users,
+        'total_transactions': day.total_transactions
+    } for day in analytics_trend_query()]
     
     return render_template('admin/dashboard.html',
-                         total_users=total_users,
-                         total_transactions=total_transactions,
+                         total_users=stats['total_users'],
+                         total_transactions=stats['total_transactions'],
                          recent_activities=recent_activities,
                          suspicious_activities=suspicious_activities,
-                         user_stats=user_stats,
-                         category_stats=category_stats,
+                         user_stats=stats['user_stats'],
+                         category_stats=stats['category_stats'],
                          analytics_trend=analytics_trend)
 
+def admin_users_query():
+    # Transaction counts from the monthly rollup, in the same query as the users
+    transaction_counts = db.session.query(
+        MonthlyRollup.user_id,
+        func.sum(MonthlyRollup.count).label('transaction_count')
+    ).group_by(MonthlyRollup.user_id).subquery()
+    
+    return db.session.query(
+        User, func.coalesce(transaction_counts.c.transaction_count, 0)
+    ).outerjoin(transaction_counts, transaction_counts.c.user_id == User.id)\
+        .order_by(User.created_at.desc())
+
 @app.route('/admin/users')
 @login_required
 @admin_required
+@query_budget(1)
 def admin_users():
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    return render_template('admin/users.html', users=admin_users_query().all())
 
 @app.route('/admin/analytics')
 @login_required
 @admin_required
+@query_budget(1)
 def admin_analytics():
     # Get date range
     end_date = datetime.now().date()
@@ -151,17 +313,104 @@ def admin_analytics():
     
     return render_template('admin/analytics.html', analytics=analytics)
 
+def get_activity_log_page():
+    # Shared by the page and the API; returns (page, filters) or raises ValueError
+    filters = parse_activity_filters(request.args)
+    limit = request.args.get('limit', app.config['ACTIVITY_LOG_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_ACTIVITY_LOG_PAGE_SIZE']))
+    
+    after = None
+    if request.args.get('cursor'):
+        after = decode_activity_cursor(request.args['cursor'])
+        if after is None:
+            raise ValueError('Invalid cursor')
+    
+    return get_activity_page(filters, after, limit), filters
+
 @app.route('/admin/activity-log')
 @login_required
 @admin_required
+@query_budget(2)
 def admin_activity_log():
-    activities = UserActivity.query.order_by(UserActivity.timestamp.desc()).all()
-    return render_template('admin/activity_log.html', activities=activities)
+    try:
+        page, filters = get_activity_log_page()
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('admin_activity_log'))
+    
+    # Filters stay in the pagination links, only the cursor changes
+    args = {key: value for key, value in request.args.items() if key != 'cursor'}
+    next_url = url_for('admin_activity_log', cursor=page['next_cursor'], **args) if page['next_cursor'] else None
+    first_url = url_for('admin_activity_log', **args) if request.args.get('cursor') else None
+    
+    return render_template('admin/activity_log.html',
+                         activities=page['activities'],
+                         filters=request.args,
+                         next_url=next_url,
+                         first_url=first_url)
+
+@app.route('/admin/api/activity-log')
+@login_required
+@admin_required
+@query_budget(2)
+def admin_activity_log_api():
+    try:
+        page, _ = get_activity_log_page()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@app.route('/admin/api/categorizer-stats')
+@login_required
+@admin_required
+@query_budget(0)
+def admin_categorizer_stats():
+    # Queue depth, batch sizes and wait percentiles for tuning the batch window,
+    # plus categorization cache hit/miss counters
+    return jsonify({
+        'batching': categorization_stats(),
+        'cache': category_cache.stats()
+    })
+
+@app.route('/admin/api/admin-cache-stats')
+@login_required
+@admin_required
+@query_budget(0)
+def admin_cache_stats():
+    # Hit rate of the cached dashboard aggregates
+    return jsonify(admin_cache.stats())
+
+@app.route('/admin/api/forecast-stats')
+@login_required
+@admin_required
+@query_budget(0)
+def admin_forecast_stats():
+    # How often /api/forecast was answered from the Forecast table instead of retraining
+    return jsonify(forecast_hits.stats())
+
+@app.route('/admin/api/job-stats')
+@login_required
+@admin_required
+@query_budget(3)
+def admin_job_stats():
+    # Queue depth, and queue wait/run time percentiles per task over the last hour
+    return jsonify(job_metrics(window_minutes=request.args.get('window', 60, type=float)))
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+@app.before_request
+def start_job_runner():
+    # Workers start with the first request, so CLI commands and migrations never spawn them
+    if not job_runner.start(app):
+        return
+    # Jobs, so they run once per interval rather than once per process
+    if app.config['ANALYTICS_REFRESH_MINUTES'] > 0:
+        schedule_analytics_refresh(app.config['ANALYTICS_REFRESH_MINUTES'])
+    if app.config['FORECAST_SCHEDULE_HOURS'] > 0:
+        schedule_forecasts(app.config['FORECAST_SCHEDULE_HOURS'])
+
 def get_date_range(range_type):
     today = datetime.now().date()
     
@@ -191,37 +440,32 @@ def get_date_range(range_type):
     return start_date, end_date
 
 def get_filtered_data(start_date=None, end_date=None):
-    # Base query
-    query = Transaction.query.filter_by(user_id=current_user.id)
-    
-    # Apply date filtering if dates are specified
+    # Per-month, per-category totals from the rollup; only partial edge
+    # months of the range are aggregated from raw transactions
     if start_date and end_date:
-        query = query.filter(Transaction.date >= start_date, Transaction.date <= end_date)
-    
-    # Get transactions and sort by date
-    transactions = query.order_by(Transaction.date.desc()).all()
+        rows = get_rollup_rows(current_user.id, start_date, end_date)
+    else:
+        rows = get_rollup_rows(current_user.id)
     
     # Calculate summary statistics
-    total_income = sum(t.amount for t in transactions if t.type == 'income')
-    total_expense = sum(t.amount for t in transactions if t.type == 'expense')
+    total_income = sum(row[3] for row in rows if row[1] == 'income')
+    total_expense = sum(row[3] for row in rows if row[1] == 'expense')
     savings = total_income - total_expense
     
-    # Category-wise spending
+    # Category-wise spending, most recently used categories first
     categories = {}
-    for t in transactions:
-        if t.type == 'expense':
-            categories[t.category] = categories.get(t.category, 0) + t.amount
+    for month, type, category, total, *_ in reversed(rows):
+        if type == 'expense':
+            categories[category] = categories.get(category, 0) + total
     
-    # Get monthly data for trend chart
+    # Get monthly data for trend chart, rows are sorted chronologically
     monthly_data = {}
-    for transaction in transactions:
-        month_key = transaction.date.strftime('%Y-%m')
-        if month_key not in monthly_data:
-            monthly_data[month_key] = {'income': 0, 'expense': 0}
-        monthly_data[month_key][transaction.type] += transaction.amount
-    
-    # Sort months chronologically
-    sorted_months = sorted(monthly_data.keys())
+    for month, type, category, total, *_ in rows:
+        if month not in monthly_data:
+            monthly_data[month] = {'income': 0, 'expense': 0}
+        monthly_data[month][type] += total
+    
+    sorted_months = list(monthly_data)
     trend_data = {
         'labels': [datetime.strptime(m, '%Y-%m').strftime('%b %Y') for m in sorted_months],
         'income': [monthly_data[m]['income'] for m in sorted_months],
@@ -235,7 +479,47 @@ def get_filtered_data(start_date=None, end_date=None):
             'savings': savings
         },
         'categories': categories,
-        'trend_data': trend_data,
+        'trend_data': trend_data
+    }
+
+def encode_cursor(date, id):
+    return base64.urlsafe_b64encode(json.dumps([date.isoformat(), id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        date, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.strptime(date, '%Y-%m-%d').date(), int(id)
+    except (ValueError, TypeError):
+        return None
+
+def transactions_page_query(user_id, start_date=None, end_date=None, after=None, limit=50):
+    # Base query
+    query = db.session.query(
+        Transaction.id, Transaction.date, Transaction.type,
+        Transaction.category, Transaction.amount, Transaction.note
+    ).filter(Transaction.user_id == user_id)
+    
+    # Apply date filtering if dates are specified
+    if start_date and end_date:
+        query = query.filter(Transaction.date >= start_date, Transaction.date <= end_date)
+    
+    # Continue below the last row of the previous page, so every page is an
+    # index range scan no matter how deep into the history it is
+    if after:
+        after_date, after_id = after
+        query = query.filter(
+            Transaction.date <= after_date,  # Lets the planner seek the index on date
+            or_(Transaction.date < after_date, Transaction.id < after_id)
+        )
+    
+    # Fetch one extra row to know whether there is another page
+    return query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1)
+
+def get_transactions_page(start_date=None, end_date=None, after=None, limit=50):
+    rows = transactions_page_query(current_user.id, start_date, end_date, after, limit).all()
+    next_cursor = encode_cursor(rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    
+    return {
         'transactions': [{
             'date': t.date.strftime('%Y-%m-%d'),
             'type': t.type,
@@ -243,25 +527,74 @@ def get_filtered_data(start_date=None, end_date=None):
             'amount': t.amount,
             'note': t.note,
             'id': t.id
-        } for t in transactions]
+        } for t in rows[:limit]],
+        'next_cursor': next_cursor
     }
 
 @app.route('/api/dashboard-data')
 @login_required
+@query_budget(1)
+@conditional_on_data_version
 def get_dashboard_data():
     date_range = request.args.get('range', 'month')
     start_date, end_date = get_date_range(date_range)
     return jsonify(get_filtered_data(start_date, end_date))
 
+@app.route('/api/transactions')
+@login_required
+@query_budget(1)
+def get_transactions():
+    date_range = request.args.get('range', 'month')
+    start_date, end_date = get_date_range(date_range)
+    limit = request.args.get('limit', app.config['TRANSACTIONS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_TRANSACTIONS_PAGE_SIZE']))
+    
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return jsonify(get_transactions_page(start_date, end_date, after, limit))
+
+@app.route('/api/transactions/export')
+@login_required
+def export_transactions_view():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    try:
+        start_date, end_date = (
+            datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+            for name in ('start_date', 'end_date')
+        )
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = f'transactions.{export_format}' + ('.gz' if compress else '')
+    
+    # Rows are streamed from the database as the response is written
+    chunks = export_transactions(current_user.id, export_format, start_date, end_date, compress=compress)
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/')
 @login_required
+@query_budget(2)
 def dashboard():
     date_range = request.args.get('range', 'month')
     start_date, end_date = get_date_range(date_range)
     data = get_filtered_data(start_date, end_date)
+    page = get_transactions_page(start_date, end_date, limit=app.config['TRANSACTIONS_PAGE_SIZE'])
     
     return render_template('dashboard.html',
-                         transactions=data['transactions'],
+                         transactions=page['transactions'],
+                         next_cursor=page['next_cursor'],
                          total_income=data['summary']['total_income'],
                          total_expense=data['summary']['total_expense'],
                          savings=data['summary']['savings'],
@@ -335,6 +668,7 @@ def register():
             verification_sent_at=datetime.utcnow()
         )
         db.session.add(user)
+        admin_cache.invalidate(ADMIN_STATS_KEY)
         db.session.commit()
         
         # Generate verification token and URL
@@ -407,35 +741,84 @@ def logout():
 @app.route('/add_transaction', methods=['POST'])
 @login_required
 def add_transaction():
-    amount = float(request.form.get('amount'))
+    try:
+        amount = float(request.form.get('amount', ''))
+    except ValueError:
+        amount = None
+    # float() also accepts 'nan' and 'inf', which would poison every running total the write feeds
+    if amount is None or not math.isfinite(amount):
+        flash(f"Invalid amount '{request.form.get('amount', '')}'")
+        return redirect(url_for('dashboard'))
     type = request.form.get('type')
+    if type not in ('income', 'expense'):
+        flash(f"Invalid type '{type or ''}'")
+        return redirect(url_for('dashboard'))
     category = request.form.get('category')
     note = request.form.get('note')
     date = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
     
-    # Auto-categorize if no category is provided
+    # Auto-categorize if no category is provided. A note the transformer
+    # hasn't seen yet is categorized in the background.
+    user_labelled = bool(category)
+    categorize_later = False
     if not category and note:
-        category = categorize_expense_nlp(note)
+        category = categorize_for_user(current_user.id, note, run_model=False)
+        categorize_later = category is None
+        category = category or 'Uncategorized'
     
     transaction = Transaction(
         amount=amount,
         type=type,
         category=category,
+        category_source='user' if user_labelled else 'auto',
         note=note,
         date=date,
         user_id=current_user.id
     )
     
     db.session.add(transaction)
+    User.bump_data_version(current_user.id)
+    forecast_states.apply(current_user.id, transaction, 1)
+    apply_transaction(transaction, 1)
+    record_transaction(transaction, 1)
+    admin_cache.invalidate(ADMIN_STATS_KEY)
+    log_activity(current_user.id, 'transaction_add', 
+                f'Added {type} transaction: {amount} in {category}', commit=False)
     db.session.commit()
     
-    log_activity(current_user.id, 'transaction_add', 
-                f'Added {type} transaction: {amount} in {category}')
-    update_daily_analytics()
+    if categorize_later:
+        categorize_transaction.delay(transaction.id)
+    # Only learn from categories the user chose, not from our own guesses
+    if user_labelled:
+        learn_category.delay(current_user.id, note, category)
     
     flash('Transaction added successfully!')
     return redirect(url_for('dashboard'))
 
+@app.route('/api/transactions/import', methods=['POST'])
+@login_required
+def import_transactions_view():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    user_id = current_user.id
+    def on_batch(count):
+        # One activity record per batch, not per row; it commits the invalidation too
+        admin_cache.invalidate(ADMIN_STATS_KEY)
+        log_activity(user_id, 'transaction_import', f'Imported {count} transactions')
+    
+    # Rows are parsed as the upload is read, never loaded whole. Bytes that
+    # aren't UTF-8 become U+FFFD instead of aborting the import midway.
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+    rows = parse_statement(stream, request.form.get('date_format', '%Y-%m-%d'))
+    # Rules and cache only in the request; each batch's misses are left
+    # Uncategorized and queued for the transformer
+    result = import_transactions(user_id, rows, lambda notes: categorize_many_for_user(user_id, notes, run_model=False),
+                                 on_batch=on_batch, batch_size=app.config['IMPORT_BATCH_SIZE'],
+                                 categorize_later=categorize_imported.delay)
+    return jsonify(result)
+
 @app.route('/delete_transaction/<int:id>')
 @login_required
 def delete_transaction(id):
@@ -445,12 +828,22 @@ def delete_transaction(id):
         return redirect(url_for('dashboard'))
     
     db.session.delete(transaction)
+    User.bump_data_version(current_user.id)
+    forecast_states.apply(current_user.id, transaction, -1)
+    apply_transaction(transaction, -1)
+    record_transaction(transaction, -1)
+    admin_cache.invalidate(ADMIN_STATS_KEY)
     db.session.commit()
     flash('Transaction deleted successfully!')
     return redirect(url_for('dashboard'))
 
+def precomputed_forecast_query(user_id, period):
+    return Forecast.query.filter_by(user_id=user_id, period=period)
+
 @app.route('/api/forecast')
 @login_required
+@query_budget(6)  # All-history model rebuilt and stored; 1 while the stored forecast is fresh
+@conditional_on_data_version
 def get_expense_forecast():
     # Get period from query parameters (default to 12 months)
     period = request.args.get('period', '12')
@@ -459,32 +852,228 @@ def get_expense_forecast():
     except ValueError:
         period = 12
 
-    # Get user's transaction history with period filter
-    query = Transaction.query.filter_by(user_id=current_user.id)
+    # If period is 0, get all data
+    cutoff_date = get_cutoff_date(period)
     
-    if period > 0:  # If period is 0, get all data
-        cutoff_date = datetime.now().date() - timedelta(days=period * 30)  # Approximate months
-        query = query.filter(Transaction.date >= cutoff_date)
+    # Serve the precomputed forecast while it matches the user's data
+    precomputed = precomputed_forecast_query(current_user.id, period).first()
+    fresh = precomputed is not None and precomputed.is_fresh(current_user.data_version, cutoff_date)
+    forecast_hits.record(fresh)
+    if fresh:
+        return jsonify({
+            'total_prediction': precomputed.total_prediction,
+            'category_predictions': precomputed.category_predictions
+        })
     
-    transactions = query.order_by(Transaction.date.asc()).all()
+    if period == 0:
+        # All-history model is kept up to date per transaction, no retraining
+        result = forecast_states.fit_predict(current_user.id, current_user.data_version)
+        store_forecast(current_user.id, period, current_user.data_version, cutoff_date, result)
+        db.session.commit()
+        return jsonify(result)
     
-    # Initialize forecaster
-    forecaster = ExpenseForecaster()
+    # Get user's monthly expense aggregates with period filter, computed in
+    # the database so the cost scales with months x categories, not rows
+    monthly = get_monthly_aggregates(current_user.id, cutoff_date)
+    result = ExpenseForecaster().fit_predict(monthly)
     
-    # Get predictions
-    next_month_prediction = forecaster.predict_next_month(transactions)
-    category_predictions = forecaster.get_category_predictions(transactions)
+    # Stored for the next request, until the user's data or the window changes
+    store_forecast(current_user.id, period, current_user.data_version, cutoff_date, result)
+    db.session.commit()
     
-    return jsonify({
-        'total_prediction': next_month_prediction,
-        'category_predictions': category_predictions
-    })
+    return jsonify(result)
 
 @app.route('/forecast')
 @login_required
 def forecast_dashboard():
     return render_template('forecast.html')
 
+@app.cli.command('recategorize')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per chunk/transaction')
+@click.option('--workers', default=None, type=int,
+              help='Categorization processes, needs CATEGORIZER_SOCKET above 1 (default: CPU count with it, 1 without)')
+@click.option('--dry-run', is_flag=True, help='Summarize changes per category without writing')
+@click.option('--checkpoint', default=os.path.join(app.instance_path, 'recategorize.checkpoint'),
+              show_default=True, help='Resume checkpoint file')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint')
+@click.option('--timeout', default=600.0, show_default=True, help='Seconds to wait for the model per chunk, 0 for no limit')
+def recategorize_command(chunk_size, workers, dry_run, checkpoint, restart, timeout):
+    """Re-categorize Uncategorized transactions with the current categorizer."""
+    try:
+        result = recategorize_transactions(chunk_size=chunk_size, workers=workers, dry_run=dry_run,
+                                           checkpoint_path=checkpoint, restart=restart,
+                                           timeout=timeout or None, report=click.echo,
+                                           invalidate=lambda: admin_cache.invalidate(ADMIN_STATS_KEY))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f"{'Would update' if dry_run else 'Updated'} "
+               f"{sum(result['changes'].values()) if dry_run else result['updated']} "
+               f"of {result['scanned']} rows in {result['elapsed']:.1f}s "
+               f"({result['rows_per_sec']:.0f} rows/sec)")
+    for category, count in result['changes'].items():
+        click.echo(f'  Uncategorized -> {category}: {count}')
+    if result['skipped_chunks']:
+        click.echo(f"The model was unavailable or timed out on {result['skipped_chunks']} chunks; "
+                   f"{result['skipped_rows']} rows the keyword rules can't place were left Uncategorized. "
+                   f"Run again to retry them.")
+
+@app.cli.command('evaluate-categorizer')
+@click.option('--email', required=True, help='Email of the user whose labels to score against')
+@click.option('--holdout', default=0.2, show_default=True, help='Fraction of the labelled history held out')
+def evaluate_categorizer_command(email, holdout):
+    """Compare the learned categorizer with zero-shot on a user's held-out labels."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f'No user with email {email}')
+    
+    # The offline comparison may wait as long as the model needs
+    result = evaluate_categorizer(user.id, lambda notes: predict_zero_shot(notes, timeout=None), holdout=holdout)
+    click.echo(f"Trained on {result['train_samples']} labels, scored {result['held_out']} "
+               f"held-out notes the keyword rules can't place")
+    for name in ('learned', 'zero_shot'):
+        score = result[name]
+        if score is None:
+            click.echo(f'  {name}: unavailable (no zero-shot model or categorization service)')
+        elif score['accuracy'] is None:
+            click.echo(f'  {name}: nothing to score')
+        else:
+            click.echo(f"  {name}: accuracy {score['accuracy']:.1%}, answered {score['coverage']:.1%} "
+                       f"({score['accuracy_answered'] or 0:.1%} correct), "
+                       f"latency p50 {score['latency_us_p50']:.0f} us, p99 {score['latency_us_p99']:.0f} us")
+
+@app.cli.command('import-transactions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', required=True, help='Email of the user to import for')
+@click.option('--date-format', default='%Y-%m-%d', show_default=True, help='strptime format of the date column')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per batch/transaction')
+def import_transactions_command(path, email, date_format, batch_size):
+    """Import a CSV bank statement for a user."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f'No user with email {email}')
+    
+    user_id = user.id
+    def on_batch(count):
+        admin_cache.invalidate(ADMIN_STATS_KEY)
+        log_activity(user_id, 'transaction_import', f'Imported {count} transactions')
+    
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+        result = import_transactions(user_id, parse_statement(f, date_format),
+                                     lambda notes: categorize_many_for_user(user_id, notes),
+                                     on_batch=on_batch, batch_size=batch_size, report=click.echo)
+    
+    for error in result['errors']:
+        click.echo(f"  line {error['line']}: {error['error']}")
+    click.echo(f"Imported {result['imported']} rows, rejected {result['rejected']}, "
+               f"in {result['elapsed']:.1f}s ({result['rows_per_sec']:.0f} rows/sec)")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--user-id', default=None, type=int, help='Only rebuild this user')
+def rebuild_rollups_command(user_id):
+    """Rebuild the monthly rollup table from raw transactions."""
+    rows = rebuild_rollups(user_id)
+    click.echo(f'Wrote {rows} rollup rows')
+
+@app.cli.command('check-rollups')
+@click.option('--user-id', default=None, type=int, help='Only check this user')
+def check_rollups_command(user_id):
+    """Diff the monthly rollup table against raw transactions."""
+    mismatches = check_rollups(user_id)
+    for mismatch in mismatches:
+        click.echo(f"  user {mismatch['user_id']} {mismatch['month']} {mismatch['type']}/{mismatch['category']}: "
+                   f"rollup {mismatch['rollup']}, raw {mismatch['raw']}")
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} rollup rows differ from raw transactions, '
+                                   f'run `flask rebuild-rollups` to fix')
+    click.echo('Rollup is consistent with raw transactions')
+
+def hot_queries():
+    # What the hot paths execute, from their own builders with representative arguments
+    today = datetime.now().date()
+    month_start = today.replace(day=1)
+    activity_after = (datetime(2024, 1, 1), 100)
+    whole_months, first_edge_month, last_edge_month = rollup_row_queries(1, date(2024, 1, 15), date(2024, 12, 15))
+    return {
+        'transactions page': transactions_page_query(1, month_start, today, (today, 100)),
+        'transaction export': export_query(1),
+        'rollup months': whole_months,
+        'rollup first edge month': first_edge_month,
+        'rollup last edge month': last_edge_month,
+        'forecast lookup': precomputed_forecast_query(1, 12),
+        'forecast month extrema': extrema_query(1, '2024-03', 'Housing'),
+        'daily analytics row': analytics_row_query(today),
+        'daily transactions': day_totals_query(today),
+        'daily active users': active_users_query(today),
+        'most common category': most_common_category_query(today),
+        'recent activities': recent_activities_query(),
+        'suspicious activities': suspicious_activities_query(),
+        'user stats': user_stats_query(),
+        'category stats': category_stats_query(),
+        'admin users': admin_users_query(),
+        'analytics trend': analytics_trend_query(),
+        'activity log page': activity_page_query({}, activity_after),
+        'activity log by user': activity_page_query({'user_id': 1}, activity_after),
+        'activity log by type': activity_page_query({'activity_type': 'login_failed'}, activity_after),
+        'activity log by ip': activity_page_query({'ip_address': '127.0.0.1'}, activity_after),
+        'activity log suspicious': activity_page_query({'is_suspicious': True}, activity_after),
+        'job claim': due_job_query(datetime.utcnow()),
+    }
+
+# Expected scans: reports on every row of a table, and newest-first index
+# walks that stop at their LIMIT
+HOT_QUERY_ALLOWED_SCANS = {
+    'user stats': {'user'},
+    'category stats': {'transaction'},
+    'admin users': {'user', 'monthly_rollup'},
+    'recent activities': {'user_activity'},
+    'analytics trend': {'analytics'},
+}
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot query's plan regresses to a full table scan."""
+    regressions = 0
+    for name, result in check_query_plans(hot_queries(), HOT_QUERY_ALLOWED_SCANS).items():
+        status = f"FULL SCAN of {', '.join(result['full_scans'])}" if result['full_scans'] else 'ok'
+        click.echo(f'{name}: {status}')
+        for line in result['plan']:
+            click.echo(f'    {line}')
+        regressions += bool(result['full_scans'])
+    if regressions:
+        raise click.ClickException(f'{regressions} hot queries do a full table scan')
+
+@app.cli.command('run-jobs')
+@click.option('--limit', default=None, type=int, help='Stop after this many jobs')
+def run_jobs_command(limit):
+    """Run queued background jobs in this process until none are due."""
+    count = run_pending_jobs(lease_seconds=app.config['JOB_LEASE_SECONDS'], limit=limit)
+    click.echo(f'Ran {count} jobs')
+    metrics = job_metrics()
+    click.echo(f"{metrics['due']} due, {metrics['scheduled']} scheduled for retry, "
+               f"{metrics['by_status']['failed']} failed")
+
+@app.cli.command('refresh-analytics')
+@click.option('--date', 'day', default=None, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Day to recompute (default: today)')
+def refresh_analytics_command(day):
+    """Recompute a day's analytics, including total and active users."""
+    refresh_daily_analytics(day.date() if day else None)
+    click.echo('Analytics refreshed')
+
+@app.cli.command('forecast-all')
+@click.option('--period', default=12, show_default=True, help='History window in months, 0 for all data')
+@click.option('--workers', default=None, type=int, help='Forecasting processes (default: CPU count)')
+@click.option('--chunk-size', default=200, show_default=True, help='Users per chunk/transaction')
+def forecast_all_command(period, workers, chunk_size):
+    """Precompute next-month forecasts for every active user."""
+    result = forecast_all_users(period=period, workers=workers, chunk_size=chunk_size, report=click.echo)
+    
+    click.echo(f"Forecast {result['users']} users in {result['elapsed']:.1f}s "
+               f"({result['users_per_sec']:.1f} users/sec)")
+    if result['users']:
+        click.echo(f"Per-user compute time: p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
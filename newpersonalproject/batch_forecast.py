@@ -0,0 +1,218 @@
+"""
+Offline batch forecasting.
+
+Forecasting is CPU-bound pandas/scikit-learn work, so instead of doing it
+inside the /api/forecast request, next-month forecasts for every active
+user are precomputed and stored in the Forecast table.
+
+`flask forecast-all` runs a whole sweep across a process pool. The
+database work (aggregate queries and writes) stays in the parent process;
+workers only run the forecaster. Inside the web app the sweep is a chain
+of forecast_users_job background jobs instead, one chunk of users each,
+so it runs once per interval however many processes serve the app and
+never forks a pool from a threaded web process.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import Forecast, Job, Transaction, User
+from expense_forecaster import ExpenseForecaster, get_monthly_aggregates
+from jobs import background_task, enqueue
+
+def get_cutoff_date(period: int):
+    """
+    Get the start of the forecast history window.
+    
+    Args:
+        period: History window in months, 0 for all data
+    
+    Returns:
+        The cutoff date, or None for all data
+    """
+    if period > 0:
+        return datetime.now().date() - timedelta(days=period * 30)  # Approximate months
+    return None
+
+def store_forecast(user_id: int, period: int, data_version: int, cutoff_date, result: Dict):
+    """
+    Insert or replace the stored forecast for a user and period.
+    
+    Args:
+        user_id: ID of the user
+        period: History window in months
+        data_version: User.data_version the forecast was computed from
+        cutoff_date: Start of the history window it was computed on
+        result: Output of ExpenseForecaster.fit_predict
+    """
+    stmt = insert(Forecast).values(
+        user_id=user_id,
+        period=period,
+        cutoff_date=cutoff_date,
+        data_version=data_version,
+        total_prediction=result['total_prediction'],
+        category_predictions=result['category_predictions'],
+        computed_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Forecast.user_id, Forecast.period],
+        set_={
+            'cutoff_date': stmt.excluded.cutoff_date,
+            'data_version': stmt.excluded.data_version,
+            'total_prediction': stmt.excluded.total_prediction,
+            'category_predictions': stmt.excluded.category_predictions,
+            'computed_at': stmt.excluded.computed_at,
+        }
+    )
+    db.session.execute(stmt)
+
+class ForecastHitCounter:
+    """Counts /api/forecast requests answered from the Forecast table, per process"""
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def record(self, hit: bool):
+        """
+        Count one forecast request.
+        
+        Args:
+            hit: True if a fresh stored forecast was served, False if it was recomputed
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters for monitoring.
+        
+        Returns:
+            Dict of hits, misses and hit rate
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+            }
+
+def _forecast_user(job: Tuple[int, int, pd.DataFrame]) -> Tuple[int, int, Dict, float]:
+    user_id, data_version, monthly = job
+    started = time.perf_counter()
+    result = ExpenseForecaster().fit_predict(monthly)
+    return user_id, data_version, result, time.perf_counter() - started
+
+def _active_users_query(after_user_id: int = 0):
+    # Users with transactions, in id order from after_user_id on
+    return db.session.query(User.id, User.data_version).filter(
+        User.id > after_user_id,
+        User.id.in_(db.session.query(Transaction.user_id).distinct())
+    ).order_by(User.id)
+
+def _forecast_chunk(users: List[Tuple[int, int]], period: int, cutoff_date, pool=None) -> List[float]:
+    # Forecast and store one chunk of (user_id, data_version) in one
+    # transaction, returning the per-user compute times. The versions were
+    # read before the data, so a concurrent write can only make the stored
+    # forecast look stale, never falsely fresh.
+    jobs = [(user_id, data_version, get_monthly_aggregates(user_id, cutoff_date)) for user_id, data_version in users]
+    results = pool.map(_forecast_user, jobs) if pool else [_forecast_user(job) for job in jobs]
+    
+    durations = []
+    for user_id, data_version, result, duration in results:
+        store_forecast(user_id, period, data_version, cutoff_date, result)
+        durations.append(duration)
+    db.session.commit()
+    return durations
+
+def forecast_all_users(period: int = 12, workers: Optional[int] = None, chunk_size: int = 200,
+                       report: Callable[[str], None] = print) -> Dict:
+    """
+    Precompute forecasts for every user with transactions. Must run in an app context.
+    
+    Forks a process pool, so run it from the CLI rather than a web process.
+    
+    Args:
+        period: History window in months, 0 for all data
+        workers: Forecasting processes, defaults to the CPU count
+        chunk_size: Users loaded, forecast and committed together
+        report: Callback receiving progress lines
+    
+    Returns:
+        Dict with users forecast, elapsed seconds, users/sec and per-user compute times
+    """
+    workers = workers or os.cpu_count() or 1
+    cutoff_date = get_cutoff_date(period)
+    active_users = _active_users_query().all()
+    
+    durations = []
+    started = time.monotonic()
+    pool = Pool(workers) if workers > 1 else None
+    
+    try:
+        for start in range(0, len(active_users), chunk_size):
+            durations += _forecast_chunk(active_users[start:start + chunk_size], period, cutoff_date, pool)
+            
+            elapsed = time.monotonic() - started
+            report(f'{len(durations)}/{len(active_users)} users, {len(durations) / elapsed:.1f} users/sec')
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    
+    elapsed = time.monotonic() - started
+    return {
+        'users': len(durations),
+        'elapsed': elapsed,
+        'users_per_sec': len(durations) / elapsed if elapsed else 0,
+        'p50_ms': float(np.percentile(durations, 50)) * 1000 if durations else None,
+        'p99_ms': float(np.percentile(durations, 99)) * 1000 if durations else None,
+    }
+
+@background_task(max_attempts=3)
+def forecast_users_job(interval_hours: float, period: int, after_user_id: int = 0, chunk_size: int = 200):
+    """Precompute forecasts for the next chunk of users and queue the rest of the sweep, or the next sweep"""
+    users = _active_users_query(after_user_id).limit(chunk_size).all()
+    # Queued first, so a failure of this chunk doesn't stop the chain
+    if len(users) == chunk_size:
+        schedule_forecasts(interval_hours, period, after_user_id=users[-1].id, chunk_size=chunk_size)
+    else:
+        schedule_forecasts(interval_hours, period, chunk_size=chunk_size)
+    _forecast_chunk(users, period, get_cutoff_date(period))
+
+def schedule_forecasts(interval_hours: float, period: int = 12, after_user_id: int = 0,
+                       chunk_size: int = 200) -> Optional[Job]:
+    """
+    Queue a forecast sweep one interval from now, unless a forecast job is already queued.
+    
+    Each job forecasts one chunk of users in the worker that runs it and
+    queues the next chunk to run right away; the last chunk queues the
+    next sweep. Like schedule_analytics_refresh, chains queued by
+    processes starting together merge at their next job.
+    
+    Args:
+        interval_hours: Hours between sweeps
+        period: History window in months, 0 for all data
+        after_user_id: Continue a sweep after this user, now rather than in an interval
+        chunk_size: Users forecast per job
+    
+    Returns:
+        The queued job, or None if a forecast job was already queued
+    """
+    if Job.query.filter_by(type=forecast_users_job.name, status='pending').first() is not None:
+        return None
+    run_at = datetime.utcnow() + (timedelta(0) if after_user_id else timedelta(hours=interval_hours))
+    return enqueue(forecast_users_job.name, [interval_hours, period, after_user_id, chunk_size],
+                   run_at=run_at, max_attempts=forecast_users_job.max_attempts)
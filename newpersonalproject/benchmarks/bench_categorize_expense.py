@@ -0,0 +1,59 @@
+"""
+Notes/sec of the keyword rules: the original per-keyword substring loop,
+categorize_expense and the memoizing categorize_expenses batch API.
+
+    python benchmarks/bench_categorize_expense.py [--notes 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_categorizer import CATEGORY_KEYWORDS, categorize_expense, categorize_expenses
+
+def keyword_loop(note):
+    # categorize_expense before the keywords were precompiled
+    if not note:
+        return 'Uncategorized'
+    note = note.lower().strip()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in note for keyword in keywords):
+            return category
+    return 'Uncategorized'
+
+def make_notes(count, keyword_share=0.6, distinct=5000, seed=0):
+    # Statement-like notes: a limited vocabulary of merchants, repeated
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in CATEGORY_KEYWORDS.values() for keyword in keywords]
+    fillers = ['payment', 'ref', 'txn', 'online', 'pos', 'upi', 'card', 'debit', 'ltd', 'inc']
+    vocabulary = []
+    for _ in range(distinct):
+        words = rng.sample(fillers, 3) + [str(rng.randrange(10000))]
+        if rng.random() < keyword_share:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords).upper())
+        vocabulary.append(' '.join(words))
+    return [rng.choice(vocabulary) for _ in range(count)]
+
+def timed(name, fn, notes):
+    start = time.perf_counter()
+    result = fn(notes)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<22}{len(notes) / elapsed:>12,.0f} notes/s')
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--notes', type=int, default=1000000)
+    args = parser.parse_args()
+    
+    notes = make_notes(args.notes)
+    before = timed('before', lambda notes: [keyword_loop(note) for note in notes], notes)
+    single = timed('categorize_expense', lambda notes: [categorize_expense(note) for note in notes], notes)
+    batch = timed('categorize_expenses', categorize_expenses, notes)
+    assert before == single == batch, 'outputs differ'
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Per-write cost of the incremental daily analytics as the day's volume
+grows, next to a full recompute of the day (refresh_daily_analytics,
+what every write used to run).
+
+Runs against a scratch SQLite file, never the app's database.
+
+    python benchmarks/bench_daily_analytics.py [--sizes 1000 10000 100000] [--writes 50]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix='bench-analytics-')
+# Read by app.py at import
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(SCRATCH, 'bench.db')}"
+os.environ['JOB_WORKERS'] = '0'
+os.environ['ANALYTICS_REFRESH_MINUTES'] = '0'
+
+from sqlalchemy import insert
+
+from app import app
+from daily_analytics import record_transaction, refresh_daily_analytics
+from extensions import db
+from models import Transaction, User
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Entertainment',
+              'Bills & Utilities', 'Health & Wellness', 'Housing']
+
+def seed_today(user_id, count, rng):
+    # Bulk rows dated today, as the day's volume from every user
+    today = datetime.now().date()
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'amount': round(rng.uniform(1, 500), 2), 'date': today, 'created_at': now,
+             'type': 'income' if rng.random() < 0.1 else 'expense', 'category': rng.choice(CATEGORIES),
+             'category_source': 'user', 'note': 'seeded'} for _ in range(count)]
+    for start in range(0, len(rows), 10000):
+        db.session.execute(insert(Transaction), rows[start:start + 10000])
+    db.session.commit()
+
+def time_writes(user_id, writes, rng):
+    # What add_transaction does for analytics: the row, its increments, one commit
+    durations = []
+    for _ in range(writes):
+        started = time.perf_counter()
+        transaction = Transaction(user_id=user_id, amount=round(rng.uniform(1, 500), 2), type='expense',
+                                  category=rng.choice(CATEGORIES), note='timed', date=datetime.now().date())
+        db.session.add(transaction)
+        record_transaction(transaction, 1)
+        db.session.commit()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+def time_recompute(repeats=3):
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        refresh_daily_analytics()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--writes', type=int, default=50)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    with app.app_context():
+        db.create_all()
+        user = User(name='bench', email='bench@example.com', password_hash='x', is_verified=True)
+        db.session.add(user)
+        db.session.commit()
+        
+        print(f"{'rows today':>12}{'incremental write':>20}{'full recompute':>18}")
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed_today(user.id, size - seeded, rng)
+            seeded = size
+            refresh_daily_analytics()
+            print(f'{size:>12}{time_writes(user.id, args.writes, rng):>17.2f} ms{time_recompute():>15.1f} ms')
+            seeded += args.writes
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
@@ -0,0 +1,84 @@
+"""
+Time ExpenseForecaster.prepare_features against the original row-by-row
+loop on years of daily transactions, and check both give the same frame.
+
+    python benchmarks/bench_prepare_features.py [--years 10] [--per-day 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_forecaster import ExpenseForecaster
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Entertainment',
+              'Bills & Utilities', 'Health & Wellness', 'Housing']
+
+def row_by_row_features(transactions):
+    # prepare_features before it was vectorized
+    df = pd.DataFrame([{'amount': t.amount, 'type': t.type, 'category': t.category, 'date': t.date}
+                       for t in transactions])
+    df = df[df['type'] == 'expense']
+    
+    monthly_data = []
+    unique_months = sorted(df['date'].dt.to_period('M').unique())
+    for month in unique_months:
+        month_df = df[df['date'].dt.to_period('M') == month]
+        features = {
+            'month_num': month.month,
+            'total_transactions': len(month_df),
+            'avg_transaction': month_df['amount'].mean(),
+            'max_transaction': month_df['amount'].max(),
+            'min_transaction': month_df['amount'].min(),
+        }
+        for category in df['category'].unique():
+            cat_total = month_df[month_df['category'] == category]['amount'].sum()
+            features[f'cat_{category.lower().replace(" & ", "_")}'] = cat_total
+        features['total_expenses'] = month_df['amount'].sum()
+        monthly_data.append(features)
+    
+    monthly_df = pd.DataFrame(monthly_data)
+    return monthly_df.drop('total_expenses', axis=1), monthly_df['total_expenses']
+
+def make_transactions(years, per_day, seed=0):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    transactions = []
+    for day in range(365 * years):
+        # Timestamps, which the original loop's .dt access needed
+        when = pd.Timestamp(start + timedelta(days=day))
+        for _ in range(per_day):
+            transactions.append(SimpleNamespace(amount=round(rng.uniform(1, 500), 2),
+                                                type='income' if rng.random() < 0.1 else 'expense',
+                                                category=rng.choice(CATEGORIES), date=when))
+    return transactions
+
+def timed(name, fn, transactions):
+    start = time.perf_counter()
+    result = fn(transactions)
+    print(f'{name:<20}{time.perf_counter() - start:>8.2f} s')
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--per-day', type=int, default=50)
+    args = parser.parse_args()
+    
+    transactions = make_transactions(args.years, args.per_day)
+    print(f'{len(transactions)} transactions')
+    expected_X, expected_y = timed('row by row', row_by_row_features, transactions)
+    X, y = timed('prepare_features', ExpenseForecaster().prepare_features, transactions)
+    pd.testing.assert_frame_equal(X, expected_X)
+    pd.testing.assert_series_equal(y, expected_y)
+    print('Output identical')
+
+if __name__ == '__main__':
+    main()
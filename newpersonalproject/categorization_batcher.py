@@ -0,0 +1,168 @@
+"""
+Dynamic micro-batching for zero-shot categorization.
+
+Zero-shot inference is far cheaper per note when notes are classified
+together, so concurrent callers are queued and flushed to the model as one
+batch once either max_batch_size notes are waiting or the oldest one has
+waited max_wait_ms.
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+class _PendingItem:
+    __slots__ = ('item', 'enqueued_at', 'done', 'result', 'error', 'cancelled')
+    
+    def __init__(self, item):
+        self.item = item
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class MicroBatcher:
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32, max_wait_ms: float = 10.0,
+                 wait_sample_size: int = 10000):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._waits = deque(maxlen=wait_sample_size)
+        self._items = 0
+    
+    def submit(self, item, timeout: Optional[float] = None):
+        """
+        Queue one item and wait for its result.
+        
+        Args:
+            item: The item to process
+            timeout: Seconds to wait for the result, forever if None
+            
+        Returns:
+            The result for the item
+        """
+        return self.submit_many([item], timeout)[0]
+    
+    def submit_many(self, items: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Queue several items and wait for all of their results.
+        
+        Args:
+            items: The items to process
+            timeout: Seconds to wait for the results, forever if None
+            
+        Returns:
+            The results, in the same order as the items
+            
+        Raises:
+            TimeoutError: If the results are not ready within the timeout
+        """
+        self._ensure_worker()
+        pending = [_PendingItem(item) for item in items]
+        for p in pending:
+            self._queue.put(p)
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for p in pending:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not p.done.wait(remaining):
+                # Nobody will read the rest, don't spend the model on them
+                for abandoned in pending:
+                    abandoned.cancelled = True
+                raise TimeoutError('Timed out waiting for batched categorization')
+            if p.error is not None:
+                raise p.error
+        return [p.result for p in pending]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue and batching metrics for tuning the batch window.
+        
+        Returns:
+            Dict with queue depth, batch size histogram and wait percentiles
+        """
+        with self._metrics_lock:
+            waits = sorted(self._waits)
+            histogram = dict(sorted(self._batch_sizes.items()))
+            items = self._items
+        
+        p50 = _percentile(waits, 50)
+        p99 = _percentile(waits, 99)
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': sum(histogram.values()),
+            'items': items,
+            'batch_size_histogram': histogram,
+            'wait_ms_p50': round(p50 * 1000, 3) if p50 is not None else None,
+            'wait_ms_p99': round(p99 * 1000, 3) if p99 is not None else None,
+        }
+    
+    def _ensure_worker(self):
+        # Restart the worker after a fork, threads do not survive into the child
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='categorization-batcher', daemon=True)
+                self._worker.start()
+    
+    def _collect_batch(self) -> List[_PendingItem]:
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Window closed, but take anything already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = [p for p in self._collect_batch() if not p.cancelled]
+            if not batch:
+                continue
+            started = time.monotonic()
+            
+            try:
+                results = self.process_batch([p.item for p in batch])
+                if len(results) != len(batch):
+                    raise ValueError('Batch processor returned a mismatched number of results')
+                for p, result in zip(batch, results):
+                    p.result = result
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            
+            with self._metrics_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._items += len(batch)
+                self._waits.extend(started - p.enqueued_at for p in batch)
+            
+            for p in batch:
+                p.done.set()
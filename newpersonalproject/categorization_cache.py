@@ -0,0 +1,284 @@
+"""
+Two-tier cache for expense note categorization.
+
+Users type the same notes over and over, so categorizations are kept in a
+bounded in-process LRU backed by the category_cache table, which survives
+restarts and is shared by all workers. Rows are tagged with the
+CATEGORY_KEYWORDS version they were produced under and ignored once the
+keyword rules change.
+"""
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import CategoryCache
+from expense_categorizer import (CATEGORY_KEYWORDS_VERSION, categorize_expense_nlp, categorize_expense_strict,
+                                 categorize_expenses_nlp)
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_note(note: str) -> str:
+    """
+    Normalize a note so trivially different spellings share a cache entry.
+    
+    Args:
+        note: The expense note/description
+        
+    Returns:
+        The lowercased note with whitespace collapsed
+    """
+    return _WHITESPACE.sub(' ', note.lower()).strip()[:200]
+
+class CategorizationCache:
+    def __init__(self, max_size: int = 10000,
+                 categorize: Callable[[str], str] = categorize_expense_nlp,
+                 version: str = CATEGORY_KEYWORDS_VERSION,
+                 categorize_batch: Callable[[Iterable[str]], List[str]] = categorize_expenses_nlp,
+                 categorize_strict: Callable[[str], str] = categorize_expense_strict,
+                 touch_seconds: float = 86400):
+        self.max_size = max_size
+        self.touch_seconds = touch_seconds
+        self.categorize_note = categorize
+        self.categorize_note_strict = categorize_strict
+        self.categorize_notes = categorize_batch
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+    
+    def categorize(self, note: str, strict: bool = False) -> str:
+        """
+        Categorize a note, consulting the memory and database tiers first.
+        
+        Args:
+            note: The expense note/description
+            strict: On a miss, raise instead of returning 'Uncategorized'
+                when the model is unavailable
+            
+        Returns:
+            The predicted category
+            
+        Raises:
+            CategorizerUnavailable: With strict, if the model is needed and unavailable
+        """
+        if not note:
+            return 'Uncategorized'
+        
+        key = normalize_note(note)
+        if not key:
+            return 'Uncategorized'
+        
+        category = self._get_memory(key)
+        if category is not None:
+            return category
+        
+        category = self._get_db(key)
+        if category is not None:
+            self._put_memory(key, category)
+            return category
+        
+        with self._lock:
+            self.misses += 1
+        category = (self.categorize_note_strict if strict else self.categorize_note)(note)
+        
+        # 'Uncategorized' may just mean the NLP service was unavailable, so
+        # don't pin it; the next request gets another chance
+        if category != 'Uncategorized':
+            self._put_db(key, category)
+            self._put_memory(key, category)
+        return category
+    
+    def lookup(self, note: str) -> Optional[str]:
+        """
+        Look a note up in the memory and database tiers without running the model.
+        
+        Args:
+            note: The expense note/description
+            
+        Returns:
+            The cached category, or None on a miss
+        """
+        key = normalize_note(note) if note else ''
+        if not key:
+            return None
+        
+        category = self._get_memory(key)
+        if category is None:
+            category = self._get_db(key)
+            if category is not None:
+                self._put_memory(key, category)
+        return category
+    
+    def lookup_many(self, notes: Iterable[str]) -> List[Optional[str]]:
+        """
+        Look many notes up with one database query, without running the model.
+        
+        Args:
+            notes: Iterable of expense notes/descriptions
+            
+        Returns:
+            List of cached categories, None for misses, in the same order as the notes
+        """
+        keys = [normalize_note(note) if note else '' for note in notes]
+        found = self._lookup_keys(keys)
+        return [found.get(key) for key in keys]
+    
+    def categorize_many(self, notes: Iterable[str]) -> List[str]:
+        """
+        Categorize many notes with one database lookup and one batched model call for the misses.
+        
+        Args:
+            notes: Iterable of expense notes/descriptions
+            
+        Returns:
+            List of predicted categories, in the same order as the notes
+        """
+        keys = [normalize_note(note) if note else '' for note in notes]
+        found = self._lookup_keys(keys)
+        
+        # The normalized key stands in for the note; it categorizes the same way
+        pending = [key for key in dict.fromkeys(keys) if key and key not in found]
+        if pending:
+            with self._lock:
+                self.misses += len(pending)
+            categories = self.categorize_notes(pending)
+            for key, category in zip(pending, categories):
+                found[key] = category
+                if category != 'Uncategorized':
+                    self._put_db(key, category, commit=False)
+                    self._put_memory(key, category)
+            db.session.commit()
+        
+        return [found.get(key, 'Uncategorized') for key in keys]
+    
+    def purge_stale(self) -> int:
+        """
+        Delete database entries made under an older CATEGORY_KEYWORDS version.
+        
+        Returns:
+            Number of rows deleted
+        """
+        deleted = CategoryCache.query.filter(
+            CategoryCache.keywords_version != self.version
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+    
+    def clear(self):
+        """Drop the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters for monitoring.
+        
+        Returns:
+            Dict of per-tier hits, misses, hit rate and memory tier size
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else None,
+                'memory_size': len(self._entries),
+                'max_size': self.max_size,
+                'keywords_version': self.version,
+            }
+    
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            category = self._entries.get(key)
+            if category is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return category
+    
+    def _put_memory(self, key: str, category: str):
+        with self._lock:
+            self._entries[key] = category
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def _get_db(self, key: str) -> Optional[str]:
+        entry = CategoryCache.query.filter_by(
+            normalized_note=key, keywords_version=self.version
+        ).first()
+        if entry is None:
+            return None
+        
+        self._touch([entry])
+        with self._lock:
+            self.db_hits += 1
+        return entry.category
+    
+    def _lookup_keys(self, keys: List[str]) -> Dict[str, str]:
+        # Categories of the cached keys: memory tier first, then one IN query
+        found = {}
+        for key in set(keys):
+            if key:
+                category = self._get_memory(key)
+                if category is not None:
+                    found[key] = category
+        
+        pending = [key for key in dict.fromkeys(keys) if key and key not in found]
+        if pending:
+            entries = CategoryCache.query.filter(
+                CategoryCache.normalized_note.in_(pending),
+                CategoryCache.keywords_version == self.version
+            ).all()
+            self._touch(entries)
+            for entry in entries:
+                found[entry.normalized_note] = entry.category
+                self._put_memory(entry.normalized_note, entry.category)
+            with self._lock:
+                self.db_hits += len(entries)
+        return found
+    
+    def _touch(self, entries: List[CategoryCache]):
+        # Hit counts track the shared tier; in-process hits are only in stats().
+        # An entry is only touched once per touch interval, so most hits stay
+        # reads and don't take SQLite's write lock from transaction writes.
+        touched_before = datetime.utcnow() - timedelta(seconds=self.touch_seconds)
+        stale = [entry.id for entry in entries if entry.last_hit_at is None or entry.last_hit_at < touched_before]
+        if not stale:
+            return
+        
+        CategoryCache.query.filter(CategoryCache.id.in_(stale)).update({
+            CategoryCache.hit_count: CategoryCache.hit_count + 1,
+            CategoryCache.last_hit_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    def _put_db(self, key: str, category: str, commit: bool = True):
+        # Another worker may have cached the same note meanwhile, and rows
+        # from an older keyword version are simply overwritten
+        stmt = insert(CategoryCache).values(
+            normalized_note=key,
+            category=category,
+            keywords_version=self.version,
+            hit_count=0,
+            created_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CategoryCache.normalized_note],
+            set_={
+                'category': stmt.excluded.category,
+                'keywords_version': stmt.excluded.keywords_version,
+                'hit_count': 0,
+                'created_at': stmt.excluded.created_at,
+            }
+        )
+        db.session.execute(stmt)
+        if commit:
+            db.session.commit()
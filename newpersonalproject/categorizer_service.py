@@ -0,0 +1,148 @@
+"""
+Shared zero-shot categorization service.
+
+Loading the transformer in every web worker costs gigabytes of memory and
+a slow boot per worker. Instead, run one long-lived process per host that
+owns the model:
+
+    python categorizer_service.py --socket /tmp/finance-categorizer.sock
+
+and start the web workers with CATEGORIZER_SOCKET pointing at the same path.
+Requests and responses are newline-delimited JSON over a Unix domain socket.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+from typing import Dict, List
+
+from categorization_batcher import MicroBatcher
+
+DEFAULT_SOCKET = '/tmp/finance-categorizer.sock'
+
+logger = logging.getLogger(__name__)
+
+def request_categories(notes: List[str], socket_path: str, timeout: float) -> List[str]:
+    """
+    Ask the categorization service to categorize notes.
+    
+    Args:
+        notes: The expense notes/descriptions
+        socket_path: Path of the service's Unix domain socket
+        timeout: Seconds to wait for connecting and for the response
+        
+    Returns:
+        The predicted category for each note
+        
+    Raises:
+        OSError: If the service is unreachable or times out
+        ValueError: If the service returns an invalid response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'notes': notes}).encode() + b'\n')
+        with sock.makefile('rb') as stream:
+            line = stream.readline()
+    
+    response = json.loads(line)
+    if 'error' in response:
+        raise ValueError(response['error'])
+    
+    categories = response['categories']
+    if len(categories) != len(notes):
+        raise ValueError('Categorization service returned a mismatched response')
+    return categories
+
+def request_stats(socket_path: str, timeout: float) -> Dict:
+    """
+    Fetch the service's micro-batching metrics.
+    
+    Args:
+        socket_path: Path of the service's Unix domain socket
+        timeout: Seconds to wait for connecting and for the response
+        
+    Returns:
+        Dict of queue/batch metrics
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'stats': True}).encode() + b'\n')
+        with sock.makefile('rb') as stream:
+            line = stream.readline()
+    return json.loads(line)['stats']
+
+class CategorizationRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                if message.get('stats'):
+                    response = {'stats': self.server.batcher.stats()}
+                else:
+                    response = {'categories': self.server.batcher.submit_many(message['notes'])}
+            except Exception as e:
+                response = {'error': str(e)}
+            try:
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting and fell back to the rules
+                logger.debug('Client disconnected before its response was written')
+                return
+
+class CategorizationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every web worker thread may connect at once
+    request_queue_size = 128
+    
+    def __init__(self, socket_path: str, batcher: MicroBatcher):
+        # Remove a stale socket left behind by a previous run
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, CategorizationRequestHandler)
+        self.socket_path = socket_path
+        # Requests from all workers share one queue, so the model sees
+        # batches and is only ever called from the batcher thread
+        self.batcher = batcher
+    
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def create_server(socket_path: str, classifier=None) -> CategorizationServer:
+    """
+    Create a categorization server around a zero-shot classifier.
+    
+    Args:
+        socket_path: Path to bind the Unix domain socket to
+        classifier: Zero-shot classifier to serve, loaded from transformers if omitted
+        
+    Returns:
+        The bound, not yet serving, server
+    """
+    from expense_categorizer import create_batcher, get_classifier
+    
+    if classifier is None:
+        classifier = get_classifier()
+        if classifier is None:
+            raise RuntimeError('transformers is not installed')
+    
+    return CategorizationServer(socket_path, create_batcher(classifier))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve zero-shot expense categorization over a Unix socket')
+    parser.add_argument('--socket', default=os.environ.get('CATEGORIZER_SOCKET', DEFAULT_SOCKET))
+    args = parser.parse_args()
+    
+    server = create_server(args.socket)
+    print(f"Categorization service listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,186 @@
+"""
+Incrementally maintained daily analytics.
+
+Transaction writes adjust today's Analytics counters and per-category
+tallies with atomic UPDATE ... SET x = x + ? statements in the writer's
+own database transaction, so their cost does not grow with the day's
+platform volume. The counts that need a scan (total users, distinct active
+users) and a full reconciliation of the counters are left to
+refresh_daily_analytics, run periodically as a background job.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from jobs import background_task, enqueue
+from models import Analytics, AnalyticsCategory, Job, Transaction, User, UserActivity
+
+def analytics_row_query(day):
+    """Build the query for a day's Analytics row id"""
+    return db.session.query(Analytics.id).filter_by(date=day)
+
+def most_common_category_query(day):
+    """Build the query for a day's most used category, from its per-category tallies"""
+    return db.session.query(AnalyticsCategory.category).filter(
+        AnalyticsCategory.date == day, AnalyticsCategory.count > 0
+    ).order_by(AnalyticsCategory.count.desc(), AnalyticsCategory.category).limit(1)
+
+def active_users_query(day):
+    """Build the query counting distinct users with activity on a day"""
+    day_start = datetime.combine(day, datetime.min.time())
+    return db.session.query(func.count(func.distinct(UserActivity.user_id))).filter(
+        UserActivity.timestamp >= day_start,
+        UserActivity.timestamp < day_start + timedelta(days=1)
+    )
+
+def day_totals_query(day):
+    """Build the query for a day's transaction count and sum per type and category"""
+    return db.session.query(
+        Transaction.type, Transaction.category, func.count(Transaction.id), func.sum(Transaction.amount)
+    ).filter(Transaction.date == day).group_by(Transaction.type, Transaction.category)
+
+def _ensure_row(day):
+    # Existence check first, so the user count only runs once a day
+    if analytics_row_query(day).first() is None:
+        db.session.execute(insert(Analytics).values(
+            date=day,
+            total_users=User.query.count(),
+            active_users=0,
+            total_transactions=0,
+            total_income=0,
+            total_expense=0,
+            avg_transaction_amount=0,
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[Analytics.date]))
+
+def record_transactions(rows: Iterable[Tuple], sign: int = 1):
+    """
+    Add transactions to (or, with sign -1, remove them from) today's analytics.
+    
+    Runs in the caller's database transaction. Only transactions dated
+    today count, like the full recompute.
+    
+    Args:
+        rows: (date, type, category, amount) tuples
+        sign: 1 for added transactions, -1 for deleted ones
+    """
+    today = datetime.now().date()
+    count = income = expense = 0
+    categories = Counter()
+    for date, type, category, amount in rows:
+        if date != today:
+            continue
+        count += 1
+        income += amount if type == 'income' else 0
+        expense += amount if type == 'expense' else 0
+        categories[category] += 1
+    if not count:
+        return
+    
+    _ensure_row(today)
+    count, income, expense = sign * count, sign * income, sign * expense
+    new_count = Analytics.total_transactions + count
+    Analytics.query.filter_by(date=today).update({
+        Analytics.total_transactions: new_count,
+        Analytics.total_income: Analytics.total_income + income,
+        Analytics.total_expense: Analytics.total_expense + expense,
+        # SET expressions see the old values, so fold the delta in here too
+        Analytics.avg_transaction_amount: case(
+            (new_count > 0, (Analytics.total_income + Analytics.total_expense + income + expense) / new_count),
+            else_=0
+        )
+    }, synchronize_session=False)
+    
+    for category, category_count in categories.items():
+        stmt = insert(AnalyticsCategory).values(date=today, category=category, count=sign * category_count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalyticsCategory.date, AnalyticsCategory.category],
+            set_={'count': AnalyticsCategory.count + stmt.excluded.count}
+        )
+        db.session.execute(stmt)
+    
+    # Bounded by the number of categories used today, not by the volume
+    most_common = most_common_category_query(today).scalar_subquery()
+    Analytics.query.filter_by(date=today).update(
+        {Analytics.most_common_category: most_common}, synchronize_session=False
+    )
+
+def record_transaction(transaction: Transaction, sign: int = 1):
+    """
+    Add a transaction to (or, with sign -1, remove it from) today's analytics.
+    
+    Args:
+        transaction: The added or deleted transaction
+        sign: 1 for an added transaction, -1 for a deleted one
+    """
+    record_transactions([(transaction.date, transaction.type, transaction.category, transaction.amount)], sign)
+
+def refresh_daily_analytics(day=None):
+    """
+    Recompute a day's analytics from scratch and commit.
+    
+    Fills in total and distinct active users, and reconciles the counters
+    maintained on write.
+    
+    Args:
+        day: The day to recompute, defaults to today
+    """
+    day = day or datetime.now().date()
+    _ensure_row(day)
+    analytics = Analytics.query.filter_by(date=day).first()
+    
+    analytics.total_users = User.query.count()
+    analytics.active_users = active_users_query(day).scalar()
+    
+    rows = day_totals_query(day).all()
+    
+    analytics.total_transactions = sum(row[2] for row in rows)
+    analytics.total_income = sum(row[3] for row in rows if row[0] == 'income')
+    analytics.total_expense = sum(row[3] for row in rows if row[0] == 'expense')
+    analytics.avg_transaction_amount = (
+        (analytics.total_income + analytics.total_expense) / analytics.total_transactions
+        if analytics.total_transactions else 0
+    )
+    
+    categories = Counter()
+    for _, category, count, _ in rows:
+        categories[category] += count
+    AnalyticsCategory.query.filter_by(date=day).delete(synchronize_session=False)
+    db.session.add_all(
+        AnalyticsCategory(date=day, category=category, count=count) for category, count in categories.items()
+    )
+    analytics.most_common_category = min(
+        categories, key=lambda category: (-categories[category], category)
+    ) if categories else None
+    
+    db.session.commit()
+
+@background_task(max_attempts=3)
+def refresh_analytics_job(interval_minutes: float):
+    """Refresh today's analytics and queue the next run"""
+    schedule_analytics_refresh(interval_minutes)
+    refresh_daily_analytics()
+
+def schedule_analytics_refresh(interval_minutes: float) -> Optional[Job]:
+    """
+    Queue a refresh_daily_analytics run one interval from now, unless one is already queued.
+    
+    Each run queues the next, so the refresh runs once per interval however
+    many processes serve the app. Processes starting together may each queue
+    one; the next run finds the other one queued and the chains merge.
+    
+    Args:
+        interval_minutes: Minutes until the run
+    
+    Returns:
+        The queued job, or None if a run was already queued
+    """
+    if Job.query.filter_by(type=refresh_analytics_job.name, status='pending').first() is not None:
+        return None
+    return enqueue(refresh_analytics_job.name, [interval_minutes],
+                   run_at=datetime.utcnow() + timedelta(minutes=interval_minutes),
+                   max_attempts=refresh_analytics_job.max_attempts)
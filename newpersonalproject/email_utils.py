@@ -1,12 +1,19 @@
 from flask_mail import Message
 from flask import render_template, current_app
 from extensions import mail
-from threading import Thread
+from jobs import background_task
 
-def send_async_email(app, msg):
-    """Send email asynchronously"""
-    with app.app_context():
-        mail.send(msg)
+@background_task(max_attempts=5, backoff_seconds=60)
+def deliver_email(subject, recipients, sender, html, body):
+    """Send a rendered email, retried by the job runner if the SMTP server fails"""
+    msg = Message(
+        subject=subject,
+        recipients=recipients,
+        sender=sender,
+        html=html,
+        body=body
+    )
+    mail.send(msg)
 
 def send_email(subject, recipients, template, **kwargs):
     """
@@ -18,19 +25,12 @@ def send_email(subject, recipients, template, **kwargs):
         template: Template name without extension
         **kwargs: Template variables
     """
-    app = current_app._get_current_object()
-    msg = Message(
-        subject=subject,
-        recipients=recipients,
-        sender=app.config['MAIL_DEFAULT_SENDER']
-    )
-    
-    # Render both HTML and text versions
-    msg.html = render_template(f'emails/{template}.html', **kwargs)
-    msg.body = render_template(f'emails/{template}.txt', **kwargs)
+    # Render both HTML and text versions now, the template variables are not serializable
+    html = render_template(f'emails/{template}.html', **kwargs)
+    body = render_template(f'emails/{template}.txt', **kwargs)
     
-    # Send email asynchronously
-    Thread(target=send_async_email, args=(app, msg)).start()
+    # Send email in the background
+    deliver_email.delay(subject, list(recipients), current_app.config['MAIL_DEFAULT_SENDER'], html, body)
 
 def send_verification_email(user, verification_url):
     """Send email verification link to user"""
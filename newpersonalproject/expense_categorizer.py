@@ -1,4 +1,11 @@
-from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+from categorization_batcher import MicroBatcher
+from categorizer_service import request_categories, request_stats
 
 # Define category keywords for rule-based matching
 CATEGORY_KEYWORDS: Dict[str, List[str]] = {
@@ -37,6 +44,33 @@ CATEGORY_KEYWORDS: Dict[str, List[str]] = {
     ]
 }
 
+# Changes whenever the keyword rules change, so cached categorizations made
+# under older rules can be told apart and discarded
+CATEGORY_KEYWORDS_VERSION = hashlib.sha1(
+    json.dumps(CATEGORY_KEYWORDS, sort_keys=True).encode()
+).hexdigest()[:12]
+
+def _compile_category_patterns(category_keywords: Dict[str, List[str]]) -> List[Tuple[str, Pattern]]:
+    """
+    Compile one alternation regex per category, preserving category order.
+    
+    Args:
+        category_keywords: Mapping of category name to its keywords
+        
+    Returns:
+        List of (category, compiled pattern) pairs in priority order
+    """
+    patterns = []
+    for category, keywords in category_keywords.items():
+        # Longest keywords first so the alternation never stops on a shorter prefix
+        ordered = sorted(keywords, key=len, reverse=True)
+        patterns.append((category, re.compile('|'.join(re.escape(k.lower()) for k in ordered))))
+    return patterns
+
+# Built once at import; each category is a single C-level scan instead of
+# one Python-level substring check per keyword
+_CATEGORY_PATTERNS = _compile_category_patterns(CATEGORY_KEYWORDS)
+
 def categorize_expense(note: str) -> str:
     """
     Categorize an expense based on the note using rule-based matching.
@@ -52,46 +86,234 @@ def categorize_expense(note: str) -> str:
     
     note = note.lower().strip()
     
-    # Try to match keywords
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        if any(keyword in note for keyword in keywords):
+    # Try to match keywords, first matching category wins
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(note):
             return category
     
     return 'Uncategorized'
 
+def categorize_expenses(notes: Iterable[str]) -> List[str]:
+    """
+    Categorize many expense notes at once using rule-based matching.
+    
+    Args:
+        notes: Iterable of expense notes/descriptions
+        
+    Returns:
+        List of predicted categories, in the same order as the notes
+    """
+    # Statement imports repeat the same notes a lot, so memoize within the batch
+    seen: Dict[str, str] = {}
+    results = []
+    for note in notes:
+        category = seen.get(note) if note else 'Uncategorized'
+        if category is None:
+            category = seen[note] = categorize_expense(note)
+        results.append(category)
+    return results
+
 # Optional: Add more sophisticated NLP-based categorization
 try:
     from transformers import pipeline
+except ImportError:
+    # If transformers is not installed, fallback to rule-based categorization
+    pipeline = None
+
+# When set, zero-shot classification is delegated to the shared
+# categorizer_service process instead of loading the model in every worker
+CATEGORIZER_SOCKET = os.environ.get('CATEGORIZER_SOCKET')
+CATEGORIZER_TIMEOUT = float(os.environ.get('CATEGORIZER_TIMEOUT', '2.0'))
+
+# Concurrent requests are classified together, flushed at this many notes
+# or once the oldest note has waited this long
+CATEGORIZER_BATCH_SIZE = int(os.environ.get('CATEGORIZER_BATCH_SIZE', '32'))
+CATEGORIZER_BATCH_WAIT_MS = float(os.environ.get('CATEGORIZER_BATCH_WAIT_MS', '10'))
+
+_classifier = None
+_batcher = None
+
+def get_classifier():
+    """
+    Load the zero-shot classification pipeline on first use.
     
-    # Initialize zero-shot classification pipeline
-    classifier = pipeline("zero-shot-classification")
+    Returns:
+        The pipeline, or None if transformers is not installed
+    """
+    global _classifier
+    if _classifier is None and pipeline is not None:
+        _classifier = pipeline("zero-shot-classification")
+    return _classifier
+
+def zero_shot_categorize(notes: List[str], classifier) -> List[str]:
+    """
+    Categorize expense notes with a zero-shot classifier.
     
-    def categorize_expense_nlp(note: str) -> str:
-        """
-        Categorize an expense using NLP (zero-shot classification).
-        
-        Args:
-            note: The expense note/description
-            
-        Returns:
-            The predicted category
-        """
-        if not note:
-            return 'Uncategorized'
+    Args:
+        notes: The expense notes/descriptions
+        classifier: A zero-shot classification pipeline (or compatible callable)
         
-        # First try rule-based matching
-        rule_based_category = categorize_expense(note)
-        if rule_based_category != 'Uncategorized':
-            return rule_based_category
+    Returns:
+        The highest confidence category for each note
+    """
+    if not notes:
+        return []
+    
+    candidate_labels = list(CATEGORY_KEYWORDS.keys())
+    results = classifier(notes, candidate_labels)
+    if isinstance(results, dict):
+        results = [results]
+    return [result['labels'][0] for result in results]
+
+def create_batcher(classifier) -> MicroBatcher:
+    """
+    Create a micro-batching queue in front of a zero-shot classifier.
+    
+    Args:
+        classifier: A zero-shot classification pipeline (or compatible callable)
         
-        # If rule-based fails, use NLP
+    Returns:
+        The batcher, configured from CATEGORIZER_BATCH_SIZE and CATEGORIZER_BATCH_WAIT_MS
+    """
+    return MicroBatcher(lambda notes: zero_shot_categorize(notes, classifier),
+                        max_batch_size=CATEGORIZER_BATCH_SIZE,
+                        max_wait_ms=CATEGORIZER_BATCH_WAIT_MS)
+
+def get_batcher() -> Optional[MicroBatcher]:
+    """
+    Get the in-process batcher, creating it on first use.
+    
+    Returns:
+        The batcher, or None if no classifier is available
+    """
+    global _batcher
+    if _batcher is None:
+        classifier = get_classifier()
+        if classifier is not None:
+            _batcher = create_batcher(classifier)
+    return _batcher
+
+def categorization_stats() -> Optional[Dict]:
+    """
+    Get micro-batching metrics from the categorization service or in-process batcher.
+    
+    Returns:
+        Dict of queue/batch metrics, or None if NLP categorization is not active
+    """
+    if CATEGORIZER_SOCKET:
         try:
-            candidate_labels = list(CATEGORY_KEYWORDS.keys())
-            result = classifier(note, candidate_labels)
-            return result['labels'][0]  # Return the highest confidence category
+            return request_stats(CATEGORIZER_SOCKET, CATEGORIZER_TIMEOUT)
         except Exception:
-            return 'Uncategorized'
-            
-except ImportError:
-    # If transformers is not installed, fallback to rule-based categorization
-    categorize_expense_nlp = categorize_expense 
\ No newline at end of file
+            return None
+    return _batcher.stats() if _batcher is not None else None
+
+class CategorizerUnavailable(RuntimeError):
+    """Raised when neither the categorization service nor an in-process model can answer"""
+
+def predict_zero_shot(notes: List[str], timeout: Optional[float]) -> List[str]:
+    """
+    Categorize expense notes with the zero-shot model only, no rules or fallback.
+    
+    Args:
+        notes: The expense notes/descriptions
+        timeout: Seconds to wait for the model, forever if None
+        
+    Returns:
+        The predicted category for each note
+        
+    Raises:
+        CategorizerUnavailable: If there is no model, or the service fails or times out
+    """
+    if not notes:
+        return []
+    
+    try:
+        if CATEGORIZER_SOCKET:
+            return request_categories(notes, CATEGORIZER_SOCKET, timeout)
+        
+        batcher = get_batcher()
+        if batcher is None:
+            raise CategorizerUnavailable('transformers is not installed and CATEGORIZER_SOCKET is not set')
+        return batcher.submit_many(notes, timeout=timeout)
+    except CategorizerUnavailable:
+        raise
+    except Exception as e:
+        raise CategorizerUnavailable(f'Zero-shot categorization failed: {e!r}') from e
+
+def categorize_expense_strict(note: str) -> str:
+    """
+    Categorize an expense like categorize_expense_nlp, but fail when the model is needed and unavailable.
+    
+    For background jobs, which would rather retry later than settle for
+    'Uncategorized'.
+    
+    Args:
+        note: The expense note/description
+        
+    Returns:
+        The predicted category
+        
+    Raises:
+        CategorizerUnavailable: If the rules can't place the note and the model is unavailable
+    """
+    if not note:
+        return 'Uncategorized'
+    
+    # First try rule-based matching
+    rule_based_category = categorize_expense(note)
+    if rule_based_category != 'Uncategorized':
+        return rule_based_category
+    
+    # If rule-based fails, use NLP
+    return predict_zero_shot([note], CATEGORIZER_TIMEOUT)[0]
+
+def categorize_expense_nlp(note: str) -> str:
+    """
+    Categorize an expense using NLP (zero-shot classification).
+    
+    Falls back to rule-based matching when no model is available or the
+    categorization service cannot be reached in time.
+    
+    Args:
+        note: The expense note/description
+        
+    Returns:
+        The predicted category
+    """
+    try:
+        return categorize_expense_strict(note)
+    except CategorizerUnavailable:
+        return 'Uncategorized'  # What the rules said
+
+def categorize_expenses_nlp(notes: Iterable[str]) -> List[str]:
+    """
+    Categorize many expense notes, using NLP for those the rules can't place.
+    
+    Args:
+        notes: Iterable of expense notes/descriptions
+        
+    Returns:
+        List of predicted categories, in the same order as the notes
+    """
+    notes = list(notes)
+    categories = categorize_expenses(notes)
+    
+    # Each distinct leftover note goes to the model once
+    pending = list(dict.fromkeys(
+        note for note, category in zip(notes, categories) if note and category == 'Uncategorized'
+    ))
+    if not pending:
+        return categories
+    
+    predicted = {}
+    for start in range(0, len(pending), CATEGORIZER_BATCH_SIZE):
+        chunk = pending[start:start + CATEGORIZER_BATCH_SIZE]
+        try:
+            results = predict_zero_shot(chunk, CATEGORIZER_TIMEOUT)
+        except CategorizerUnavailable:
+            # Leave this chunk to the rule-based result
+            continue
+        predicted.update(zip(chunk, results))
+    
+    return [predicted.get(note, category) if category == 'Uncategorized' else category
+            for note, category in zip(notes, categories)]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -6,12 +6,63 @@ from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 from sqlalchemy import func
 from models import Transaction
+from monthly_rollup import get_rollup_rows, month_bounds
+
+def get_monthly_aggregates(user_id: int, start_date=None) -> pd.DataFrame:
+    """
+    Aggregate a user's expenses per month and category.
+    
+    Whole months are read from the monthly rollup, only a partial first
+    month is aggregated from raw transactions.
+    
+    Args:
+        user_id: ID of the user
+        start_date: Only include transactions on or after this date
+        
+    Returns:
+        DataFrame with month, category, total, count, min, max and first_seen
+        columns, one row per month and category; first_seen is the first day
+        of the month
+    """
+    rows = get_rollup_rows(user_id, start_date, transaction_type='expense')
+    return pd.DataFrame(
+        [(month, category, total, count, min_amount, max_amount, month_bounds(month)[0])
+         for month, _, category, total, count, min_amount, max_amount in rows],
+        columns=['month', 'category', 'total', 'count', 'min', 'max', 'first_seen']
+    )
 
 class ExpenseForecaster:
     def __init__(self):
         self.model = LinearRegression()
         self.scaler = StandardScaler()
+        self.category_model = LinearRegression()
+        self.category_cols = []
         self.is_trained = False
+        # Features of the last transaction snapshot, reused across train and predict calls
+        self._snapshot = None
+        self._snapshot_size = None
+        self._features = None
+
+    def get_features(self, transactions: Union[List[Transaction], pd.DataFrame]) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Prepare features once per transaction snapshot and reuse them.
+        
+        Args:
+            transactions: List of Transaction objects, or monthly aggregates
+                from get_monthly_aggregates
+            
+        Returns:
+            X: Feature DataFrame
+            y: Target Series (monthly expenses)
+        """
+        if self._snapshot is not transactions or self._snapshot_size != len(transactions):
+            if isinstance(transactions, pd.DataFrame):
+                self._features = self.prepare_monthly_features(transactions)
+            else:
+                self._features = self.prepare_features(transactions)
+            self._snapshot = transactions
+            self._snapshot_size = len(transactions)
+        return self._features
 
     def prepare_features(self, transactions: List[Transaction]) -> Tuple[pd.DataFrame, pd.Series]:
         """
@@ -37,35 +88,66 @@ class ExpenseForecaster:
         
         # Keep only expenses
         df = df[df['type'] == 'expense']
+        if df.empty:
+            return pd.DataFrame(), pd.Series()
         
-        # Group by month and calculate features
-        monthly_data = []
-        unique_months = sorted(df['date'].dt.to_period('M').unique())
+        # Reduce to the same per-month, per-category aggregates the database
+        # query produces; row position orders categories by first appearance
+        df = df.assign(month=pd.to_datetime(df['date']).dt.to_period('M'),
+                       position=np.arange(len(df)))
+        monthly = df.groupby(['month', 'category'], sort=True).agg(
+            total=('amount', 'sum'),
+            count=('amount', 'size'),
+            min=('amount', 'min'),
+            max=('amount', 'max'),
+            first_seen=('position', 'min'),
+        ).reset_index()
         
-        for month in unique_months:
-            month_df = df[df['date'].dt.to_period('M') == month]
-            
-            # Calculate features for this month
-            features = {
-                'month_num': month.month,  # Capture seasonality
-                'total_transactions': len(month_df),
-                'avg_transaction': month_df['amount'].mean(),
-                'max_transaction': month_df['amount'].max(),
-                'min_transaction': month_df['amount'].min(),
-            }
-            
-            # Add category-wise spending
-            for category in df['category'].unique():
-                cat_total = month_df[month_df['category'] == category]['amount'].sum()
-                features[f'cat_{category.lower().replace(" & ", "_")}'] = cat_total
-            
-            # Add target (total expenses for the month)
-            features['total_expenses'] = month_df['amount'].sum()
+        return self.prepare_monthly_features(monthly)
+
+    def prepare_monthly_features(self, monthly: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Prepare features from per-month, per-category expense aggregates.
+        
+        Args:
+            monthly: DataFrame with month, category, total, count, min, max
+                and first_seen columns, as returned by get_monthly_aggregates
             
-            monthly_data.append(features)
+        Returns:
+            X: Feature DataFrame
+            y: Target Series (monthly expenses)
+        """
+        if monthly.empty:
+            return pd.DataFrame(), pd.Series()
+        
+        month = pd.PeriodIndex(monthly['month'], freq='M')
+        stats = monthly.groupby(month).agg(
+            count=('count', 'sum'),
+            total=('total', 'sum'),
+            max=('max', 'max'),
+            min=('min', 'min'),
+        )
+        monthly_df = pd.DataFrame({
+            'month_num': stats.index.month,  # Capture seasonality
+            'total_transactions': stats['count'].values,
+            'avg_transaction': (stats['total'] / stats['count']).values,
+            'max_transaction': stats['max'].values,
+            'min_transaction': stats['min'].values,
+        })
         
-        # Convert to DataFrame
-        monthly_df = pd.DataFrame(monthly_data)
+        # Category-wise spending, columns in order of first appearance. Names
+        # that collide after normalization keep the last category's totals.
+        first_seen = monthly.groupby('category', sort=False)['first_seen'].min()
+        category_columns = {}
+        for category in first_seen.sort_values(kind='stable').index:
+            category_columns[f'cat_{category.lower().replace(" & ", "_")}'] = category
+        category_totals = monthly.pivot_table(index=month, columns='category', values='total',
+                                              aggfunc='sum', fill_value=0)
+        for column, category in category_columns.items():
+            monthly_df[column] = category_totals[category].values
+        
+        # Add target (total expenses for the month)
+        monthly_df['total_expenses'] = stats['total'].values
         
         # Separate features and target
         target = monthly_df['total_expenses']
@@ -83,7 +165,7 @@ class ExpenseForecaster:
         Returns:
             bool: True if training was successful
         """
-        X, y = self.prepare_features(transactions)
+        X, y = self.get_features(transactions)
         
         if len(X) < 2:  # Need at least 2 months of data
             return False
@@ -93,6 +175,13 @@ class ExpenseForecaster:
         
         # Train model
         self.model.fit(X_scaled, y)
+        
+        # One multi-output least-squares solve covers every category with
+        # historical data, the same as fitting a separate model per column
+        self.category_cols = [col for col in X.columns if col.startswith('cat_') and X[col].sum() > 0]
+        if self.category_cols:
+            self.category_model.fit(X_scaled, X[self.category_cols].values)
+        
         self.is_trained = True
         
         return True
@@ -116,7 +205,7 @@ class ExpenseForecaster:
                 }
         
         # Prepare features for last month
-        X, _ = self.prepare_features(transactions)
+        X, y = self.get_features(transactions)
         if X.empty:
             return {
                 'prediction': None,
@@ -137,7 +226,7 @@ class ExpenseForecaster:
         # Calculate confidence score (based on R² score of recent predictions)
         recent_confidence = max(0, min(1, self.model.score(
             self.scaler.transform(X.iloc[-3:]), 
-            self.prepare_features(transactions)[1].iloc[-3:]
+            y.iloc[-3:]
         )))
         
         return {
@@ -160,28 +249,42 @@ class ExpenseForecaster:
             if not self.train(transactions):
                 return {}
         
-        X, _ = self.prepare_features(transactions)
+        X, _ = self.get_features(transactions)
         if X.empty:
             return {}
         
-        # Get category columns
-        category_cols = [col for col in X.columns if col.startswith('cat_')]
+        # Only predict for categories with historical data
+        if not self.category_cols:
+            return {}
         
         # Prepare next month's base features
         next_month_features = X.iloc[-1:].copy()
         next_month_features['month_num'] = (next_month_features['month_num'] % 12) + 1
         
+        preds = self.category_model.predict(self.scaler.transform(next_month_features))[0]
+        
         predictions = {}
-        for category in category_cols:
-            # Create a separate model for each category
-            cat_model = LinearRegression()
-            cat_target = pd.Series([row[category] for _, row in X.iterrows()])
+        for category, pred in zip(self.category_cols, preds):
+            if pred > 0:
+                category_name = category[4:].replace('_', ' & ').title()
+                predictions[category_name] = round(pred, 2)
+        
+        return predictions 
+
+    def fit_predict(self, transactions: List[Transaction]) -> Dict:
+        """
+        Train on a transaction snapshot and produce every forecast from it.
+        
+        Features are prepared once and shared by training, the total
+        prediction and the category predictions.
+        
+        Args:
+            transactions: List of Transaction objects
             
-            if cat_target.sum() > 0:  # Only predict for categories with historical data
-                cat_model.fit(self.scaler.transform(X), cat_target)
-                pred = cat_model.predict(self.scaler.transform(next_month_features))[0]
-                if pred > 0:
-                    category_name = category[4:].replace('_', ' & ').title()
-                    predictions[category_name] = round(pred, 2)
-        
-        return predictions 
\ No newline at end of file
+        Returns:
+            Dict containing the total prediction and category-wise predictions
+        """
+        return {
+            'total_prediction': self.predict_next_month(transactions),
+            'category_predictions': self.get_category_predictions(transactions)
+        }
\ No newline at end of file
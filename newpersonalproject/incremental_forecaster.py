@@ -0,0 +1,414 @@
+"""
+Incremental forecasting over a user's full history.
+
+ExpenseForecaster.train rebuilds the monthly feature matrix and refits from
+scratch. IncrementalForecaster instead keeps the running per-month,
+per-category aggregates plus the sufficient statistics of the regression
+(feature sums and the Gram matrix), so a single added or deleted
+transaction only swaps one month row in and out: O(features^2) work, no
+history scan. Solving the scaled, centered normal equations with a
+pseudo-inverse gives the same minimum-norm least-squares fit as
+StandardScaler + LinearRegression on the batch features.
+
+ForecastStateStore persists one model per user, tagged with the
+User.data_version it reflects, and only covers the all-history forecast
+(period 0): windowed forecasts drop old months as the window slides, so
+they stay on the batch path.
+"""
+import pickle
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import ForecastState, Transaction, User
+from expense_forecaster import get_monthly_aggregates
+from monthly_rollup import month_bounds
+
+# month_num, total_transactions, avg_transaction, max_transaction, min_transaction
+N_BASE_FEATURES = 5
+# Row updates between exact recomputations of the running statistics
+REBUILD_INTERVAL = 1000
+
+class IncrementalForecaster:
+    def __init__(self):
+        # 'YYYY-MM' -> {category: [sum, count, min, max]}
+        self.months = {}
+        # Category feature columns, in order of first appearance
+        self.categories = []
+        self.category_counts = {}
+        self._reset_statistics()
+    
+    @classmethod
+    def from_monthly(cls, monthly: pd.DataFrame) -> 'IncrementalForecaster':
+        """
+        Build the model from monthly aggregates.
+        
+        Args:
+            monthly: DataFrame as returned by get_monthly_aggregates
+        
+        Returns:
+            The model, ready to predict and update
+        """
+        model = cls()
+        if monthly.empty:
+            return model
+        
+        first_seen = monthly.groupby('category', sort=False)['first_seen'].min()
+        for category in first_seen.sort_values(kind='stable').index:
+            model.categories.append(category)
+            model.category_counts[category] = 0
+        
+        for row in monthly.itertuples(index=False):
+            month = str(row.month)
+            model.months.setdefault(month, {})[row.category] = [row.total, row.count, row.min, row.max]
+            model.category_counts[row.category] += row.count
+        
+        model._rebuild_statistics()
+        return model
+    
+    def add(self, date, category: str, amount: float):
+        """
+        Account for a new expense transaction.
+        
+        Args:
+            date: Transaction date
+            category: Transaction category
+            amount: Transaction amount
+        """
+        month = date.strftime('%Y-%m')
+        self._before_change(month)
+        
+        if category not in self.category_counts:
+            self._add_category(category)
+        self.category_counts[category] += 1
+        
+        stats = self.months.setdefault(month, {}).get(category)
+        if stats is None:
+            self.months[month][category] = [amount, 1, amount, amount]
+        else:
+            stats[0] += amount
+            stats[1] += 1
+            stats[2] = min(stats[2], amount)
+            stats[3] = max(stats[3], amount)
+        
+        self._accumulate(month, 1)
+    
+    def remove(self, date, category: str, amount: float,
+               refresh_extrema: Callable[[str, str], Tuple[float, float]]):
+        """
+        Account for a deleted expense transaction.
+        
+        Args:
+            date: Transaction date
+            category: Transaction category
+            amount: Transaction amount
+            refresh_extrema: Called with (month, category) to fetch the
+                remaining min and max when the deleted amount was one of them
+        """
+        month = date.strftime('%Y-%m')
+        stats = self.months.get(month, {}).get(category)
+        if stats is None:
+            return
+        
+        self._before_change(month)
+        
+        stats[0] -= amount
+        stats[1] -= 1
+        if stats[1] == 0:
+            del self.months[month][category]
+            if not self.months[month]:
+                del self.months[month]
+        elif amount <= stats[2] or amount >= stats[3]:
+            # Only the database knows the next smallest/largest amount
+            stats[2], stats[3] = refresh_extrema(month, category)
+        
+        self.category_counts[category] -= 1
+        if self.category_counts[category] == 0:
+            self._drop_category(category)
+        
+        if month in self.months:
+            self._accumulate(month, 1)
+    
+    def fit_predict(self) -> Dict:
+        """
+        Predict next month's total and category-wise expenses.
+        
+        Returns:
+            Dict shaped like ExpenseForecaster.fit_predict
+        """
+        if self.n < 2:  # Need at least 2 months of data
+            return {
+                'total_prediction': {
+                    'prediction': None,
+                    'confidence': 0,
+                    'error': 'Insufficient data for prediction'
+                },
+                'category_predictions': {}
+            }
+        
+        mean, scale, coef_total, coef_categories = self._solve()
+        
+        months = sorted(self.months)
+        last = self._row(months[-1])[0]
+        next_month = last.copy()
+        next_month[0] = (next_month[0] % 12) + 1
+        z_next = (next_month - mean) / scale
+        y_mean = self.mean[0]
+        
+        prediction = y_mean + z_next @ coef_total
+        
+        # Confidence score, R² of the last 3 months like the batch model
+        recent = [self._row(month) for month in months[-3:]]
+        X_recent = np.array([x for x, _ in recent])
+        y_recent = np.array([y for _, y in recent])
+        fitted = y_mean + ((X_recent - mean) / scale) @ coef_total
+        recent_confidence = max(0, min(1, _r2_score(y_recent, fitted)))
+        
+        category_predictions = {}
+        category_means = mean[N_BASE_FEATURES:]
+        for i, category in enumerate(self.categories):
+            if category_means[i] <= 0:
+                continue
+            pred = category_means[i] + z_next @ coef_categories[:, i]
+            if pred > 0:
+                column = f'cat_{category.lower().replace(" & ", "_")}'
+                category_predictions[column[4:].replace('_', ' & ').title()] = round(pred, 2)
+        
+        return {
+            'total_prediction': {
+                'prediction': round(prediction, 2),
+                'confidence': round(recent_confidence * 100, 1),
+                'error': None
+            },
+            'category_predictions': category_predictions
+        }
+    
+    def _solve(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        n = self.n
+        # Index 0 of the running statistics is the target, the rest are features
+        mean = self.mean[1:]
+        centered = self.comoment[1:, 1:]
+        var = np.diag(centered) / n
+        # Treat rounding noise on constant columns as zero variance, the way
+        # StandardScaler leaves constant features unscaled
+        constant = var <= (1e-12 * n * mean) ** 2 + 1e-24
+        scale = np.where(constant, 1.0, np.sqrt(np.maximum(var, 0)))
+        
+        gram = centered / np.outer(scale, scale)
+        gram[constant, :] = 0
+        gram[:, constant] = 0
+        gram_inv = np.linalg.pinv(gram, rcond=1e-10, hermitian=True)
+        
+        xy = self.comoment[1:, 0] / scale
+        xy[constant] = 0
+        coef_total = gram_inv @ xy
+        
+        # Category targets are feature columns themselves, so their cross
+        # products are already in the co-moment matrix
+        category_slice = slice(N_BASE_FEATURES, N_BASE_FEATURES + len(self.categories))
+        coef_categories = gram_inv @ (centered[:, category_slice] / scale[:, None])
+        coef_categories[constant, :] = 0
+        return mean, scale, coef_total, coef_categories
+    
+    def _row(self, month: str) -> Tuple[np.ndarray, float]:
+        stats = self.months[month]
+        count = sum(s[1] for s in stats.values())
+        total = sum(s[0] for s in stats.values())
+        x = np.zeros(N_BASE_FEATURES + len(self.categories))
+        x[0] = int(month[5:])
+        x[1] = count
+        x[2] = total / count
+        x[3] = max(s[3] for s in stats.values())
+        x[4] = min(s[2] for s in stats.values())
+        for i, category in enumerate(self.categories):
+            if category in stats:
+                x[N_BASE_FEATURES + i] = stats[category][0]
+        return x, total
+    
+    def _accumulate(self, month: str, sign: int):
+        # Welford-style update of the mean and co-moment matrix; raw sums of
+        # squares lose precision on columns with a small spread
+        x, y = self._row(month)
+        v = np.concatenate(([y], x))
+        if sign > 0:
+            self.n += 1
+            delta = v - self.mean
+            self.mean = self.mean + delta / self.n
+            self.comoment += np.outer(delta, v - self.mean)
+        elif self.n > 2:
+            old_mean = self.mean
+            self.n -= 1
+            self.mean = (old_mean * (self.n + 1) - v) / self.n
+            self.comoment -= np.outer(v - old_mean, v - self.mean)
+        else:
+            # Down to one row or none: start over exactly instead of
+            # carrying the rounding left by the subtraction
+            self._rebuild_statistics(exclude=month)
+            return
+        self.comoment = (self.comoment + self.comoment.T) / 2
+        
+        self._updates += 1
+        if self._updates >= REBUILD_INTERVAL:
+            # Bound the rounding drift of long add/remove sequences
+            self._rebuild_statistics()
+    
+    def _before_change(self, month: str):
+        # Take the month's current row out; the caller adds the updated one back
+        if month in self.months:
+            self._accumulate(month, -1)
+    
+    def _add_category(self, category: str):
+        # Existing rows are all zero in the new column, so the statistics
+        # just grow by a zero row and column
+        self.categories.append(category)
+        self.category_counts[category] = 0
+        self.mean = np.append(self.mean, 0.0)
+        self.comoment = np.pad(self.comoment, ((0, 1), (0, 1)))
+    
+    def _drop_category(self, category: str):
+        index = 1 + N_BASE_FEATURES + self.categories.index(category)
+        self.categories.remove(category)
+        del self.category_counts[category]
+        self.mean = np.delete(self.mean, index)
+        self.comoment = np.delete(np.delete(self.comoment, index, axis=0), index, axis=1)
+    
+    def _reset_statistics(self):
+        p = 1 + N_BASE_FEATURES + len(self.categories)
+        self.n = 0
+        self.mean = np.zeros(p)
+        self.comoment = np.zeros((p, p))
+        self._updates = 0
+    
+    def _rebuild_statistics(self, exclude: str = None):
+        # Exact recomputation from the monthly aggregates, O(months x features^2)
+        rows = [self._row(month) for month in self.months if month != exclude]
+        self._reset_statistics()
+        if not rows:
+            return
+        V = np.array([np.concatenate(([y], x)) for x, y in rows])
+        self.n = len(rows)
+        self.mean = V.mean(axis=0)
+        centered = V - self.mean
+        self.comoment = centered.T @ centered
+
+def _r2_score(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    # Matches sklearn's r2_score, including its constant-target convention
+    ss_res = float(((y_true - y_pred) ** 2).sum())
+    ss_tot = float(((y_true - y_true.mean()) ** 2).sum())
+    if ss_tot == 0:
+        return 1.0 if ss_res == 0 else 0.0
+    return 1 - ss_res / ss_tot
+
+def extrema_query(user_id: int, month: str, category: str):
+    """
+    Build the query for the smallest and largest expense of a category in a month.
+    
+    Args:
+        user_id: ID of the user
+        month: 'YYYY-MM'
+        category: The category
+    
+    Returns:
+        A query for one (min, max) row
+    """
+    # A date range, so only the month's rows are read from the (user_id, date) index
+    first_day, last_day = month_bounds(month)
+    return db.session.query(func.min(Transaction.amount), func.max(Transaction.amount)).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= first_day,
+        Transaction.date <= last_day,
+        Transaction.type == 'expense',
+        Transaction.category == category
+    )
+
+class ForecastStateStore:
+    def apply(self, user_id: int, transaction: Transaction, sign: int):
+        """
+        Fold a transaction write into the user's model, in the caller's database transaction.
+        
+        Call after User.bump_data_version and before committing. If the stored
+        model is missing or already behind, nothing is written and the next
+        forecast rebuilds it from the aggregates.
+        
+        Args:
+            user_id: ID of the user
+            transaction: The added or deleted transaction
+            sign: 1 for an added transaction, -1 for a deleted one
+        """
+        if transaction.type != 'expense':
+            # Income does not change the expense model, only its version
+            ForecastState.query.filter_by(user_id=user_id).update(
+                {ForecastState.data_version: ForecastState.data_version + 1}, synchronize_session=False
+            )
+            return
+        
+        # The version bump already holds the write lock, so this read is current
+        db.session.flush()
+        data_version = db.session.query(User.data_version).filter_by(id=user_id).scalar()
+        entry = ForecastState.query.filter_by(user_id=user_id, data_version=data_version - 1).first()
+        if entry is None:
+            return
+        
+        model = pickle.loads(entry.state)
+        if sign > 0:
+            model.add(transaction.date, transaction.category, transaction.amount)
+        else:
+            model.remove(transaction.date, transaction.category, transaction.amount,
+                         lambda month, category: self._extrema(user_id, month, category))
+        
+        entry.state = pickle.dumps(model)
+        entry.data_version = data_version
+        entry.updated_at = datetime.utcnow()
+    
+    def fit_predict(self, user_id: int, data_version: int) -> Dict:
+        """
+        Forecast from the user's whole history, rebuilding the model if it is stale.
+        
+        Args:
+            user_id: ID of the user
+            data_version: The user's current User.data_version
+        
+        Returns:
+            Dict shaped like ExpenseForecaster.fit_predict
+        """
+        entry = ForecastState.query.filter_by(user_id=user_id).first()
+        if entry is not None and entry.data_version == data_version:
+            return pickle.loads(entry.state).fit_predict()
+        
+        model = self.rebuild(user_id, data_version, entry)
+        return model.fit_predict()
+    
+    def rebuild(self, user_id: int, data_version: int,
+                entry: Optional[ForecastState] = None) -> IncrementalForecaster:
+        """
+        Rebuild the user's model from their monthly aggregates.
+        
+        Args:
+            user_id: ID of the user
+            data_version: The user's current User.data_version
+            entry: The user's existing ForecastState row, if already loaded
+        
+        Returns:
+            The rebuilt model
+        """
+        model = IncrementalForecaster.from_monthly(get_monthly_aggregates(user_id))
+        if entry is None:
+            entry = ForecastState(user_id=user_id)
+            db.session.add(entry)
+        entry.state = pickle.dumps(model)
+        entry.data_version = data_version
+        entry.updated_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created the state first, it will catch up on its own
+            db.session.rollback()
+        return model
+    
+    def _extrema(self, user_id: int, month: str, category: str) -> Tuple[float, float]:
+        return extrema_query(user_id, month, category).one()
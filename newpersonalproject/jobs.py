@@ -0,0 +1,379 @@
+"""
+Persistent background jobs on SQLite.
+
+Functions decorated with @background_task can be queued with .delay(),
+which writes a row to the job table. A small pool of worker threads claims
+due jobs with a compare-and-set UPDATE, runs them and records the outcome.
+Failures are retried with exponential backoff. A claimed job holds a lease,
+so jobs left running by a crashed process go back to the queue once it
+expires. No broker is involved, only the application database.
+
+Jobs can be run more than once (a retry after a partial failure, a lease
+that expired mid-run), so tasks must be idempotent.
+"""
+import json
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import and_, func
+
+from extensions import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> BackgroundTask, filled in by the decorator at import time
+_tasks: Dict[str, 'BackgroundTask'] = {}
+# Set on enqueue so idle workers pick new jobs up without waiting a poll interval
+_wakeup = threading.Event()
+
+class BackgroundTask:
+    def __init__(self, func: Callable, name: str, max_attempts: int, backoff_seconds: float):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.__doc__ = func.__doc__
+    
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+    
+    def delay(self, *args, **kwargs) -> Optional[Job]:
+        """
+        Queue a call of the task. Commits the current session.
+        
+        Arguments must be JSON serializable. With JOB_WORKERS set to 0 the
+        task runs inline instead, once; a failure is logged like a job that
+        ran out of attempts rather than raised into the caller.
+        
+        Returns:
+            The queued job, or None if it ran inline
+        """
+        if current_app.config.get('JOB_WORKERS') == 0:
+            try:
+                self.func(*args, **kwargs)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Inline task %s failed', self.name)
+            return None
+        return enqueue(self.name, args, kwargs, max_attempts=self.max_attempts)
+
+def background_task(func: Optional[Callable] = None, *, name: Optional[str] = None,
+                    max_attempts: int = 5, backoff_seconds: float = 30):
+    """
+    Register a function as a background task.
+    
+    Usable bare (@background_task) or with options.
+    
+    Args:
+        func: The task function
+        name: Job type stored in the table, defaults to the function name
+        max_attempts: Runs before the job is marked failed
+        backoff_seconds: Delay before the first retry, doubled on each further retry
+    
+    Returns:
+        A BackgroundTask, callable like the function and queued with .delay()
+    """
+    def decorator(func):
+        # Not module-qualified: app.py runs as __main__ or as app depending on how it's started
+        task_name = name or func.__name__
+        task = BackgroundTask(func, task_name, max_attempts, backoff_seconds)
+        _tasks[task_name] = task
+        return task
+    return decorator(func) if func else decorator
+
+def enqueue(type: str, args=(), kwargs=None, run_at: Optional[datetime] = None,
+            max_attempts: int = 5) -> Job:
+    """
+    Queue a job and commit the current session.
+    
+    Args:
+        type: Name of a registered task
+        args: Positional arguments for the task
+        kwargs: Keyword arguments for the task
+        run_at: Earliest time to run it, defaults to now
+        max_attempts: Runs before the job is marked failed
+    
+    Returns:
+        The queued job
+    """
+    job = Job(
+        type=type,
+        payload=json.dumps({'args': list(args), 'kwargs': kwargs or {}}),
+        max_attempts=max_attempts,
+        run_at=run_at or datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+    _wakeup.set()
+    return job
+
+def due_job_query(now: datetime):
+    """
+    Build the query for the next job due at a given time.
+    
+    Args:
+        now: The current time
+    
+    Returns:
+        Query of the due job's id, oldest first
+    """
+    return db.session.query(Job.id).filter(
+        Job.status == 'pending', Job.run_at <= now
+    ).order_by(Job.run_at, Job.id).limit(1)
+
+def claim_job(lease_seconds: float) -> Optional[Job]:
+    """
+    Claim the next due job for this worker.
+    
+    Args:
+        lease_seconds: How long the job is reserved before it counts as abandoned
+    
+    Returns:
+        The claimed job, or None if nothing is due
+    """
+    while True:
+        now = datetime.utcnow()
+        candidate = due_job_query(now).first()
+        if candidate is None:
+            db.session.commit()  # End the read transaction
+            return None
+        
+        # Compare-and-set: only one worker moves it out of 'pending'
+        claimed = Job.query.filter_by(id=candidate.id, status='pending').update({
+            Job.status: 'running',
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: now,
+            Job.locked_until: now + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id)
+
+def run_job(job: Job):
+    """
+    Run a claimed job and record its outcome.
+    
+    A failed job is rescheduled with exponential backoff until it runs out
+    of attempts, then marked failed.
+    
+    Args:
+        job: A job returned by claim_job
+    """
+    job_id = job.id
+    task = _tasks.get(job.type)
+    try:
+        if task is None:
+            raise LookupError(f'No background task named {job.type!r}')
+        payload = json.loads(job.payload)
+        task.func(*payload['args'], **payload['kwargs'])
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        job = db.session.get(Job, job_id)
+        now = datetime.utcnow()
+        job.last_error = error[-4000:]
+        job.locked_until = None
+        if task is None or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = now
+            logger.error('Job %d (%s) failed after %d attempt(s):\n%s', job_id, job.type, job.attempts, error)
+        else:
+            job.status = 'pending'
+            job.run_at = now + timedelta(seconds=task.backoff_seconds * 2 ** (job.attempts - 1))
+            logger.warning('Job %d (%s) failed, retrying at %s:\n%s', job_id, job.type, job.run_at, error)
+        db.session.commit()
+        return
+    
+    Job.query.filter_by(id=job_id).update({
+        Job.status: 'done',
+        Job.finished_at: datetime.utcnow(),
+        Job.locked_until: None
+    }, synchronize_session=False)
+    db.session.commit()
+
+def recover_stale_jobs() -> int:
+    """
+    Requeue jobs whose worker lease has expired, e.g. after a crash.
+    
+    Jobs that already used all their attempts are marked failed instead.
+    
+    Returns:
+        Number of jobs recovered
+    """
+    now = datetime.utcnow()
+    stale = and_(Job.status == 'running', Job.locked_until < now)
+    Job.query.filter(stale, Job.attempts >= Job.max_attempts).update({
+        Job.status: 'failed',
+        Job.finished_at: now,
+        Job.locked_until: None,
+        Job.last_error: 'Worker lease expired'
+    }, synchronize_session=False)
+    recovered = Job.query.filter(stale).update({
+        Job.status: 'pending',
+        Job.run_at: now,
+        Job.locked_until: None
+    }, synchronize_session=False)
+    db.session.commit()
+    return recovered
+
+def purge_finished_jobs(retention_days: float) -> int:
+    """
+    Delete done jobs older than the retention period. Failed jobs are kept.
+    
+    Args:
+        retention_days: Days to keep done jobs for
+    
+    Returns:
+        Number of jobs deleted
+    """
+    deleted = Job.query.filter(
+        Job.status == 'done',
+        Job.finished_at < datetime.utcnow() - timedelta(days=retention_days)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def run_pending_jobs(lease_seconds: float = 600, limit: Optional[int] = None) -> int:
+    """
+    Run due jobs in the current thread until the queue is empty. Must run in an app context.
+    
+    Args:
+        lease_seconds: Lease taken on each job
+        limit: Stop after this many jobs
+    
+    Returns:
+        Number of jobs run
+    """
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job(lease_seconds)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+    values = sorted(values)
+    return {
+        'p50_ms': round(values[len(values) // 2] * 1000, 1),
+        'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+        'max_ms': round(values[-1] * 1000, 1)
+    }
+
+def job_metrics(window_minutes: float = 60) -> Dict:
+    """
+    Queue depth and latency metrics.
+    
+    Args:
+        window_minutes: How far back finished jobs count towards the latency figures
+    
+    Returns:
+        Dict with job counts per status, due and scheduled depth, the age of
+        the oldest due job, and per task type the done/failed counts, queue
+        wait (run_at to start) and run time percentiles over the window
+    """
+    now = datetime.utcnow()
+    by_status = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    due, oldest_due = db.session.query(func.count(Job.id), func.min(Job.run_at)).filter(
+        Job.status == 'pending', Job.run_at <= now
+    ).one()
+    
+    finished = db.session.query(Job.type, Job.status, Job.run_at, Job.started_at, Job.finished_at).filter(
+        Job.status.in_(['done', 'failed']),
+        Job.finished_at >= now - timedelta(minutes=window_minutes)
+    ).all()
+    
+    tasks = {}
+    for type, status, run_at, started_at, finished_at in finished:
+        stats = tasks.setdefault(type, {'done': 0, 'failed': 0, 'wait': [], 'run': []})
+        stats[status] += 1
+        # run_at is reset by each retry, so the wait is that of the last attempt
+        stats['wait'].append(max((started_at - run_at).total_seconds(), 0))
+        stats['run'].append((finished_at - started_at).total_seconds())
+    
+    return {
+        'by_status': {status: by_status.get(status, 0) for status in ('pending', 'running', 'done', 'failed')},
+        'due': due,
+        'scheduled': by_status.get('pending', 0) - due,
+        'oldest_due_age_seconds': round((now - oldest_due).total_seconds(), 1) if oldest_due else 0,
+        'window_minutes': window_minutes,
+        'tasks': {
+            type: {
+                'done': stats['done'],
+                'failed': stats['failed'],
+                'wait': _percentiles(stats['wait']),
+                'run': _percentiles(stats['run'])
+            }
+            for type, stats in sorted(tasks.items())
+        }
+    }
+
+class JobRunner:
+    def __init__(self, workers: int = 2, poll_seconds: float = 1.0, lease_seconds: float = 600,
+                 retention_days: float = 7, maintenance_seconds: float = 60):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.retention_days = retention_days
+        self.maintenance_seconds = maintenance_seconds
+        self._threads = []
+        self._lock = threading.Lock()
+        self._next_maintenance = None
+    
+    def start(self, app) -> bool:
+        """
+        Start the worker threads, once per process. Cheap to call again.
+        
+        Recovers jobs abandoned by a previous process before starting.
+        
+        Args:
+            app: The Flask application
+        
+        Returns:
+            Whether this call started the workers
+        """
+        if self._threads or self.workers <= 0:
+            return False
+        with self._lock:
+            if self._threads:
+                return False
+            with app.app_context():
+                self._maintain()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, args=(app,), name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return True
+    
+    def _maintain(self):
+        recovered = recover_stale_jobs()
+        if recovered:
+            logger.warning('Requeued %d job(s) with expired leases', recovered)
+        purge_finished_jobs(self.retention_days)
+        self._next_maintenance = datetime.utcnow() + timedelta(seconds=self.maintenance_seconds)
+    
+    def _work(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    job = claim_job(self.lease_seconds)
+                    if job is not None:
+                        run_job(job)
+                        continue
+                    if datetime.utcnow() >= self._next_maintenance:
+                        self._maintain()
+                except Exception:
+                    logger.exception('Job worker error')
+                finally:
+                    db.session.remove()
+            # Idle: sleep until a job is queued in this process or the next poll
+            _wakeup.wait(self.poll_seconds)
+            _wakeup.clear()
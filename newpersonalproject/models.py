@@ -16,12 +16,20 @@ class User(UserMixin, db.Model):
     is_locked = db.Column(db.Boolean, default=False)
     is_verified = db.Column(db.Boolean, default=False)
     verification_sent_at = db.Column(db.DateTime)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every transaction write
     transactions = db.relationship('Transaction', backref='user', lazy=True)
     activities = db.relationship('UserActivity', backref='user', lazy=True)
 
     def __repr__(self):
         return f'<User {self.email}>'
 
+    @staticmethod
+    def bump_data_version(user_id):
+        """Invalidate anything derived from the user's transactions"""
+        User.query.filter_by(id=user_id).update(
+            {User.data_version: User.data_version + 1}, synchronize_session=False
+        )
+
     def get_verification_token(self):
         """Generate email verification token"""
         serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
@@ -38,10 +46,20 @@ class User(UserMixin, db.Model):
             return None
 
 class Transaction(db.Model):
+    __table_args__ = (
+        # Serves per-user listings in (date desc, id desc) keyset order
+        db.Index('ix_transaction_user_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_transaction_date', 'date'),  # Daily analytics
+        db.Index('ix_transaction_category_amount', 'category', 'amount'),  # Admin category stats
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Float, nullable=False)
     type = db.Column(db.String(10), nullable=False)  # 'income' or 'expense'
     category = db.Column(db.String(50), nullable=False)
+    # 'user' if the user chose the category, 'auto' if it was assigned for them;
+    # NULL on rows from before it was recorded
+    category_source = db.Column(db.String(10))
     note = db.Column(db.String(200))
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -51,6 +69,15 @@ class Transaction(db.Model):
         return f'<Transaction {self.type}: {self.amount}>'
 
 class UserActivity(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_activity_timestamp_user', 'timestamp', 'user_id'),  # Recent activity, daily active users
+        db.Index('ix_user_activity_suspicious_timestamp', 'is_suspicious', 'timestamp'),
+        # Activity log filters, each followed by the timestamp the log is ordered by
+        db.Index('ix_user_activity_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_user_activity_type_timestamp', 'activity_type', 'timestamp'),
+        db.Index('ix_user_activity_ip_timestamp', 'ip_address', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     activity_type = db.Column(db.String(50), nullable=False)  # login, logout, transaction_add, etc.
@@ -64,7 +91,7 @@ class UserActivity(db.Model):
 
 class Analytics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, unique=True, index=True)
     total_users = db.Column(db.Integer, default=0)
     active_users = db.Column(db.Integer, default=0)
     total_transactions = db.Column(db.Integer, default=0)
@@ -75,4 +102,118 @@ class Analytics(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
-        return f'<Analytics {self.date}>' 
\ No newline at end of file
+        return f'<Analytics {self.date}>' 
+
+class CategoryCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    normalized_note = db.Column(db.String(200), unique=True, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    keywords_version = db.Column(db.String(16), nullable=False)  # CATEGORY_KEYWORDS hash at categorization time
+    hit_count = db.Column(db.Integer, default=0)  # Touches, at most one per touch interval
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_hit_at = db.Column(db.DateTime)  # Accurate to the touch interval
+
+    def __repr__(self):
+        return f'<CategoryCache {self.normalized_note}: {self.category}>'
+
+class UserCategorizer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    state = db.Column(db.LargeBinary, nullable=False)  # Compressed naive Bayes counts
+    n_samples = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, default=0)  # Bumped on every update, for cross-worker reloads
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserCategorizer {self.user_id}: {self.n_samples} samples>'
+
+class Forecast(db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'period'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)  # History window in months, 0 for all data
+    cutoff_date = db.Column(db.Date)  # Start of the history window it was computed on
+    data_version = db.Column(db.Integer, nullable=False)  # User.data_version it was computed from
+    total_prediction = db.Column(db.JSON)
+    category_predictions = db.Column(db.JSON)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def is_fresh(self, data_version, cutoff_date):
+        """Whether this forecast still matches the user's data and history window"""
+        return self.data_version == data_version and self.cutoff_date == cutoff_date
+
+    def __repr__(self):
+        return f'<Forecast {self.user_id}/{self.period}: {self.computed_at}>'
+
+class ForecastState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    data_version = db.Column(db.Integer, nullable=False)  # User.data_version the state reflects
+    state = db.Column(db.LargeBinary, nullable=False)  # Pickled IncrementalForecaster
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ForecastState {self.user_id}: v{self.data_version}>'
+
+class MonthlyRollup(db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', 'type', 'category'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    type = db.Column(db.String(10), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    min_amount = db.Column(db.Float, nullable=False)
+    max_amount = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<MonthlyRollup {self.user_id}/{self.month}/{self.type}/{self.category}: {self.total}>'
+
+class AnalyticsCategory(db.Model):
+    __table_args__ = (db.UniqueConstraint('date', 'category'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)  # Transactions dated that day
+
+    def __repr__(self):
+        return f'<AnalyticsCategory {self.date}/{self.category}: {self.count}>'
+
+class Job(db.Model):
+    __table_args__ = (
+        # Claiming the next due job, and finished-job metrics/purging
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        db.Index('ix_job_status_finished_at', 'status', 'finished_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(100), nullable=False)  # Registered background task name
+    payload = db.Column(db.Text, nullable=False)  # JSON {'args': [...], 'kwargs': {...}}
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not claimed before this
+    locked_until = db.Column(db.DateTime)  # Lease of the worker running it
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.type}: {self.status}>'
+
+class AggregateCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False)
+    value = db.Column(db.Text)  # JSON, None until first computed
+    computed_at = db.Column(db.DateTime)
+    generation = db.Column(db.Integer, nullable=False, default=0)  # Bumped by writes that invalidate the value
+    value_generation = db.Column(db.Integer)  # Generation the value was computed at
+    refreshing_until = db.Column(db.DateTime)  # Lease of the worker recomputing it
+
+    def __repr__(self):
+        return f'<AggregateCache {self.key}: {self.computed_at}>'
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Per-user monthly rollups of transactions.
+
+MonthlyRollup keeps sum, count, min and max per (user, month, type,
+category). It is updated in the same database transaction as every
+transaction write, so dashboard and forecast queries read a few rows per
+month instead of re-aggregating raw transactions. Only the partial months
+at the edges of a date range are aggregated from the Transaction table.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import MonthlyRollup, Transaction
+
+ROLLUP_COLUMNS = ['user_id', 'month', 'type', 'category', 'total', 'count', 'min_amount', 'max_amount']
+
+def month_key(day: date) -> str:
+    return day.strftime('%Y-%m')
+
+def month_bounds(month: str) -> Tuple[date, date]:
+    year, month_num = int(month[:4]), int(month[5:])
+    return date(year, month_num, 1), date(year, month_num, monthrange(year, month_num)[1])
+
+def _raw_aggregates(*filters):
+    # Same shape as a rollup row, computed from the Transaction table
+    month = func.strftime('%Y-%m', Transaction.date)
+    return select(
+        Transaction.user_id,
+        month.label('month'),
+        Transaction.type,
+        Transaction.category,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id),
+        func.min(Transaction.amount),
+        func.max(Transaction.amount)
+    ).where(*filters).group_by(Transaction.user_id, month, Transaction.type, Transaction.category)
+
+def apply_transaction(transaction: Transaction, sign: int):
+    """
+    Update the rollup for an added or deleted transaction, in the caller's database transaction.
+    
+    Args:
+        transaction: The added or deleted transaction
+        sign: 1 for an added transaction, -1 for a deleted one
+    """
+    month = month_key(transaction.date)
+    amount = transaction.amount
+    
+    if sign > 0:
+        stmt = insert(MonthlyRollup).values(
+            user_id=transaction.user_id,
+            month=month,
+            type=transaction.type,
+            category=transaction.category,
+            total=amount,
+            count=1,
+            min_amount=amount,
+            max_amount=amount
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MonthlyRollup.user_id, MonthlyRollup.month, MonthlyRollup.type, MonthlyRollup.category],
+            set_={
+                'total': MonthlyRollup.total + stmt.excluded.total,
+                'count': MonthlyRollup.count + 1,
+                'min_amount': func.min(MonthlyRollup.min_amount, stmt.excluded.min_amount),
+                'max_amount': func.max(MonthlyRollup.max_amount, stmt.excluded.max_amount),
+            }
+        )
+        db.session.execute(stmt)
+        return
+    
+    # The deleted row must be gone before the extrema are re-read
+    db.session.flush()
+    key = (
+        MonthlyRollup.user_id == transaction.user_id,
+        MonthlyRollup.month == month,
+        MonthlyRollup.type == transaction.type,
+        MonthlyRollup.category == transaction.category
+    )
+    MonthlyRollup.query.filter(*key).update({
+        MonthlyRollup.total: MonthlyRollup.total - amount,
+        MonthlyRollup.count: MonthlyRollup.count - 1
+    }, synchronize_session=False)
+    if MonthlyRollup.query.filter(*key, MonthlyRollup.count <= 0).delete(synchronize_session=False):
+        return
+    
+    # Only the raw rows know the next smallest/largest amount
+    first_day, last_day = month_bounds(month)
+    remaining = select(Transaction.amount).where(
+        Transaction.user_id == transaction.user_id,
+        Transaction.date >= first_day,
+        Transaction.date <= last_day,
+        Transaction.type == transaction.type,
+        Transaction.category == transaction.category
+    ).subquery()
+    MonthlyRollup.query.filter(*key, or_(
+        MonthlyRollup.min_amount >= amount, MonthlyRollup.max_amount <= amount
+    )).update({
+        MonthlyRollup.min_amount: select(func.min(remaining.c.amount)).scalar_subquery(),
+        MonthlyRollup.max_amount: select(func.max(remaining.c.amount)).scalar_subquery()
+    }, synchronize_session=False)
+
+def refresh_rollup_months(user_months: Iterable[Tuple[int, str]]):
+    """
+    Recompute the rollup of whole user months from raw transactions, in the caller's database transaction.
+    
+    For bulk writes (re-categorization, imports) where per-row updates would
+    cost more than re-aggregating the months they touched.
+    
+    Args:
+        user_months: (user_id, 'YYYY-MM') pairs to recompute
+    """
+    db.session.flush()
+    for user_id, month in sorted(set(user_months)):
+        first_day, last_day = month_bounds(month)
+        MonthlyRollup.query.filter_by(user_id=user_id, month=month).delete(synchronize_session=False)
+        db.session.execute(insert(MonthlyRollup).from_select(ROLLUP_COLUMNS, _raw_aggregates(
+            Transaction.user_id == user_id,
+            Transaction.date >= first_day,
+            Transaction.date <= last_day
+        )))
+
+def rebuild_rollups(user_id: Optional[int] = None) -> int:
+    """
+    Rebuild the rollup from raw transactions and commit.
+    
+    Args:
+        user_id: Only rebuild this user, defaults to everyone
+    
+    Returns:
+        Number of rollup rows written
+    """
+    filters = [Transaction.user_id == user_id] if user_id is not None else []
+    rollups = MonthlyRollup.query
+    if user_id is not None:
+        rollups = rollups.filter_by(user_id=user_id)
+    rollups.delete(synchronize_session=False)
+    result = db.session.execute(insert(MonthlyRollup).from_select(ROLLUP_COLUMNS, _raw_aggregates(*filters)))
+    db.session.commit()
+    return result.rowcount
+
+def check_rollups(user_id: Optional[int] = None, tolerance: float = 1e-6) -> List[Dict]:
+    """
+    Diff the rollup against aggregates of the raw transactions.
+    
+    Args:
+        user_id: Only check this user, defaults to everyone
+        tolerance: Allowed relative difference of the float columns
+    
+    Returns:
+        One dict per mismatching (user, month, type, category), empty if consistent
+    """
+    filters = [Transaction.user_id == user_id] if user_id is not None else []
+    expected = {tuple(row[:4]): tuple(row[4:]) for row in db.session.execute(_raw_aggregates(*filters))}
+    
+    rollups = db.session.query(*[getattr(MonthlyRollup, column) for column in ROLLUP_COLUMNS])
+    if user_id is not None:
+        rollups = rollups.filter(MonthlyRollup.user_id == user_id)
+    actual = {tuple(row[:4]): tuple(row[4:]) for row in rollups}
+    
+    def matches(a, b):
+        return a[1] == b[1] and all(
+            abs(x - y) <= tolerance * max(1.0, abs(y)) for x, y in zip(a[:1] + a[2:], b[:1] + b[2:])
+        )
+    
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        if key in expected and key in actual and matches(actual[key], expected[key]):
+            continue
+        mismatches.append({
+            'user_id': key[0],
+            'month': key[1],
+            'type': key[2],
+            'category': key[3],
+            'rollup': actual.get(key),
+            'raw': expected.get(key)
+        })
+    return mismatches
+
+def rollup_row_queries(user_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                       transaction_type: Optional[str] = None) -> List:
+    """
+    Build the queries for per-month, per-category aggregates of a date range.
+    
+    Whole months come from the rollup; partial months at either edge of the
+    range are aggregated from raw transactions.
+    
+    Args:
+        user_id: ID of the user
+        start_date: First day of the range, None for unbounded
+        end_date: Last day of the range, None for unbounded
+        transaction_type: Only include this type, e.g. 'expense'
+    
+    Returns:
+        Selects of (user_id, month, type, category, total, count, min, max) rows
+    """
+    raw_ranges = []
+    first_month = last_month = None
+    
+    if start_date is not None:
+        first_month = month_key(start_date)
+        if start_date.day != 1:
+            # Partial first month
+            _, month_end = month_bounds(first_month)
+            raw_ranges.append((start_date, min(month_end, end_date) if end_date else month_end))
+            first_month = month_key(month_end + timedelta(days=1))
+    
+    if end_date is not None:
+        month_start, month_end = month_bounds(month_key(end_date))
+        if end_date == month_end:
+            last_month = month_key(end_date)
+        else:
+            # Partial last month, unless the first month's slice already covers it
+            if not raw_ranges or raw_ranges[0][0] < month_start:
+                raw_ranges.append((max(month_start, start_date) if start_date else month_start, end_date))
+            last_month = month_key(month_start - timedelta(days=1))
+    
+    queries = []
+    if first_month is None or last_month is None or first_month <= last_month:
+        query = select(*[getattr(MonthlyRollup, column) for column in ROLLUP_COLUMNS]).where(
+            MonthlyRollup.user_id == user_id
+        )
+        if first_month is not None:
+            query = query.where(MonthlyRollup.month >= first_month)
+        if last_month is not None:
+            query = query.where(MonthlyRollup.month <= last_month)
+        if transaction_type is not None:
+            query = query.where(MonthlyRollup.type == transaction_type)
+        queries.append(query)
+    
+    for range_start, range_end in raw_ranges:
+        if range_start > range_end:
+            continue
+        filters = [Transaction.user_id == user_id, Transaction.date >= range_start, Transaction.date <= range_end]
+        if transaction_type is not None:
+            filters.append(Transaction.type == transaction_type)
+        queries.append(_raw_aggregates(*filters))
+    
+    return queries
+
+def get_rollup_rows(user_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                    transaction_type: Optional[str] = None) -> List[Tuple]:
+    """
+    Get per-month, per-category aggregates for a date range.
+    
+    Args:
+        user_id: ID of the user
+        start_date: First day of the range, None for unbounded
+        end_date: Last day of the range, None for unbounded
+        transaction_type: Only include this type, e.g. 'expense'
+    
+    Returns:
+        (month, type, category, total, count, min, max) tuples ordered by month, type and category
+    """
+    rows = []
+    for query in rollup_row_queries(user_id, start_date, end_date, transaction_type):
+        rows.extend(tuple(row[1:]) for row in db.session.execute(query))
+    return sorted(rows, key=lambda row: row[:3])
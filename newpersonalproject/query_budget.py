@@ -0,0 +1,98 @@
+"""
+Per-request SQL query budgets.
+
+A single before_cursor_execute listener counts the statements run by the
+current thread while a QueryCounter is active. Views decorated with
+@query_budget(n) that run more than n statements, template rendering
+included, log a warning, or raise QueryBudgetExceeded when
+QUERY_BUDGET_STRICT is set (the default under TESTING). An N+1 regression,
+such as a template walking a lazy relationship per row, then fails the
+test run instead of reaching production.
+
+count_queries() is the same counter as a context manager, for asserting
+bounds around test client calls.
+"""
+import threading
+from functools import wraps
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import event
+
+from extensions import db
+
+# Counters active in the current thread, innermost last
+_local = threading.local()
+_listening = set()
+_listen_lock = threading.Lock()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+
+def _listen(engine):
+    # Install the listener once per engine; it's a no-op for threads without a counter
+    with _listen_lock:
+        if engine not in _listening:
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            _listening.add(engine)
+
+class QueryCounter:
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.count = 0
+        self.statements: List[str] = []
+    
+    def __enter__(self) -> 'QueryCounter':
+        _listen(self.engine or db.engine)
+        if not hasattr(_local, 'counters'):
+            _local.counters = []
+        _local.counters.append(self)
+        return self
+    
+    def __exit__(self, *exc_info):
+        _local.counters.remove(self)
+
+def count_queries(engine=None) -> QueryCounter:
+    """
+    Count the SQL statements the current thread runs inside a with block.
+    
+    Args:
+        engine: Engine to watch, defaults to the app's
+    
+    Returns:
+        A QueryCounter; read .count and .statements after the block
+    """
+    return QueryCounter(engine)
+
+def query_budget(max_queries: int, strict: Optional[bool] = None):
+    """
+    Cap the SQL statements a view may run.
+    
+    Args:
+        max_queries: Most statements the view, including its template, may run
+        strict: Raise instead of logging when exceeded, defaults to the
+            QUERY_BUDGET_STRICT setting
+    
+    Returns:
+        The view decorator
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with count_queries() as counter:
+                response = f(*args, **kwargs)
+            if counter.count > max_queries:
+                message = (f'{f.__name__} ran {counter.count} queries, over its budget of {max_queries}:\n'
+                           + '\n'.join(counter.statements))
+                if strict if strict is not None else current_app.config.get('QUERY_BUDGET_STRICT', current_app.testing):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
@@ -0,0 +1,57 @@
+"""
+Query-plan regression check for the hot queries.
+
+The statements come from the same query builders the app executes, so a
+change to one of them is checked as soon as it is made. check_query_plans
+runs EXPLAIN QUERY PLAN on each and reports any that fall back to a full
+table scan, e.g. after a dropped index or a filter that wraps an indexed
+column in a function.
+"""
+import re
+from typing import Dict, List, Mapping, Optional, Set
+
+from extensions import db
+
+# 'SCAN <table>' visits every row, even when it walks an index in order or
+# reads a covering index instead of the table; only 'SEARCH' seeks
+_FULL_SCAN = re.compile(r'^SCAN (\S+)')
+
+def explain(statement) -> List[str]:
+    """
+    Get SQLite's query plan for a statement.
+    
+    Args:
+        statement: A SQLAlchemy select or ORM query
+    
+    Returns:
+        The plan's detail lines
+    """
+    statement = getattr(statement, 'statement', statement)  # ORM queries wrap their select
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return [row[-1] for row in rows]
+
+def check_query_plans(queries: Mapping[str, object],
+                      allowed_scans: Optional[Mapping[str, Set[str]]] = None) -> Dict[str, Dict]:
+    """
+    Explain every hot query and flag full table scans. Must run in an app context.
+    
+    Args:
+        queries: Dict of query name -> select or ORM query
+        allowed_scans: Dict of query name -> tables it is expected to scan,
+            for queries that report on every row of a table or stop
+            early on an index walked in order
+    
+    Returns:
+        Dict of query name -> {'plan': detail lines, 'full_scans': scanned tables}
+    """
+    allowed_scans = allowed_scans or {}
+    results = {}
+    for name, statement in queries.items():
+        plan = explain(statement)
+        scans = [match.group(1) for match in map(_FULL_SCAN.match, plan) if match]
+        results[name] = {
+            'plan': plan,
+            'full_scans': [table for table in scans if table not in allowed_scans.get(name, set())]
+        }
+    return results
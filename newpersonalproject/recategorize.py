@@ -0,0 +1,208 @@
+"""
+Bulk re-categorization of 'Uncategorized' transactions.
+
+After CATEGORY_KEYWORDS or the NLP model improve, historical rows stuck at
+'Uncategorized' are streamed in keyset-paginated chunks, categorized in a
+process pool and written back with bulk UPDATEs, one transaction per chunk.
+Progress is checkpointed so an interrupted run picks up where it left off.
+
+The pool needs the categorization service (CATEGORIZER_SOCKET): pool
+processes are then only its clients, so the parallelism covers the keyword
+rules while the one shared model batches their notes. Without the service
+each process would load its own copy of the transformer, so the run
+stays in one process.
+"""
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, update
+
+import expense_categorizer
+from extensions import db
+from models import Transaction, User
+from expense_categorizer import CategorizerUnavailable, categorize_expenses, predict_zero_shot
+from daily_analytics import record_transactions
+from monthly_rollup import refresh_rollup_months
+
+def _categorize_chunk(chunk: List[Tuple[int, str]], timeout: Optional[float]) -> Tuple[List[Tuple[int, str]], int]:
+    # Returns the (id, category) results, and how many rows were left
+    # Uncategorized because the model failed on the notes the rules can't place
+    notes = [note for _, note in chunk]
+    categories = categorize_expenses(notes)
+    
+    # The whole chunk goes to the model in one call, it batches internally
+    pending = list(dict.fromkeys(
+        note for note, category in zip(notes, categories) if note and category == 'Uncategorized'
+    ))
+    skipped = 0
+    if pending:
+        try:
+            predicted = dict(zip(pending, predict_zero_shot(pending, timeout)))
+            categories = [predicted.get(note, category) for note, category in zip(notes, categories)]
+        except CategorizerUnavailable:
+            skipped = sum(bool(note) and category == 'Uncategorized' for note, category in zip(notes, categories))
+    return [(transaction_id, category) for (transaction_id, _), category in zip(chunk, categories)], skipped
+
+def _load_checkpoint(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)['last_id']
+
+def _save_checkpoint(path: Optional[str], last_id: int):
+    if not path:
+        return
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id}, f)
+    os.replace(tmp_path, path)
+
+def _fetch_chunk(after_id: int, chunk_size: int) -> List[Tuple[int, str]]:
+    rows = db.session.query(Transaction.id, Transaction.note).filter(
+        Transaction.category == 'Uncategorized',
+        Transaction.id > after_id
+    ).order_by(Transaction.id.asc()).limit(chunk_size).all()
+    return [(row.id, row.note) for row in rows]
+
+def _write_chunk(results: List[Tuple[int, str]], invalidate: Optional[Callable[[], None]] = None) -> int:
+    changes = [
+        {'transaction_id': transaction_id, 'new_category': category}
+        for transaction_id, category in results if category != 'Uncategorized'
+    ]
+    if changes:
+        new_categories = {change['transaction_id']: change['new_category'] for change in changes}
+        # Today's analytics count per category too; only rows dated today matter there
+        today_rows = db.session.query(Transaction.id, Transaction.date, Transaction.type, Transaction.amount).filter(
+            Transaction.id.in_(new_categories),
+            Transaction.category == 'Uncategorized',
+            Transaction.date == datetime.now().date()
+        ).all()
+        
+        # Only touch rows still 'Uncategorized', in case a user edited one meanwhile
+        stmt = update(Transaction.__table__).where(and_(
+            Transaction.__table__.c.id == bindparam('transaction_id'),
+            Transaction.__table__.c.category == 'Uncategorized'
+        )).values(category=bindparam('new_category'), category_source='auto')
+        db.session.execute(stmt, changes)
+        
+        # Move the amounts to the new categories in today's analytics
+        record_transactions([(row.date, row.type, 'Uncategorized', row.amount) for row in today_rows], -1)
+        record_transactions([(row.date, row.type, new_categories[row.id], row.amount) for row in today_rows], 1)
+        
+        # Re-aggregate the rollup months the moved amounts belong to
+        changed_ids = [change['transaction_id'] for change in changes]
+        refresh_rollup_months(db.session.query(
+            Transaction.user_id, func.strftime('%Y-%m', Transaction.date)
+        ).filter(Transaction.id.in_(changed_ids)).distinct())
+        
+        # Categories feed the forecasts, invalidate them for the affected users
+        User.query.filter(
+            User.id.in_(db.session.query(Transaction.user_id).filter(Transaction.id.in_(changed_ids)))
+        ).update({User.data_version: User.data_version + 1}, synchronize_session=False)
+        if invalidate:
+            invalidate()
+    db.session.commit()
+    return len(changes)
+
+def recategorize_transactions(chunk_size: int = 1000, workers: Optional[int] = None,
+                              dry_run: bool = False, checkpoint_path: Optional[str] = None,
+                              restart: bool = False, timeout: Optional[float] = 600,
+                              report: Callable[[str], None] = print,
+                              invalidate: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    Re-categorize every 'Uncategorized' transaction. Must run in an app context.
+    
+    Args:
+        chunk_size: Rows fetched, categorized and committed together
+        workers: Categorization processes, defaults to the CPU count with
+            CATEGORIZER_SOCKET set and to 1 without
+        dry_run: Only summarize the changes per category, write nothing
+        checkpoint_path: File recording the last processed transaction id
+        restart: Ignore an existing checkpoint and start from the beginning
+        timeout: Seconds to wait for the model per chunk, forever if None. Much
+            longer than the interactive CATEGORIZER_TIMEOUT, a chunk is thousands of notes
+        report: Callback receiving progress lines
+        invalidate: Called in the database transaction of each chunk that
+            changes rows, to invalidate caches of per-category aggregates
+    
+    Returns:
+        Dict with rows scanned, rows updated, chunks and rows the model could not
+        categorize, elapsed seconds and per-category changes
+    
+    Raises:
+        ValueError: If workers > 1 without CATEGORIZER_SOCKET
+    """
+    if not expense_categorizer.CATEGORIZER_SOCKET:
+        if workers and workers > 1:
+            raise ValueError('More than one worker needs CATEGORIZER_SOCKET, '
+                             'or every worker loads its own copy of the model')
+        workers = 1
+    workers = workers or os.cpu_count() or 1
+    last_id = 0 if restart else _load_checkpoint(checkpoint_path)
+    if last_id:
+        report(f'Resuming after transaction {last_id}')
+    
+    changes = Counter()
+    scanned = updated = skipped_chunks = skipped_rows = 0
+    categorize_chunk = partial(_categorize_chunk, timeout=timeout)
+    started = time.monotonic()
+    pool = Pool(workers) if workers > 1 else None
+    
+    try:
+        while True:
+            # Read one chunk per worker, then categorize them in parallel
+            chunks = []
+            for _ in range(workers):
+                chunk = _fetch_chunk(last_id, chunk_size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                last_id = chunk[-1][0]
+            if not chunks:
+                break
+            
+            if pool:
+                results = pool.map(categorize_chunk, chunks)
+            else:
+                results = [categorize_chunk(chunk) for chunk in chunks]
+            
+            for chunk_results, skipped in results:
+                scanned += len(chunk_results)
+                if skipped:
+                    # Rule matches are still written, the rest stays for a later run
+                    skipped_chunks += 1
+                    skipped_rows += skipped
+                changes.update(category for _, category in chunk_results if category != 'Uncategorized')
+                if not dry_run:
+                    updated += _write_chunk(chunk_results, invalidate)
+                    _save_checkpoint(checkpoint_path, chunk_results[-1][0])
+            
+            elapsed = time.monotonic() - started
+            report(f'{scanned} rows scanned, {updated} updated, {scanned / elapsed:.0f} rows/sec'
+                   + (f', {skipped_chunks} chunks the model failed on' if skipped_chunks else ''))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    
+    if not dry_run and checkpoint_path and os.path.exists(checkpoint_path):
+        # Finished cleanly, the next run should start over
+        os.remove(checkpoint_path)
+    
+    elapsed = time.monotonic() - started
+    return {
+        'scanned': scanned,
+        'updated': updated,
+        'skipped_chunks': skipped_chunks,
+        'skipped_rows': skipped_rows,
+        'elapsed': elapsed,
+        'rows_per_sec': scanned / elapsed if elapsed else 0,
+        'changes': dict(changes.most_common())
+    }
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+import pytest
+from flask.testing import FlaskClient
+from werkzeug.security import generate_password_hash
+
+# The app's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read by app.py at import: an in-memory database, background tasks run
+# inline, and no scheduled jobs
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['JOB_WORKERS'] = '0'
+os.environ['ANALYTICS_REFRESH_MINUTES'] = '0'
+os.environ['FORECAST_SCHEDULE_HOURS'] = '0'
+
+class RequestScopedClient(FlaskClient):
+    # Each request gets its own app context, as in production, so flask.g
+    # (Flask-Login's cached current_user) and the db session don't carry
+    # over from the test's own app context
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+@pytest.fixture
+def app():
+    import app as app_module
+    from extensions import db
+    
+    flask_app = app_module.app
+    flask_app.config.update(TESTING=True, MAIL_SUPPRESS_SEND=True)
+    flask_app.test_client_class = RequestScopedClient
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    
+    # In-process tiers would otherwise leak entries keyed by reused ids
+    app_module.category_cache.clear()
+    app_module.user_categorizers._models.clear()
+    app_module.user_categorizers._queued.clear()
+    app_module.admin_cache._entries.clear()
+
+@pytest.fixture
+def make_user(app):
+    from extensions import db
+    from models import User
+    
+    def make_user(email='user@example.com', is_admin=False):
+        user = User(name=email.split('@')[0], email=email, password_hash=generate_password_hash('password', method='pbkdf2:sha256:1000'),
+                    is_verified=True, is_admin=is_admin)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+@pytest.fixture
+def query_counter(app):
+    # `with query_counter() as queries:` counts the statements run inside,
+    # test client requests included; read queries.count and queries.statements
+    from query_budget import count_queries
+    return count_queries
+
+@pytest.fixture
+def login(app):
+    def login(user):
+        client = app.test_client()
+        response = client.post('/login', data={'email': user.email, 'password': 'password'})
+        assert response.status_code == 302
+        return client
+    return login
+
+class FakeClassifier:
+    """Stand-in for the zero-shot pipeline: ranks 'Education' first for every note"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+    
+    def __call__(self, notes, candidate_labels):
+        self.calls.append(list(notes))
+        time.sleep(self.delay)
+        labels = ['Education'] + [label for label in candidate_labels if label != 'Education']
+        return [{'labels': labels, 'scores': [1.0] + [0.0] * (len(labels) - 1)} for _ in notes]
+
+@pytest.fixture
+def fake_classifier():
+    return FakeClassifier
+
+@pytest.fixture
+def in_process_model(fake_classifier, monkeypatch):
+    # Serves a stand-in classifier as the in-process model; returns it
+    import expense_categorizer
+    
+    def install(delay=0.0):
+        classifier = fake_classifier(delay)
+        monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_SOCKET', None)
+        monkeypatch.setattr(expense_categorizer, '_batcher', expense_categorizer.create_batcher(classifier))
+        return classifier
+    return install
@@ -0,0 +1,20 @@
+from aggregate_cache import AggregateCache, refresh_aggregate
+from jobs import run_pending_jobs
+from models import Job
+
+def test_stale_value_is_served_while_one_job_refreshes_it(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOB_WORKERS', 1)
+    monkeypatch.setattr('aggregate_cache._registry', {})
+    values = iter([1, 2])
+    # Stale as soon as it is stored, served stale for a minute
+    cache = AggregateCache(ttl_seconds=0, stale_seconds=60)
+    cache.register('totals', lambda: next(values))
+    
+    assert cache.get('totals', lambda: next(values)) == 1
+    assert cache.get('totals', lambda: next(values)) == 1
+    assert cache.get('totals', lambda: next(values)) == 1
+    
+    assert Job.query.filter_by(type=refresh_aggregate.name).count() == 1
+    assert run_pending_jobs() == 1
+    assert cache.get('totals', lambda: next(values)) == 2
+    assert cache.stats()['stale_hits'] == 3
@@ -0,0 +1,65 @@
+import json
+from datetime import date, datetime, timedelta
+
+import batch_forecast
+import app as app_module
+from batch_forecast import forecast_all_users, forecast_users_job, schedule_forecasts
+from extensions import db
+from jobs import run_pending_jobs
+from models import Forecast, Job, Transaction
+
+def add_users_with_history(make_user, count):
+    users = [make_user(f'user{i}@example.com') for i in range(count)]
+    for user in users:
+        for months_ago in range(3):
+            db.session.add(Transaction(user_id=user.id, amount=100, type='expense', category='Housing',
+                                       note='rent', date=date.today() - timedelta(days=30 * months_ago)))
+    db.session.commit()
+    return users
+
+def pending_forecast_jobs():
+    return Job.query.filter_by(type=forecast_users_job.name, status='pending').order_by(Job.id).all()
+
+def run_due(job):
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    return run_pending_jobs()
+
+def test_schedule_queues_one_sweep_an_interval_ahead(app):
+    job = schedule_forecasts(6)
+    
+    assert json.loads(job.payload)['args'] == [6, 12, 0, 200]
+    assert job.run_at > datetime.utcnow() + timedelta(hours=5)
+    assert schedule_forecasts(6) is None
+    assert len(pending_forecast_jobs()) == 1
+
+def test_sweep_runs_chunk_by_chunk_in_the_worker(app, make_user, monkeypatch):
+    # Jobs never fork a pool from the web process
+    monkeypatch.setattr(batch_forecast, 'Pool', None)
+    users = add_users_with_history(make_user, 5)
+    make_user('idle@example.com')
+    
+    # Two full chunks continue right away, the last one queues the next sweep
+    assert run_due(schedule_forecasts(6, chunk_size=2)) == 3
+    
+    assert sorted(forecast.user_id for forecast in Forecast.query) == sorted(user.id for user in users)
+    [next_sweep] = pending_forecast_jobs()
+    assert json.loads(next_sweep.payload)['args'] == [6, 12, 0, 2]
+    assert next_sweep.run_at > datetime.utcnow() + timedelta(hours=5)
+
+def test_cli_sweep_matches_the_job_chain(app, make_user):
+    users = add_users_with_history(make_user, 3)
+    
+    result = forecast_all_users(workers=1, chunk_size=2, report=lambda line: None)
+    
+    assert result['users'] == 3
+    assert Forecast.query.count() == len(users)
+
+def test_first_request_of_a_process_schedules_the_sweep(app, monkeypatch):
+    monkeypatch.setattr(app_module.job_runner, 'start', lambda app: True)
+    monkeypatch.setitem(app.config, 'FORECAST_SCHEDULE_HOURS', 6)
+    
+    app.test_client().get('/login')
+    app.test_client().get('/login')
+    
+    assert len(pending_forecast_jobs()) == 1
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from categorization_cache import CategorizationCache
+from extensions import db
+from models import CategoryCache
+
+@pytest.fixture
+def cache(app):
+    cache = CategorizationCache(categorize=lambda note: 'Education',
+                                categorize_batch=lambda notes: ['Education'] * len(notes))
+    cache.categorize('vedantu subscription')
+    cache.categorize_many(['byjus course'])
+    return cache
+
+def writes(queries):
+    return [statement for statement in queries.statements if not statement.lstrip().upper().startswith('SELECT')]
+
+def test_db_hits_within_the_touch_interval_are_reads(cache, query_counter):
+    for note in ('vedantu subscription', 'byjus course'):
+        cache.clear()
+        assert cache.lookup(note) == 'Education'  # First hit stamps last_hit_at
+    
+    for _ in range(3):
+        cache.clear()
+        with query_counter() as queries:
+            assert cache.lookup('vedantu subscription') == 'Education'
+            assert cache.categorize_many(['byjus course', 'Vedantu  Subscription']) == ['Education', 'Education']
+        assert writes(queries) == []
+    
+    assert cache.stats()['db_hits'] == 2 + 3 * 2
+    assert [entry.hit_count for entry in CategoryCache.query.order_by(CategoryCache.id)] == [1, 1]
+
+def test_hits_after_the_touch_interval_update_the_entry(cache):
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    CategoryCache.query.update({CategoryCache.last_hit_at: long_ago})
+    db.session.commit()
+    
+    cache.clear()
+    assert cache.categorize_many(['vedantu subscription', 'byjus course']) == ['Education', 'Education']
+    
+    for entry in CategoryCache.query:
+        assert entry.hit_count == 1
+        assert entry.last_hit_at > long_ago + timedelta(days=1)
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as app_module
+import expense_categorizer
+from extensions import db
+from jobs import enqueue, run_pending_jobs
+from models import Job, Transaction
+
+@pytest.fixture
+def model_down(monkeypatch):
+    monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_SOCKET', None)
+    monkeypatch.setattr(expense_categorizer, 'get_batcher', lambda: None)
+
+def add_pending(user, note='vedantu subscription'):
+    transaction = Transaction(user_id=user.id, amount=10, type='expense', date=date.today(),
+                              note=note, category='Uncategorized')
+    db.session.add(transaction)
+    db.session.commit()
+    job = enqueue(app_module.categorize_transaction.name, [transaction.id],
+                  max_attempts=app_module.categorize_transaction.max_attempts)
+    return transaction.id, job.id
+
+def retry_now(job_id):
+    db.session.get(Job, job_id).run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_unavailable_model_leaves_the_job_to_be_retried(app, make_user, model_down):
+    transaction_id, job_id = add_pending(make_user())
+    
+    assert run_pending_jobs() == 1
+    
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.attempts) == ('pending', 1)
+    assert job.run_at > datetime.utcnow()
+    assert 'CategorizerUnavailable' in job.last_error
+    assert db.session.get(Transaction, transaction_id).category == 'Uncategorized'
+    # Not pinned in the cache either, the next attempt asks the model again
+    assert app_module.category_cache.lookup('vedantu subscription') is None
+
+def test_job_fails_after_max_attempts(app, make_user, model_down):
+    _, job_id = add_pending(make_user())
+    
+    for _ in range(app_module.categorize_transaction.max_attempts):
+        retry_now(job_id)
+        assert run_pending_jobs() == 1
+    
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.attempts) == ('failed', app_module.categorize_transaction.max_attempts)
+
+def test_retry_categorizes_once_the_model_is_back(app, make_user, model_down, in_process_model, monkeypatch):
+    transaction_id, job_id = add_pending(make_user())
+    run_pending_jobs()
+    
+    monkeypatch.undo()
+    in_process_model()
+    retry_now(job_id)
+    assert run_pending_jobs() == 1
+    
+    assert db.session.get(Job, job_id).status == 'done'
+    transaction = db.session.get(Transaction, transaction_id)
+    assert (transaction.category, transaction.category_source) == ('Education', 'auto')
+
+def test_inline_failure_does_not_fail_the_request(app, make_user, login, model_down):
+    client = login(make_user())
+    
+    response = client.post('/add_transaction', data={'amount': '10', 'type': 'expense', 'category': '',
+                                                      'note': 'vedantu subscription', 'date': date.today().isoformat()})
+    
+    assert response.status_code == 302
+    assert Transaction.query.one().category == 'Uncategorized'
+
+def test_interactive_categorization_still_falls_back(app, model_down):
+    assert expense_categorizer.categorize_expense_nlp('vedantu subscription') == 'Uncategorized'
+    assert expense_categorizer.categorize_expense_nlp('taxi to the airport') == 'Transportation'
+    with pytest.raises(expense_categorizer.CategorizerUnavailable):
+        expense_categorizer.categorize_expense_strict('vedantu subscription')
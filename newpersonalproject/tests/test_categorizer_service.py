@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+import expense_categorizer
+from categorizer_service import CategorizationServer, create_server, request_categories
+
+@pytest.fixture
+def socket_dir():
+    # Unix socket paths are limited to ~100 bytes, pytest's tmp_path can be longer
+    path = tempfile.mkdtemp(prefix='cat-')
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+def serve(socket_path, classifier):
+    server = create_server(socket_path, classifier=classifier)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+@pytest.fixture
+def service(socket_dir, monkeypatch):
+    # Yields a function starting the service with a given classifier
+    servers = []
+    socket_path = f'{socket_dir}/categorizer.sock'
+    monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_SOCKET', socket_path)
+    
+    def start(classifier):
+        servers.append(serve(socket_path, classifier))
+        return socket_path
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_service_up_categorizes_with_the_served_model(service, fake_classifier):
+    classifier = fake_classifier()
+    service(classifier)
+    
+    assert expense_categorizer.categorize_expense_nlp('xyzzy') == 'Education'
+    assert expense_categorizer.categorize_expenses_nlp(['qwerty', 'lunch', 'qwerty', '']) == \
+        ['Education', 'Food & Dining', 'Education', 'Uncategorized']
+    # Keyword matches and repeated notes never reach the model
+    assert sorted(note for call in classifier.calls for note in call) == ['qwerty', 'xyzzy']
+
+def test_service_batches_notes_from_concurrent_clients(service, fake_classifier):
+    classifier = fake_classifier(delay=0.05)
+    socket_path = service(classifier)
+    
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(request_categories([f'note {i}'], socket_path, 5)))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == [['Education']] * 8
+    assert len(classifier.calls) < 8
+
+def test_service_down_falls_back_to_rules(socket_dir, monkeypatch):
+    monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_SOCKET', f'{socket_dir}/missing.sock')
+    
+    assert expense_categorizer.categorize_expense_nlp('xyzzy') == 'Uncategorized'
+    assert expense_categorizer.categorize_expense_nlp('taxi to airport') == 'Transportation'
+    assert expense_categorizer.categorize_expenses_nlp(['xyzzy', 'gym']) == ['Uncategorized', 'Health & Wellness']
+
+def test_service_timeout_falls_back_to_rules(service, fake_classifier, monkeypatch):
+    service(fake_classifier(delay=1.0))
+    monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_TIMEOUT', 0.1)
+    
+    started = time.monotonic()
+    assert expense_categorizer.categorize_expense_nlp('xyzzy') == 'Uncategorized'
+    assert expense_categorizer.categorize_expenses_nlp(['xyzzy', 'rent']) == ['Uncategorized', 'Housing']
+    assert time.monotonic() - started < 0.9
+
+def test_response_to_a_client_that_gave_up_is_dropped(service, fake_classifier, monkeypatch, caplog):
+    errors = []
+    monkeypatch.setattr(CategorizationServer, 'handle_error', lambda self, request, address: errors.append(address))
+    classifier = fake_classifier(delay=0.3)
+    socket_path = service(classifier)
+    
+    caplog.set_level('DEBUG', logger='categorizer_service')
+    with pytest.raises(OSError):
+        request_categories(['xyzzy'], socket_path, 0.05)
+    time.sleep(0.5)  # The handler writes once the model answers
+    
+    assert classifier.calls == [['xyzzy']]
+    assert errors == []
+    assert 'Client disconnected' in caplog.text
@@ -0,0 +1,77 @@
+from datetime import date
+
+import pytest
+
+from models import Transaction
+
+ENDPOINTS = ['/api/dashboard-data?range=month', '/api/forecast?period=12']
+
+def add_transaction(client, amount='12.50'):
+    client.post('/add_transaction', data={'amount': amount, 'type': 'expense', 'category': 'Food & Dining',
+                                          'note': 'lunch', 'date': date.today().isoformat()})
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_matching_etag_gets_304_before_any_query(app, make_user, login, query_counter, url):
+    client = login(make_user())
+    add_transaction(client)
+    
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    etag = response.headers['ETag']
+    
+    with query_counter() as queries:
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    # Only Flask-Login's load of the current user
+    assert queries.count == 1
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_add_transaction_invalidates_the_etag(app, make_user, login, url):
+    client = login(make_user())
+    add_transaction(client)
+    etag = client.get(url).headers['ETag']
+    
+    add_transaction(client, amount='40')
+    response = client.get(url, headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_delete_transaction_invalidates_the_etag(app, make_user, login, url):
+    client = login(make_user())
+    add_transaction(client)
+    add_transaction(client, amount='40')
+    etag = client.get(url).headers['ETag']
+    
+    client.get(f'/delete_transaction/{Transaction.query.first().id}')
+    response = client.get(url, headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_etag_depends_on_parameters_and_user(app, make_user, login):
+    client = login(make_user())
+    other = login(make_user('other@example.com'))
+    
+    month = client.get('/api/dashboard-data?range=month').headers['ETag']
+    year = client.get('/api/dashboard-data?range=year').headers['ETag']
+    assert month != year
+    assert client.get('/api/dashboard-data?range=year', headers={'If-None-Match': month}).status_code == 200
+    
+    # Another user's version never matches, even at the same data version
+    assert other.get('/api/dashboard-data?range=month', headers={'If-None-Match': month}).status_code == 200
+
+def test_other_users_writes_keep_the_etag(app, make_user, login):
+    client = login(make_user())
+    other = login(make_user('other@example.com'))
+    etag = client.get('/api/dashboard-data').headers['ETag']
+    
+    add_transaction(other)
+    
+    assert client.get('/api/dashboard-data', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,56 @@
+import json
+from datetime import date, datetime, timedelta
+
+import app as app_module
+from daily_analytics import refresh_analytics_job, schedule_analytics_refresh
+from extensions import db
+from jobs import enqueue, run_pending_jobs
+from models import Analytics, Job, UserActivity
+
+def pending_refreshes():
+    return Job.query.filter_by(type=refresh_analytics_job.name, status='pending').order_by(Job.run_at).all()
+
+def make_due(job):
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_schedule_queues_one_run_an_interval_ahead(app):
+    before = datetime.utcnow()
+    job = schedule_analytics_refresh(15)
+    
+    assert job is not None
+    assert json.loads(job.payload) == {'args': [15], 'kwargs': {}}
+    assert before + timedelta(minutes=15) <= job.run_at <= datetime.utcnow() + timedelta(minutes=15)
+    # Every other process starting up finds it queued
+    assert schedule_analytics_refresh(15) is None
+    assert len(pending_refreshes()) == 1
+
+def test_run_refreshes_and_queues_the_next_one(app, make_user):
+    user = make_user()
+    db.session.add(UserActivity(user_id=user.id, activity_type='login', description='Logged in'))
+    db.session.commit()
+    make_due(schedule_analytics_refresh(15))
+    
+    assert run_pending_jobs() == 1
+    
+    analytics = Analytics.query.filter_by(date=date.today()).one()
+    assert (analytics.total_users, analytics.active_users) == (1, 1)
+    [next_run] = pending_refreshes()
+    assert next_run.run_at > datetime.utcnow() + timedelta(minutes=14)
+
+def test_chains_queued_by_concurrent_starts_merge(app):
+    # Two processes raced past the check, each queueing a run
+    for _ in range(2):
+        enqueue(refresh_analytics_job.name, [15])
+    
+    assert run_pending_jobs() == 2
+    assert len(pending_refreshes()) == 1
+
+def test_first_request_of_a_process_schedules_the_refresh(app, monkeypatch):
+    monkeypatch.setattr(app_module.job_runner, 'start', lambda app: True)
+    monkeypatch.setitem(app.config, 'ANALYTICS_REFRESH_MINUTES', 15)
+    
+    app.test_client().get('/login')
+    app.test_client().get('/login')
+    
+    assert len(pending_refreshes()) == 1
@@ -0,0 +1,60 @@
+import pytest
+
+import expense_categorizer
+from expense_categorizer import CATEGORY_KEYWORDS, categorize_expense, categorize_expenses
+
+def keyword_loop(note):
+    # The rules as they were before the precompiled patterns
+    if not note:
+        return 'Uncategorized'
+    note = note.lower().strip()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in note for keyword in keywords):
+            return category
+    return 'Uncategorized'
+
+@pytest.mark.parametrize('note, category', [
+    # 'gas' is both a Transportation and a Bills & Utilities keyword, the earlier category wins
+    ('gas bill', 'Transportation'),
+    ('electricity bill', 'Bills & Utilities'),
+    # Food & Dining comes before Transportation, even for 'uber eats'
+    ('Uber Eats order', 'Food & Dining'),
+    ('uber to the office', 'Transportation'),
+    ('coffee at the mall', 'Food & Dining'),
+    ('netflix subscription', 'Entertainment'),
+    ('  RENT for March  ', 'Housing'),
+    # Keywords match inside words, as the substring rules did
+    ('scarf', 'Transportation'),
+    ('vedantu subscription', 'Uncategorized'),
+])
+def test_first_matching_category_wins(note, category):
+    assert categorize_expense(note) == category
+
+def test_matches_the_keyword_loop():
+    keywords = [keyword for keywords in CATEGORY_KEYWORDS.values() for keyword in keywords]
+    notes = keywords + [f'{a} and {b}' for a, b in zip(keywords, reversed(keywords))] + ['nothing here', 'ÜBER', '']
+    assert [categorize_expense(note) for note in notes] == [keyword_loop(note) for note in notes]
+
+@pytest.mark.parametrize('note', ['', None])
+def test_empty_note_is_uncategorized(note):
+    assert categorize_expense(note) == 'Uncategorized'
+
+def test_batch_matches_single_notes():
+    notes = ['gas bill', '', None, 'vedantu subscription', 'pizza', 'gas bill']
+    assert categorize_expenses(notes) == ['Transportation', 'Uncategorized', 'Uncategorized',
+                                          'Uncategorized', 'Food & Dining', 'Transportation']
+    assert categorize_expenses(iter(['pizza'])) == ['Food & Dining']
+    assert categorize_expenses([]) == []
+
+def test_batch_categorizes_each_distinct_note_once(monkeypatch):
+    calls = []
+    def counted(note):
+        calls.append(note)
+        return keyword_loop(note)
+    monkeypatch.setattr(expense_categorizer, 'categorize_expense', counted)
+    
+    categories = categorize_expenses(['pizza', 'taxi', 'pizza', '', 'taxi', None, 'pizza'])
+    
+    assert categories == ['Food & Dining', 'Transportation', 'Food & Dining', 'Uncategorized',
+                          'Transportation', 'Uncategorized', 'Food & Dining']
+    assert calls == ['pizza', 'taxi']
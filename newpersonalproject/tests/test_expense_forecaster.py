@@ -0,0 +1,170 @@
+import os
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from expense_forecaster import ExpenseForecaster, get_monthly_aggregates
+from extensions import db
+from models import Transaction
+from monthly_rollup import rebuild_rollups
+
+@pytest.fixture
+def feature_runs(monkeypatch):
+    # Counts runs of the feature pipeline, from the ORM list or the monthly aggregates
+    runs = []
+    for name in ('prepare_features', 'prepare_monthly_features'):
+        original = getattr(ExpenseForecaster, name)
+        def counted(self, data, original=original, name=name):
+            runs.append(name)
+            return original(self, data)
+        monkeypatch.setattr(ExpenseForecaster, name, counted)
+    return runs
+
+def seed_history(user, months=8):
+    today = date.today()
+    for i in range(months):
+        year, month = divmod(today.year * 12 + today.month - 2 - i, 12)
+        for day, category, amount in ((3, 'Food & Dining', 100 + i), (10, 'Transportation', 40 + 2 * i), (20, 'Housing', 500)):
+            db.session.add(Transaction(user_id=user.id, amount=amount, type='expense', category=category,
+                                       note=category, date=date(year, month + 1, day)))
+    db.session.commit()
+    rebuild_rollups(user.id)
+
+def test_fit_predict_prepares_features_once(app, make_user, feature_runs):
+    user = make_user()
+    seed_history(user)
+    
+    result = ExpenseForecaster().fit_predict(get_monthly_aggregates(user.id))
+    
+    assert result['total_prediction']['prediction'] is not None
+    assert set(result['category_predictions']) == {'Food & Dining', 'Transportation', 'Housing'}
+    assert feature_runs == ['prepare_monthly_features']
+
+def test_forecast_request_runs_the_feature_pipeline_once(app, make_user, login, feature_runs):
+    user = make_user()
+    seed_history(user)
+    client = login(user)
+    
+    response = client.get('/api/forecast?period=12')
+    assert response.status_code == 200
+    assert response.get_json()['total_prediction']['prediction'] is not None
+    assert len(feature_runs) == 1
+    
+    # A write forces a new forecast, again with a single feature pass
+    client.post('/add_transaction', data={'amount': '25', 'type': 'expense', 'category': 'Food & Dining',
+                                          'note': 'lunch', 'date': date.today().isoformat()})
+    assert client.get('/api/forecast?period=12').status_code == 200
+    assert len(feature_runs) == 2
+
+def test_unchanged_data_is_served_from_the_forecast_table(app, make_user, login, feature_runs):
+    user = make_user()
+    seed_history(user)
+    client = login(user)
+    
+    first = client.get('/api/forecast?period=12').get_json()
+    for _ in range(3):
+        assert client.get('/api/forecast?period=12').get_json() == first
+    
+    assert len(feature_runs) == 1
+    assert not os.path.exists(os.path.join(app.instance_path, 'forecast_cache'))
+
+def test_forecast_hit_rate_is_reported(app, make_user, login):
+    import app as app_module
+    before = app_module.forecast_hits.stats()
+    user = make_user()
+    seed_history(user)
+    client = login(user)
+    
+    for _ in range(3):
+        client.get('/api/forecast?period=12')
+    client.post('/add_transaction', data={'amount': '25', 'type': 'expense', 'category': 'Food & Dining',
+                                          'note': 'lunch', 'date': date.today().isoformat()})
+    client.get('/api/forecast?period=12')
+    
+    stats = login(make_user('admin@example.com', is_admin=True)).get('/admin/api/forecast-stats').get_json()
+    assert (stats['hits'] - before['hits'], stats['misses'] - before['misses']) == (2, 2)
+    assert stats['hit_rate'] is not None
+
+def row_by_row_features(transactions):
+    # prepare_features before it was vectorized, for comparison
+    df = pd.DataFrame([{'amount': t.amount, 'type': t.type, 'category': t.category, 'date': t.date}
+                       for t in transactions])
+    df = df[df['type'] == 'expense']
+    
+    monthly_data = []
+    unique_months = sorted(df['date'].dt.to_period('M').unique())
+    for month in unique_months:
+        month_df = df[df['date'].dt.to_period('M') == month]
+        features = {
+            'month_num': month.month,
+            'total_transactions': len(month_df),
+            'avg_transaction': month_df['amount'].mean(),
+            'max_transaction': month_df['amount'].max(),
+            'min_transaction': month_df['amount'].min(),
+        }
+        for category in df['category'].unique():
+            cat_total = month_df[month_df['category'] == category]['amount'].sum()
+            features[f'cat_{category.lower().replace(" & ", "_")}'] = cat_total
+        features['total_expenses'] = month_df['amount'].sum()
+        monthly_data.append(features)
+    
+    monthly_df = pd.DataFrame(monthly_data)
+    return monthly_df.drop('total_expenses', axis=1), monthly_df['total_expenses']
+
+def random_transactions(count, seed=0):
+    # Uneven months, categories missing from some months, income rows and
+    # two names that collide once normalized into a column name
+    rng = random.Random(seed)
+    categories = ['Shopping', 'Food & Dining', 'Housing', 'food_dining', 'Health & Wellness']
+    start = date(2023, 3, 1)
+    return [SimpleNamespace(amount=round(rng.uniform(1, 500), 2),
+                            type='income' if rng.random() < 0.1 else 'expense',
+                            category=rng.choice(categories[:2] if i < count // 3 else categories),
+                            date=pd.Timestamp(start + timedelta(days=rng.randrange(700))))
+            for i in range(count)]
+
+@pytest.mark.parametrize('seed', range(3))
+def test_vectorized_features_match_the_row_by_row_loop(seed):
+    transactions = random_transactions(2000, seed)
+    
+    X, y = ExpenseForecaster().prepare_features(transactions)
+    expected_X, expected_y = row_by_row_features(transactions)
+    
+    pd.testing.assert_frame_equal(X, expected_X)
+    pd.testing.assert_series_equal(y, expected_y)
+
+def per_category_predictions(forecaster, X):
+    # get_category_predictions before the multi-output fit: one regression per
+    # category with history, on the scaler fitted by train()
+    next_month = X.iloc[-1:].copy()
+    next_month['month_num'] = (next_month['month_num'] % 12) + 1
+    predictions = {}
+    for column in [col for col in X.columns if col.startswith('cat_')]:
+        target = pd.Series([row[column] for _, row in X.iterrows()])
+        if target.sum() > 0:
+            model = LinearRegression().fit(forecaster.scaler.transform(X), target)
+            predictions[column] = model.predict(forecaster.scaler.transform(next_month))[0]
+    return predictions
+
+@pytest.mark.parametrize('seed', range(3))
+def test_multi_output_fit_matches_per_category_models(seed):
+    transactions = random_transactions(2000, seed)
+    forecaster = ExpenseForecaster()
+    assert forecaster.train(transactions)
+    X, _ = forecaster.get_features(transactions)
+    
+    expected = per_category_predictions(forecaster, X)
+    next_month = X.iloc[-1:].copy()
+    next_month['month_num'] = (next_month['month_num'] % 12) + 1
+    predicted = forecaster.category_model.predict(forecaster.scaler.transform(next_month))[0]
+    
+    assert forecaster.category_cols == list(expected)
+    assert np.allclose(predicted, list(expected.values()))
+    assert forecaster.get_category_predictions(transactions) == {
+        column[4:].replace('_', ' & ').title(): round(value, 2) for column, value in expected.items() if value > 0
+    }
@@ -0,0 +1,94 @@
+import random
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from expense_forecaster import ExpenseForecaster, get_monthly_aggregates
+from incremental_forecaster import IncrementalForecaster
+from models import Transaction
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Housing', 'Shopping', 'Entertainment']
+
+def monthly_aggregates(ledger):
+    # Same shape as get_monthly_aggregates, computed from an in-memory ledger
+    groups = {}
+    for day, category, amount in ledger:
+        groups.setdefault((day.strftime('%Y-%m'), category), []).append(amount)
+    return pd.DataFrame(
+        [(month, category, sum(amounts), len(amounts), min(amounts), max(amounts), date.fromisoformat(f'{month}-01'))
+         for (month, category), amounts in sorted(groups.items())],
+        columns=['month', 'category', 'total', 'count', 'min', 'max', 'first_seen']
+    )
+
+def random_transaction(rng, months=18):
+    year, month = divmod(2025 * 12 + rng.randrange(months), 12)
+    return date(year, month + 1, rng.randint(1, 28)), rng.choice(CATEGORIES), round(rng.uniform(1, 500), 2)
+
+def assert_equivalent(incremental, batch):
+    total, expected_total = incremental['total_prediction'], batch['total_prediction']
+    if expected_total['prediction'] is None:
+        assert total['prediction'] is None
+    else:
+        assert total['prediction'] == pytest.approx(expected_total['prediction'], rel=1e-6, abs=0.011)
+        assert total['confidence'] == pytest.approx(expected_total['confidence'], abs=0.11)
+    
+    # A category predicted at ~0 lands on either side of the `pred > 0` cut
+    # (or rounds to 0.00) depending on rounding, so those are left out
+    def significant(predictions):
+        return {category: value for category, value in predictions.items() if abs(value) > 0.01}
+    categories, expected_categories = significant(incremental['category_predictions']), significant(batch['category_predictions'])
+    assert categories.keys() == expected_categories.keys()
+    for category, value in expected_categories.items():
+        assert categories[category] == pytest.approx(value, rel=1e-6, abs=0.011)
+
+@pytest.mark.parametrize('seed', range(200))
+def test_random_adds_and_removes_match_batch_training(seed):
+    rng = random.Random(seed)
+    ledger = [random_transaction(rng) for _ in range(rng.randrange(0, 30))]
+    model = IncrementalForecaster.from_monthly(monthly_aggregates(ledger))
+    
+    def extrema(month, category):
+        amounts = [amount for day, c, amount in ledger if c == category and day.strftime('%Y-%m') == month]
+        return min(amounts), max(amounts)
+    
+    for _ in range(rng.randrange(1, 80)):
+        if ledger and rng.random() < 0.4:
+            day, category, amount = ledger.pop(rng.randrange(len(ledger)))
+            model.remove(day, category, amount, extrema)
+        else:
+            transaction = random_transaction(rng)
+            ledger.append(transaction)
+            model.add(*transaction)
+    
+    assert_equivalent(model.fit_predict(), ExpenseForecaster().fit_predict(monthly_aggregates(ledger)))
+
+def test_route_writes_keep_the_stored_model_equivalent(app, make_user, login):
+    import app as app_module
+    user = make_user()
+    client = login(user)
+    rng = random.Random(0)
+    
+    def add(day, category, amount):
+        client.post('/add_transaction', data={'amount': str(amount), 'type': 'expense', 'category': category,
+                                              'note': 'x', 'date': day.isoformat()})
+    
+    for _ in range(40):
+        add(*random_transaction(rng))
+    # Builds the stored model; later writes update it instead of rebuilding
+    client.get('/api/forecast?period=0')
+    rebuild = app_module.forecast_states.rebuild
+    app_module.forecast_states.rebuild = lambda *args, **kwargs: pytest.fail('model was rebuilt from history')
+    try:
+        for _ in range(60):
+            ids = [t.id for t in Transaction.query.with_entities(Transaction.id)]
+            if rng.random() < 0.4:
+                client.get(f'/delete_transaction/{rng.choice(ids)}')
+            else:
+                add(*random_transaction(rng))
+        
+        incremental = client.get('/api/forecast?period=0').get_json()
+    finally:
+        app_module.forecast_states.rebuild = rebuild
+    
+    assert_equivalent(incremental, ExpenseForecaster().fit_predict(get_monthly_aggregates(user.id)))
@@ -0,0 +1,32 @@
+from datetime import date
+
+import pytest
+from markupsafe import escape
+
+from models import MonthlyRollup, Transaction
+from monthly_rollup import check_rollups
+
+def add(client, **fields):
+    data = {'amount': '10', 'type': 'expense', 'category': 'Housing', 'note': 'rent',
+            'date': date.today().isoformat(), **fields}
+    return client.post('/add_transaction', data=data, follow_redirects=True)
+
+@pytest.mark.parametrize('fields, error', [
+    ({'amount': 'nan'}, "Invalid amount 'nan'"),
+    ({'amount': 'inf'}, "Invalid amount 'inf'"),
+    ({'amount': '-Infinity'}, "Invalid amount '-Infinity'"),
+    ({'amount': 'ten'}, "Invalid amount 'ten'"),
+    ({'amount': ''}, "Invalid amount ''"),
+    ({'type': 'refund'}, "Invalid type 'refund'"),
+])
+def test_invalid_transactions_never_reach_the_rollup(app, make_user, login, fields, error):
+    client = login(make_user())
+    add(client)
+    
+    response = add(client, **fields)
+    
+    assert response.status_code == 200
+    assert escape(error) in response.get_data(as_text=True)
+    assert Transaction.query.count() == 1
+    assert [(row.total, row.count) for row in MonthlyRollup.query] == [(10, 1)]
+    assert check_rollups() == []
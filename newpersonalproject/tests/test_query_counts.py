@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as app_module
+from extensions import db
+from models import Analytics, Job, Transaction, User, UserActivity
+from monthly_rollup import rebuild_rollups
+
+ADMIN_ROUTES = [
+    '/admin',
+    '/admin/users',
+    '/admin/analytics',
+    '/admin/activity-log',
+    '/admin/activity-log?suspicious=true',
+    '/admin/api/activity-log',
+    '/admin/api/categorizer-stats',
+    '/admin/api/admin-cache-stats',
+    '/admin/api/forecast-stats',
+    '/admin/api/job-stats',
+]
+
+USER_ROUTES = [
+    '/',
+    '/api/dashboard-data?range=month',
+    '/api/transactions?range=month',
+    '/api/forecast?period=12',
+    '/forecast',
+]
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Housing']
+
+def seed_platform(count):
+    # count more users, each with transactions, the newest login, the oldest
+    # suspicious activity and a finished job, and count more days of analytics
+    offset = User.query.count()
+    now = datetime.utcnow()
+    for i in range(offset, offset + count):
+        user = User(name=f'seed{i}', email=f'seed{i}@example.com', password_hash='x', is_verified=True)
+        db.session.add(user)
+        db.session.flush()
+        for j, category in enumerate(CATEGORIES):
+            db.session.add(Transaction(user_id=user.id, amount=10 + j, type='expense', category=category,
+                                       note=category, date=date.today() - timedelta(days=j)))
+        db.session.add(UserActivity(user_id=user.id, activity_type='login', description='Logged in',
+                                    ip_address='10.0.0.1', timestamp=now + timedelta(seconds=i)))
+        db.session.add(UserActivity(user_id=user.id, activity_type='login_failed', description='Bad password',
+                                    ip_address='10.0.0.2', timestamp=now - timedelta(seconds=i), is_suspicious=True))
+        db.session.add(Analytics(date=date.today() - timedelta(days=i + 1), total_users=i, active_users=i))
+        db.session.add(Job(type='categorize_transaction', payload='{"args": [], "kwargs": {}}', status='done',
+                           attempts=1, run_at=now - timedelta(seconds=30), started_at=now - timedelta(seconds=20),
+                           finished_at=now - timedelta(seconds=10)))
+    db.session.commit()
+    rebuild_rollups()
+
+def seed_transactions(user, count):
+    # Spread over the last months, so every range and the forecast see them
+    today = date.today()
+    for i in range(count):
+        db.session.add(Transaction(user_id=user.id, amount=5 + i % 50, type='expense' if i % 5 else 'income',
+                                   category=CATEGORIES[i % len(CATEGORIES)], note='seeded',
+                                   date=today - timedelta(days=i % 120)))
+    user.data_version += 1  # Forces a fresh forecast, like a real write
+    db.session.commit()
+    rebuild_rollups(user.id)
+
+@pytest.fixture(autouse=True)
+def synchronous_admin_cache(monkeypatch):
+    # A stale hit would queue a refresh job, which runs inline here and adds its queries to the request
+    monkeypatch.setattr(app_module.admin_cache, 'stale_seconds', 0)
+
+@pytest.fixture
+def queries_per_request(query_counter):
+    def queries_per_request(client, url):
+        # The dashboard's cached aggregates are recomputed on every request
+        app_module.admin_cache.invalidate(app_module.ADMIN_STATS_KEY)
+        db.session.commit()
+        with query_counter() as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        return queries.count
+    return queries_per_request
+
+@pytest.mark.parametrize('url', ADMIN_ROUTES)
+def test_admin_route_queries_do_not_grow_with_rows(app, make_user, login, queries_per_request, url):
+    client = login(make_user('admin@example.com', is_admin=True))
+    
+    # Enough newer logins to push the admin's own out of the recent activities
+    seed_platform(10)
+    few = queries_per_request(client, url)
+    seed_platform(60)
+    assert queries_per_request(client, url) == few
+
+@pytest.mark.parametrize('url', USER_ROUTES)
+def test_user_route_queries_do_not_grow_with_rows(app, make_user, login, queries_per_request, url):
+    user = make_user()
+    client = login(user)
+    
+    seed_transactions(user, 10)
+    few = queries_per_request(client, url)
+    seed_transactions(user, 300)
+    assert queries_per_request(client, url) == few
+
+@pytest.mark.parametrize('path', ['/', '/api/dashboard-data', '/api/transactions', '/api/forecast'])
+def test_user_routes_declare_a_query_budget(app, path):
+    # Their counts are then enforced on every request the tests make, not only here
+    endpoint, _ = app.url_map.bind('localhost').match(path)
+    assert getattr(app.view_functions[endpoint], 'query_budget', None) is not None
+
+def test_lazy_load_per_row_is_caught(app, make_user, login, queries_per_request, monkeypatch):
+    # Without the joinedload each activity row loads its user for the template
+    monkeypatch.setattr(app_module, 'recent_activities_query',
+                        lambda: UserActivity.query.order_by(UserActivity.timestamp.desc()).limit(10))
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_STRICT', False)
+    client = login(make_user('admin@example.com', is_admin=True))
+    
+    seed_platform(1)
+    few = queries_per_request(client, '/admin')
+    seed_platform(20)
+    assert queries_per_request(client, '/admin') > few
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import LABEL_STYLE_TABLENAME_PLUS_COL, func, select, text
+
+from app import (HOT_QUERY_ALLOWED_SCANS, analytics_trend_query, db, hot_queries, recent_activities_query,
+                 suspicious_activities_query, transactions_page_query)
+from activity_log import activity_page_query
+from incremental_forecaster import extrema_query
+from models import Transaction
+from query_plans import check_query_plans, explain
+
+def compiled_sql(query):
+    # Labelled the way the ORM labels the statements it executes
+    statement = query.set_label_style(LABEL_STYLE_TABLENAME_PLUS_COL).statement
+    return str(statement.compile(dialect=db.engine.dialect))
+
+def full_scans(results):
+    return {name: result['full_scans'] for name, result in results.items() if result['full_scans']}
+
+def test_hot_queries_use_indexes(app):
+    results = check_query_plans(hot_queries(), HOT_QUERY_ALLOWED_SCANS)
+    assert full_scans(results) == {}
+
+def test_dropped_index_is_reported(app):
+    db.session.execute(text('DROP INDEX ix_transaction_user_date_id'))
+    results = check_query_plans(hot_queries(), HOT_QUERY_ALLOWED_SCANS)
+    assert full_scans(results) == {'transaction export': ['transaction'], 'user stats': ['transaction']}
+
+def test_index_walk_over_every_row_is_reported(app):
+    # Still a scan of the whole table, just read from the covering index
+    wrapped = select(Transaction.id).where(func.strftime('%Y', Transaction.date) == '2024')
+    assert check_query_plans({'wrapped date': wrapped})['wrapped date']['full_scans'] == ['transaction']
+
+def test_unindexable_filter_is_reported(app):
+    wrapped = select(Transaction.note).where(func.strftime('%Y', Transaction.date) == '2024')
+    assert check_query_plans({'wrapped date': wrapped})['wrapped date']['full_scans'] == ['transaction']
+
+def test_month_filters_seek_the_date_range(app):
+    # A function of the date still seeks the user's rows, but reads all of them
+    [line] = check_query_plans({'extrema': extrema_query(1, '2024-03', 'Housing')})['extrema']['plan']
+    assert '(user_id=? AND date>? AND date<?)' in line
+
+ACTIVITY_RANGE = {'since': datetime(2024, 1, 1), 'until': datetime(2024, 2, 1)}
+
+@pytest.mark.parametrize('filters, index, seek', [
+    ({}, 'ix_user_activity_timestamp_user', ''),
+    ({'user_id': 1}, 'ix_user_activity_user_timestamp', 'user_id=? AND '),
+    ({'activity_type': 'login_failed'}, 'ix_user_activity_type_timestamp', 'activity_type=? AND '),
+    ({'ip_address': '127.0.0.1'}, 'ix_user_activity_ip_timestamp', 'ip_address=? AND '),
+    ({'is_suspicious': True}, 'ix_user_activity_suspicious_timestamp', 'is_suspicious=? AND '),
+    # Only the user's index is used; the type is checked on its rows
+    ({'user_id': 1, 'activity_type': 'login_failed'}, 'ix_user_activity_user_timestamp', 'user_id=? AND '),
+])
+@pytest.mark.parametrize('time_range', [{}, ACTIVITY_RANGE], ids=['all time', 'since until'])
+@pytest.mark.parametrize('after', [None, (datetime(2024, 1, 15), 100)], ids=['first page', 'next page'])
+def test_activity_log_filters_seek_their_index(app, filters, index, seek, time_range, after):
+    plan = explain(activity_page_query({**filters, **time_range}, after))
+    
+    [line] = [line for line in plan if 'user_activity' in line]
+    # The page's time bounds are part of the seek, not checked row by row
+    bounds = 'timestamp>? AND timestamp<?' if time_range or after else 'timestamp>?'
+    assert line == f'SEARCH user_activity USING INDEX {index} ({seek}{bounds})'
+    # Rows come off the index newest first, never sorted whole
+    assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+
+def test_checked_statements_are_the_ones_executed(app, make_user, login, query_counter):
+    user = make_user()
+    client = login(user)
+    with query_counter() as queries:
+        client.get('/api/transactions?range=month')
+    assert compiled_sql(transactions_page_query(user.id, datetime.now().date(), datetime.now().date())) \
+        in queries.statements
+    
+    client = login(make_user('admin@example.com', is_admin=True))
+    with query_counter() as queries:
+        client.get('/admin')
+    for query in (recent_activities_query(), suspicious_activities_query(), analytics_trend_query()):
+        assert compiled_sql(query) in queries.statements
+
+def test_check_query_plans_command(app):
+    result = app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert 'transactions page: ok' in result.output
@@ -0,0 +1,112 @@
+from datetime import date, datetime
+
+import pytest
+
+import app as app_module
+import expense_categorizer
+from daily_analytics import record_transactions
+from extensions import db
+from models import Analytics, AnalyticsCategory, Transaction
+from recategorize import recategorize_transactions
+
+def add_uncategorized(user, notes, day=date(2026, 1, 1)):
+    transactions = [Transaction(user_id=user.id, amount=10, type='expense', date=day,
+                                note=note, category='Uncategorized') for note in notes]
+    db.session.add_all(transactions)
+    # Counted in the day's analytics like any other write
+    record_transactions([(t.date, t.type, t.category, t.amount) for t in transactions])
+    db.session.commit()
+
+def categories():
+    return [t.category for t in Transaction.query.order_by(Transaction.id)]
+
+def test_chunks_get_more_than_the_interactive_timeout(app, make_user, in_process_model, monkeypatch):
+    user = make_user()
+    add_uncategorized(user, [f'vendor {i}' for i in range(100)])
+    # 4 model batches of 32 at 50ms each, well over the interactive timeout
+    in_process_model(delay=0.05)
+    monkeypatch.setattr(expense_categorizer, 'CATEGORIZER_TIMEOUT', 0.05)
+    
+    result = recategorize_transactions(chunk_size=100, workers=1, timeout=10, report=lambda line: None)
+    
+    assert result['updated'] == 100
+    assert result['skipped_chunks'] == result['skipped_rows'] == 0
+    assert categories() == ['Education'] * 100
+    assert Transaction.query.first().category_source == 'auto'
+
+def test_timed_out_chunks_are_reported_and_abandoned(app, make_user, in_process_model):
+    user = make_user()
+    add_uncategorized(user, [f'vendor {i}' for i in range(200)] + ['taxi', None])
+    classifier = in_process_model(delay=0.05)
+    lines = []
+    
+    result = recategorize_transactions(chunk_size=101, workers=1, timeout=0.01, report=lines.append)
+    
+    # Rule matches are still written, the rest is counted instead of silently dropped
+    assert result['updated'] == 1
+    assert result['skipped_chunks'] == 2
+    assert result['skipped_rows'] == 200
+    assert categories() == ['Uncategorized'] * 200 + ['Transportation', 'Uncategorized']
+    assert 'chunks the model failed on' in lines[-1]
+    
+    # The batcher drops the notes nobody is waiting for anymore
+    expense_categorizer._batcher.submit('flush', timeout=5)
+    assert sum(len(call) for call in classifier.calls) < 100
+
+def test_dry_run_writes_nothing(app, make_user, in_process_model):
+    user = make_user()
+    add_uncategorized(user, ['vendor', 'vendor', 'lunch'])
+    in_process_model()
+    
+    result = recategorize_transactions(workers=1, dry_run=True, report=lambda line: None)
+    
+    assert result['changes'] == {'Education': 2, 'Food & Dining': 1}
+    assert categories() == ['Uncategorized'] * 3
+
+def test_todays_category_counts_follow_the_new_categories(app, make_user, in_process_model):
+    user = make_user()
+    add_uncategorized(user, ['vendor a', 'vendor b', 'lunch', 'vendor c'], day=datetime.now().date())
+    add_uncategorized(user, ['vendor d'])  # Not today, not in today's analytics
+    in_process_model()
+    
+    recategorize_transactions(chunk_size=2, workers=1, report=lambda line: None)
+    
+    today = datetime.now().date()
+    counts = {row.category: row.count for row in AnalyticsCategory.query.filter_by(date=today)}
+    assert counts == {'Uncategorized': 0, 'Education': 3, 'Food & Dining': 1}
+    analytics = Analytics.query.filter_by(date=today).one()
+    assert (analytics.total_transactions, analytics.total_expense) == (4, 40)
+    assert analytics.most_common_category == 'Education'
+
+def test_command_invalidates_the_admin_category_stats(app, make_user, in_process_model, tmp_path, monkeypatch):
+    # Recompute on the next read instead of serving the stale value meanwhile
+    monkeypatch.setattr(app_module.admin_cache, 'stale_seconds', 0)
+    user = make_user()
+    add_uncategorized(user, ['vendor a', 'vendor b'])
+    in_process_model()
+    stats = app_module.admin_cache.get(app_module.ADMIN_STATS_KEY, app_module.compute_admin_stats)
+    assert [row['category'] for row in stats['category_stats']] == ['Uncategorized']
+    
+    result = app.test_cli_runner().invoke(args=['recategorize', '--workers', '1',
+                                                '--checkpoint', str(tmp_path / 'checkpoint')])
+    assert result.exit_code == 0, result.output
+    
+    stats = app_module.admin_cache.get(app_module.ADMIN_STATS_KEY, app_module.compute_admin_stats)
+    assert [(row['category'], row['count']) for row in stats['category_stats']] == [('Education', 2)]
+
+def test_workers_without_the_service_stay_in_one_process(app, make_user, in_process_model, monkeypatch, tmp_path):
+    # Each forked worker would load its own copy of the transformer
+    monkeypatch.setattr('recategorize.Pool', None)
+    user = make_user()
+    add_uncategorized(user, ['vendor a', 'lunch'])
+    in_process_model()
+    
+    result = recategorize_transactions(chunk_size=1, report=lambda line: None)
+    assert result['updated'] == 2
+    
+    with pytest.raises(ValueError):
+        recategorize_transactions(workers=4, report=lambda line: None)
+    result = app.test_cli_runner().invoke(args=['recategorize', '--workers', '4',
+                                                '--checkpoint', str(tmp_path / 'checkpoint')])
+    assert result.exit_code == 1
+    assert 'CATEGORIZER_SOCKET' in result.output
@@ -0,0 +1,86 @@
+import gzip
+import json
+import tracemalloc
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from extensions import db
+from models import Transaction
+
+def seed_transactions(user, count):
+    start = date(2020, 1, 1)
+    db.session.execute(insert(Transaction), [
+        {'user_id': user.id, 'amount': 10 + i % 90, 'type': 'expense', 'category': 'Food & Dining',
+         'note': f'lunch at place number {i}', 'date': start + timedelta(days=i % 2000)}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+def stream_export(client, url):
+    # Consumes the streamed response chunk by chunk, as a slow client would;
+    # returns (bytes received, lines received, peak traced memory while streaming)
+    tracemalloc.start()
+    try:
+        response = client.get(url, buffered=False)
+        assert response.status_code == 200
+        size = lines = 0
+        for chunk in response.response:
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+        response.close()
+        return size, lines, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+def test_export_memory_stays_flat_as_rows_grow(app, make_user, login, export_format):
+    small, large = make_user('small@example.com'), make_user('large@example.com')
+    seed_transactions(small, 5_000)
+    seed_transactions(large, 50_000)
+    
+    peaks = {}
+    for user, rows in ((small, 5_000), (large, 50_000)):
+        size, lines, peaks[rows] = stream_export(login(user), f'/api/transactions/export?format={export_format}')
+        # Every row arrived (plus the CSV header), megabytes of output
+        assert lines == rows + (export_format == 'csv')
+        assert size > rows * 40
+    
+    # 10x the rows must not mean (anywhere near) 10x the memory, and the
+    # peak stays far below the size of the export itself
+    assert peaks[50_000] < peaks[5_000] * 1.5
+    assert peaks[50_000] < 4 * 1024 * 1024
+
+def test_gzip_export_is_complete_and_flat(app, make_user, login):
+    user = make_user()
+    seed_transactions(user, 20_000)
+    client = login(user)
+    
+    tracemalloc.start()
+    try:
+        response = client.get('/api/transactions/export?format=ndjson&gzip=1', buffered=False)
+        assert response.headers['Content-Type'] == 'application/gzip'
+        compressed = b''.join(response.response)
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    lines = gzip.decompress(compressed).decode().splitlines()
+    assert len(lines) == 20_000
+    assert json.loads(lines[0])['note'] == 'lunch at place number 0'
+    # The compressed output is kept by the test itself, the rest must stay small
+    assert peak - len(compressed) < 4 * 1024 * 1024
+
+def test_export_filters_by_date(app, make_user, login):
+    user = make_user()
+    seed_transactions(user, 100)
+    client = login(user)
+    
+    response = client.get('/api/transactions/export?format=csv&start_date=2020-01-10&end_date=2020-01-19')
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,date,type,category,amount,note'
+    assert len(lines) == 11
+    assert client.get('/api/transactions/export?format=xml').status_code == 400
+    assert client.get('/api/transactions/export?start_date=2020-13-01').status_code == 400
@@ -0,0 +1,95 @@
+import io
+
+import app as app_module
+from jobs import run_pending_jobs
+from models import Job, Transaction, UserActivity
+
+def upload(client, content: bytes, **form):
+    return client.post('/api/transactions/import',
+                       data={'file': (io.BytesIO(content), 'statement.csv'), **form},
+                       content_type='multipart/form-data')
+
+def imported_notes():
+    return [t.note for t in Transaction.query.order_by(Transaction.id)]
+
+def test_non_finite_amounts_are_row_errors(app, make_user, login):
+    client = login(make_user())
+    response = upload(client, b'date,amount,note\n2026-01-01,-5,first\n2026-01-02,nan,bad\n'
+                              b'2026-01-03,inf,worse\n2026-01-04,-Infinity,worst\n2026-01-05,-7,last\n')
+    
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['imported'], result['rejected']) == (2, 3)
+    assert result['errors'] == [
+        {'line': 3, 'error': "Invalid amount 'nan'"},
+        {'line': 4, 'error': "Invalid amount 'inf'"},
+        {'line': 5, 'error': "Invalid amount '-Infinity'"},
+    ]
+    # The valid rows of the same batch are kept
+    assert imported_notes() == ['first', 'last']
+
+def test_non_utf8_bytes_do_not_abort_the_import(app, make_user, login):
+    client = login(make_user())
+    app.config['IMPORT_BATCH_SIZE'] = 2
+    try:
+        response = upload(client, b'date,amount,note\n2026-01-01,-5,first\n2026-01-02,-6,second\n'
+                                  b'2026-01-03,-7,caf\xe9\n2026-01-04,-8\xa3,latin-1 amount\n2026-01-05,-9,last\n')
+    finally:
+        app.config['IMPORT_BATCH_SIZE'] = 1000
+    
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['imported'], result['rejected']) == (4, 1)
+    assert result['errors'] == [{'line': 5, 'error': "Invalid amount '-8�'"}]
+    assert imported_notes() == ['first', 'second', 'caf�', 'last']
+
+def test_malformed_csv_rows_are_row_errors(app, make_user, login):
+    client = login(make_user())
+    response = upload(client, b'date,amount,note\n2026-01-01,-5,"multi\nline"\n'
+                              b'2026-01-02,-6,' + b'x' * 200_000 + b'\n2026-01-03,-7,after\n')
+    
+    result = response.get_json()
+    assert (result['imported'], result['rejected']) == (2, 1)
+    assert result['errors'][0]['line'] == 4
+    assert result['errors'][0]['error'].startswith('Unreadable row: field larger than field limit')
+    assert imported_notes() == ['multi\nline', 'after']
+
+def test_import_reports_validation_errors_and_batches(app, make_user, login):
+    client = login(make_user())
+    response = upload(client, b'Date,Amount,Type,Category,Note\n'
+                              b'2026-01-01,5,income,,salary\n'
+                              b'not a date,5,,,\n'
+                              b'2026-01-02,0,,,\n'
+                              b'2026-01-03,-12,refund,,\n'
+                              b'2026-01-04,-3,,Shopping,zara\n')
+    
+    result = response.get_json()
+    assert (result['imported'], result['rejected']) == (2, 3)
+    assert [error['line'] for error in result['errors']] == [3, 4, 5]
+    assert [(t.type, t.amount, t.category) for t in Transaction.query.order_by(Transaction.id)] == \
+        [('income', 5.0, 'Uncategorized'), ('expense', 3.0, 'Shopping')]
+    assert UserActivity.query.filter_by(activity_type='transaction_import').count() == 1
+    
+    missing = upload(client, b'when,amount\n2026-01-01,5\n').get_json()
+    assert missing['errors'] == [{'line': 1, 'error': 'Missing column(s): date'}]
+
+def test_upload_leaves_the_model_to_a_background_job(app, make_user, login, in_process_model, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOB_WORKERS', 1)
+    classifier = in_process_model()
+    client = login(make_user())
+    
+    response = upload(client, b'date,amount,note\n2026-01-01,-5,vedantu subscription\n'
+                              b'2026-01-02,-6,uber ride\n2026-01-03,-7,vedantu renewal\n')
+    
+    assert response.get_json()['imported'] == 3
+    assert classifier.calls == []
+    assert [t.category for t in Transaction.query.order_by(Transaction.id)] == \
+        ['Uncategorized', 'Transportation', 'Uncategorized']
+    [job] = Job.query.filter_by(type=app_module.categorize_imported.name, status='pending')
+    
+    run_pending_jobs()
+    
+    assert job.status == 'done'
+    
+    assert [(t.category, t.category_source) for t in Transaction.query.order_by(Transaction.id)] == \
+        [('Education', 'auto'), ('Transportation', 'auto'), ('Education', 'auto')]
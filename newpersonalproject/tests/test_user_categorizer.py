@@ -0,0 +1,99 @@
+import random
+from datetime import date
+
+from expense_categorizer import CategorizerUnavailable
+from extensions import db
+from jobs import run_pending_jobs
+from models import Job, Transaction, UserCategorizer
+from user_categorizer import evaluate_categorizer
+
+# Notes the keyword rules can't place, with the category a user files them under
+VENDORS = {
+    'Shopping': ['zara', 'ikea', 'decathlon', 'uniqlo'],
+    'Health & Wellness': ['apollo', 'cult fit', 'practo', 'netmeds'],
+    'Education': ['udemy', 'vedantu', 'byjus', 'kindle'],
+}
+
+def add_transactions(user, rows):
+    db.session.add_all(Transaction(user_id=user.id, amount=10, type='expense', date=date(2026, 1, 1),
+                                   note=note, category=category, category_source=source)
+                       for note, category, source in rows)
+    db.session.commit()
+
+def labelled_history(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        category = rng.choice(list(VENDORS))
+        rows.append((f'{rng.choice(VENDORS[category])} order {rng.randint(1, 999)}', category, 'user'))
+    return rows
+
+def test_history_training_ignores_assigned_categories(app, make_user):
+    import app as app_module
+    user = make_user()
+    # The user files 'zara' under Shopping; the transformer once guessed otherwise
+    add_transactions(user, [(f'zara order {i}', 'Shopping', 'user') for i in range(12)]
+                     + [(f'zara refund {i}', 'Entertainment', 'auto') for i in range(40)])
+    
+    assert app_module.user_categorizers.train_from_history(user.id).n_samples == 12
+    assert app_module.user_categorizers.predict(user.id, 'zara refund') == 'Shopping'
+
+def test_rows_from_before_provenance_count_as_user_labels(app, make_user):
+    import app as app_module
+    user = make_user()
+    add_transactions(user, [(f'ikea order {i}', 'Shopping', None) for i in range(12)])
+    
+    assert app_module.user_categorizers.train_from_history(user.id).n_samples == 12
+
+def test_first_prediction_queues_training_instead_of_running_it(app, make_user, monkeypatch):
+    import app as app_module
+    monkeypatch.setitem(app.config, 'JOB_WORKERS', 1)
+    user = make_user()
+    add_transactions(user, [(f'zara order {i}', 'Shopping', 'user') for i in range(12)])
+    
+    # Falls through to the next categorizer until the model exists
+    for _ in range(3):
+        assert app_module.user_categorizers.predict(user.id, 'zara order') is None
+    assert UserCategorizer.query.count() == 0
+    assert Job.query.filter_by(type=app_module.train_user_categorizer.name).count() == 1
+    
+    assert run_pending_jobs() == 1
+    assert app_module.user_categorizers.predict(user.id, 'zara order') == 'Shopping'
+
+def test_add_transaction_records_category_source(app, make_user, login):
+    user = make_user()
+    client = login(user)
+    for category, note in (('Shopping', 'zara'), ('', 'lunch'), ('', 'xyzzy')):
+        client.post('/add_transaction', data={'amount': '10', 'type': 'expense', 'category': category,
+                                              'note': note, 'date': '2026-01-01'})
+    
+    assert [(t.category, t.category_source) for t in Transaction.query.order_by(Transaction.id)] == \
+        [('Shopping', 'user'), ('Food & Dining', 'auto'), ('Uncategorized', 'auto')]
+
+def test_learned_model_beats_uninformed_zero_shot_on_held_out_labels(app, make_user):
+    user = make_user()
+    add_transactions(user, labelled_history(500))
+    # Stand-in for the transformer, which has never seen these vendors
+    zero_shot = lambda notes: ['Shopping'] * len(notes)
+    
+    result = evaluate_categorizer(user.id, zero_shot, holdout=0.2)
+    
+    assert result['train_samples'] == 400
+    assert result['held_out'] == 100
+    learned, baseline = result['learned'], result['zero_shot']
+    assert learned['coverage'] > 0.9
+    assert learned['accuracy'] > 0.9 > baseline['accuracy']
+    assert baseline['coverage'] == 1.0
+    # Sub-millisecond inference on CPU
+    assert learned['latency_us_p99'] < 1000
+
+def test_evaluation_reports_unavailable_zero_shot(app, make_user):
+    user = make_user()
+    add_transactions(user, labelled_history(50))
+    
+    def unavailable(notes):
+        raise CategorizerUnavailable('no model')
+    
+    result = evaluate_categorizer(user.id, unavailable)
+    assert result['zero_shot'] is None
+    assert result['learned']['accuracy'] is not None
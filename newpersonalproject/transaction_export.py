@@ -0,0 +1,137 @@
+"""
+Streaming export of a user's transactions.
+
+Rows are read through a streaming cursor in batches and encoded batch by
+batch, so memory stays flat no matter how many transactions a user has.
+Output can be gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import select
+
+from extensions import db
+from models import Transaction
+
+EXPORT_COLUMNS = ['id', 'date', 'type', 'category', 'amount', 'note']
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def export_query(user_id: int, start_date=None, end_date=None):
+    """
+    Build the query for a user's transactions in date order.
+    
+    Args:
+        user_id: ID of the user
+        start_date: Only include transactions on or after this date
+        end_date: Only include transactions on or before this date
+    
+    Returns:
+        Select of (id, date, type, category, amount, note) rows
+    """
+    query = select(
+        Transaction.id, Transaction.date, Transaction.type,
+        Transaction.category, Transaction.amount, Transaction.note
+    ).where(Transaction.user_id == user_id)
+    
+    if start_date:
+        query = query.where(Transaction.date >= start_date)
+    if end_date:
+        query = query.where(Transaction.date <= end_date)
+    return query.order_by(Transaction.date, Transaction.id)
+
+def iter_transaction_batches(user_id: int, start_date=None, end_date=None,
+                             batch_size: int = 1000) -> Iterator[Sequence]:
+    """
+    Stream a user's transactions in date order.
+    
+    Args:
+        user_id: ID of the user
+        start_date: Only include transactions on or after this date
+        end_date: Only include transactions on or before this date
+        batch_size: Rows fetched from the cursor at a time
+    
+    Yields:
+        Lists of (id, date, type, category, amount, note) rows
+    """
+    result = db.session.execute(
+        export_query(user_id, start_date, end_date).execution_options(stream_results=True, yield_per=batch_size)
+    )
+    try:
+        for batch in result.partitions():
+            yield batch
+    finally:
+        result.close()
+
+def encode_csv(batches: Iterable[Sequence]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(
+            (row.id, row.date.isoformat(), row.type, row.category, row.amount, row.note or '')
+            for row in batch
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # No rows, just the header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def encode_ndjson(batches: Iterable[Sequence]) -> Iterator[str]:
+    for batch in batches:
+        yield ''.join(
+            json.dumps({
+                'id': row.id,
+                'date': row.date.isoformat(),
+                'type': row.type,
+                'category': row.category,
+                'amount': row.amount,
+                'note': row.note
+            }) + '\n'
+            for row in batch
+        )
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip a stream of text chunks incrementally.
+    
+    Args:
+        chunks: UTF-8 text chunks
+        level: zlib compression level
+    
+    Yields:
+        Compressed chunks forming one gzip file
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_transactions(user_id: int, format: str = 'csv', start_date=None, end_date=None,
+                        compress: bool = False, batch_size: int = 1000) -> Iterator:
+    """
+    Generate an export of a user's transactions.
+    
+    Args:
+        user_id: ID of the user
+        format: One of EXPORT_FORMATS
+        start_date: Only include transactions on or after this date
+        end_date: Only include transactions on or before this date
+        compress: Gzip the output
+        batch_size: Rows fetched and encoded at a time
+    
+    Returns:
+        Iterator of text chunks, or bytes chunks if compressed
+    """
+    batches = iter_transaction_batches(user_id, start_date, end_date, batch_size)
+    chunks = encode_csv(batches) if format == 'csv' else encode_ndjson(batches)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,191 @@
+"""
+Bulk import of bank statement CSVs.
+
+Rows are parsed and validated as the file streams in, categorized in
+batches and written with one executemany INSERT per batch, so a statement
+costs a handful of commits per batch rather than several per row. Invalid
+rows are reported with their line numbers and skipped; they never abort
+the rest of the file.
+"""
+import csv
+import math
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from sqlalchemy import insert
+
+from extensions import db
+from models import Transaction, User
+from monthly_rollup import month_key, refresh_rollup_months
+from daily_analytics import record_transactions
+
+REQUIRED_COLUMNS = {'date', 'amount'}
+MAX_REPORTED_ERRORS = 1000
+
+def parse_statement(stream: TextIO, date_format: str = '%Y-%m-%d') -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Parse and validate statement rows lazily.
+    
+    The CSV needs a header with date and amount columns; type, category and
+    note are optional. Without a type column, negative amounts are expenses
+    and positive amounts income.
+    
+    Args:
+        stream: Text stream of the CSV file
+        date_format: strptime format of the date column
+    
+    Yields:
+        (line number, row dict, None) for valid rows, (line number, None, error) otherwise
+    """
+    reader = csv.DictReader(stream)
+    try:
+        columns = {name.strip().lower() for name in reader.fieldnames or []}
+    except csv.Error as e:
+        yield 1, None, f'Unreadable header: {e}'
+        return
+    missing = REQUIRED_COLUMNS - columns
+    if missing:
+        yield 1, None, f"Missing column(s): {', '.join(sorted(missing))}"
+        return
+    
+    records = iter(reader)
+    while True:
+        try:
+            record = next(records)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # The reader skips the malformed line; line_num doesn't count it yet
+            yield reader.line_num + 1, None, f'Unreadable row: {e}'
+            continue
+        
+        line = reader.line_num
+        # Cells past the header end up under a None key, ignore them
+        record = {key.strip().lower(): (value or '').strip() for key, value in record.items() if key is not None}
+        try:
+            date = datetime.strptime(record['date'], date_format).date()
+        except ValueError:
+            yield line, None, f"Invalid date '{record['date']}'"
+            continue
+        
+        try:
+            amount = float(record['amount'].replace(',', ''))
+        except ValueError:
+            amount = None
+        # float() also accepts 'nan' and 'inf', which the database can't store
+        if amount is None or not math.isfinite(amount):
+            yield line, None, f"Invalid amount '{record['amount']}'"
+            continue
+        
+        type = record.get('type', '').lower()
+        if not type:
+            type = 'expense' if amount < 0 else 'income'
+        elif type not in ('income', 'expense'):
+            yield line, None, f"Invalid type '{record['type']}'"
+            continue
+        
+        amount = abs(amount)
+        if amount == 0:
+            yield line, None, 'Amount must not be zero'
+            continue
+        
+        yield line, {
+            'date': date,
+            'amount': amount,
+            'type': type,
+            'category': record.get('category', '')[:50] or None,
+            'note': record.get('note', '')[:200] or None,
+        }, None
+
+def import_transactions(user_id: int, rows: Iterable[Tuple[int, Optional[Dict], Optional[str]]],
+                        categorize: Callable[[List[str]], List[Optional[str]]],
+                        on_batch: Optional[Callable[[int], None]] = None,
+                        batch_size: int = 1000,
+                        report: Callable[[str], None] = lambda message: None,
+                        categorize_later: Optional[Callable[[List[int]], None]] = None) -> Dict:
+    """
+    Insert parsed statement rows for a user in batches. Must run in an app context.
+    
+    Args:
+        user_id: ID of the user
+        rows: Output of parse_statement
+        categorize: Batch categorizer for rows without a category, taking a list of notes.
+            None for a note leaves its row 'Uncategorized' for categorize_later.
+        on_batch: Called with the row count after each committed batch, e.g. to log activity
+        batch_size: Rows categorized, inserted and committed together
+        report: Callback receiving progress lines
+        categorize_later: Called after each committed batch with the ids of
+            its rows categorize returned None for, e.g. to queue a background job
+    
+    Returns:
+        Dict with rows imported, rows rejected, the first MAX_REPORTED_ERRORS errors,
+        elapsed seconds and rows/sec
+    """
+    imported = rejected = 0
+    errors = []
+    started = time.monotonic()
+    rows = iter(rows)
+    
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        
+        valid = []
+        for line, row, error in batch:
+            if error:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line, 'error': error})
+            else:
+                valid.append(row)
+        if not valid:
+            continue
+        
+        # One categorizer call per batch for the rows the statement left blank.
+        # Categories from the statement are the user's own labels.
+        for row in valid:
+            row['category_source'] = 'user' if row['category'] else 'auto'
+        uncategorized = [row for row in valid if not row['category'] and row['note']]
+        if uncategorized:
+            for row, category in zip(uncategorized, categorize([row['note'] for row in uncategorized])):
+                row['category'] = category
+        # Positions of the rows left for categorize_later
+        deferred = [i for i, row in enumerate(valid) if row['category'] is None and row['note']]
+        
+        now = datetime.utcnow()
+        for row in valid:
+            row['category'] = row['category'] or 'Uncategorized'
+            row['user_id'] = user_id
+            row['created_at'] = now
+        
+        if deferred and categorize_later:
+            ids = db.session.execute(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), valid
+            ).scalars().all()
+        else:
+            db.session.execute(insert(Transaction), valid)
+        User.bump_data_version(user_id)
+        refresh_rollup_months((user_id, month_key(row['date'])) for row in valid)
+        record_transactions((row['date'], row['type'], row['category'], row['amount']) for row in valid)
+        db.session.commit()
+        imported += len(valid)
+        
+        if on_batch:
+            on_batch(len(valid))
+        if deferred and categorize_later:
+            categorize_later([ids[i] for i in deferred])
+        
+        elapsed = time.monotonic() - started
+        report(f'{imported} rows imported, {rejected} rejected, {imported / elapsed:.0f} rows/sec')
+    
+    elapsed = time.monotonic() - started
+    return {
+        'imported': imported,
+        'rejected': rejected,
+        'errors': errors,
+        'elapsed': elapsed,
+        'rows_per_sec': imported / elapsed if elapsed else 0,
+    }
@@ -0,0 +1,350 @@
+"""
+Per-user learned categorization.
+
+Every user has already labelled their own transactions, so a tiny
+multinomial naive Bayes model over hashed word n-grams is trained per user
+from that history and updated online as new transactions are added. It is
+consulted between the keyword rules and the zero-shot transformer.
+"""
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Transaction, UserCategorizer
+from expense_categorizer import CategorizerUnavailable, categorize_expense
+
+N_FEATURES = 2 ** 18
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+def extract_features(note: str) -> Dict[int, int]:
+    """
+    Hash the word unigrams and bigrams of a note into feature counts.
+    
+    Args:
+        note: The expense note/description
+    
+    Returns:
+        Dict of feature index to count
+    """
+    tokens = _TOKEN.findall(note.lower())
+    grams = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+    features = {}
+    for gram in grams:
+        # crc32 rather than hash(), which is salted per process
+        index = zlib.crc32(gram.encode()) % N_FEATURES
+        features[index] = features.get(index, 0) + 1
+    return features
+
+def _labelled_rows(user_id: int):
+    # Categories the user chose, never ones we assigned, so the model doesn't
+    # learn from its own (or the rules' or the transformer's) guesses. Rows
+    # from before the source was recorded are taken as user labels.
+    return db.session.query(Transaction.note, Transaction.category).filter(
+        Transaction.user_id == user_id,
+        Transaction.note.isnot(None),
+        Transaction.category != 'Uncategorized',
+        or_(Transaction.category_source == 'user', Transaction.category_source.is_(None))
+    ).order_by(Transaction.id)
+
+class NaiveBayesCategorizer:
+    def __init__(self, alpha: float = 1.0, min_samples: int = 10, min_confidence: float = 0.7):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.min_confidence = min_confidence
+        self.n_samples = 0
+        # category -> [document count, total feature count, {feature: count}]
+        self.classes = {}
+    
+    def partial_fit(self, note: str, category: str):
+        """
+        Update the model with one labelled note.
+        
+        Args:
+            note: The expense note/description
+            category: The category the user assigned
+        """
+        features = extract_features(note)
+        if not features:
+            return
+        
+        stats = self.classes.setdefault(category, [0, 0, {}])
+        stats[0] += 1
+        counts = stats[2]
+        for index, count in features.items():
+            counts[index] = counts.get(index, 0) + count
+            stats[1] += count
+        self.n_samples += 1
+    
+    def predict(self, note: str) -> Optional[str]:
+        """
+        Predict a category for a note.
+        
+        Args:
+            note: The expense note/description
+        
+        Returns:
+            The predicted category, or None if the model is not confident
+        """
+        if self.n_samples < self.min_samples or not note:
+            return None
+        
+        features = extract_features(note)
+        # Nothing in this note has been seen before, the prior alone decides
+        if not any(index in stats[2] for stats in self.classes.values() for index in features):
+            return None
+        
+        scores = {}
+        for category, (docs, total, counts) in self.classes.items():
+            denominator = math.log(total + self.alpha * N_FEATURES)
+            score = math.log(docs / self.n_samples)
+            for index, count in features.items():
+                score += count * (math.log(counts.get(index, 0) + self.alpha) - denominator)
+            scores[category] = score
+        
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best if confidence >= self.min_confidence else None
+    
+    def to_bytes(self) -> bytes:
+        """Serialize the model state compactly"""
+        return zlib.compress(json.dumps({
+            'n': self.n_samples,
+            'c': {category: [docs, total, counts] for category, (docs, total, counts) in self.classes.items()}
+        }, separators=(',', ':')).encode())
+    
+    @classmethod
+    def from_bytes(cls, data: bytes, **kwargs) -> 'NaiveBayesCategorizer':
+        """Restore a model serialized with to_bytes"""
+        state = json.loads(zlib.decompress(data))
+        model = cls(**kwargs)
+        model.n_samples = state['n']
+        model.classes = {
+            category: [docs, total, {int(index): count for index, count in counts.items()}]
+            for category, (docs, total, counts) in state['c'].items()
+        }
+        return model
+
+class UserCategorizerStore:
+    def __init__(self, max_users: int = 1000, train_later: Optional[Callable[[int], None]] = None,
+                 requeue_seconds: float = 600):
+        self.max_users = max_users
+        # Queues train_from_history for a user without a model; trains inline if None
+        self.train_later = train_later
+        self.requeue_seconds = requeue_seconds
+        # user_id -> (version, model)
+        self._models = OrderedDict()
+        # user_id -> when its training was queued by this process
+        self._queued = {}
+        self._lock = threading.Lock()
+        # Models are mutated in place by learn(), guard them against concurrent predict()
+        self._model_lock = threading.Lock()
+    
+    def predict(self, user_id: int, note: str) -> Optional[str]:
+        """
+        Predict a category from the user's own labelling history.
+        
+        A user without a stored model gets None, and training from their
+        history is queued rather than run in the caller's request.
+        
+        Args:
+            user_id: ID of the user
+            note: The expense note/description
+        
+        Returns:
+            The predicted category, or None if there is no confident prediction
+        """
+        loaded = self._load(user_id)
+        if loaded is None:
+            self._queue_training(user_id)
+            return None
+        
+        _, model = loaded
+        with self._model_lock:
+            return model.predict(note)
+    
+    def learn(self, user_id: int, note: str, category: str, attempts: int = 3):
+        """
+        Update the user's model with a newly committed, user-labelled transaction.
+        
+        Args:
+            user_id: ID of the user
+            note: The expense note/description
+            category: The category the user assigned
+            attempts: Times to retry if another worker updates the model concurrently
+        """
+        if not note or not category or category == 'Uncategorized':
+            return
+        
+        for _ in range(attempts):
+            loaded = self._load(user_id)
+            if loaded is None:
+                # Training from history already picks up the committed transaction
+                self.train_from_history(user_id)
+                return
+            
+            version, model = loaded
+            with self._model_lock:
+                model.partial_fit(note, category)
+                state = model.to_bytes()
+            
+            # Only write if nobody else has updated the model since we loaded it
+            updated = UserCategorizer.query.filter_by(user_id=user_id, version=version).update({
+                UserCategorizer.state: state,
+                UserCategorizer.n_samples: model.n_samples,
+                UserCategorizer.version: version + 1,
+                UserCategorizer.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            
+            with self._lock:
+                if updated:
+                    self._models[user_id] = (version + 1, model)
+                    return
+                # Lost the race, drop our copy and retry on the latest state
+                self._models.pop(user_id, None)
+    
+    def train_from_history(self, user_id: int) -> NaiveBayesCategorizer:
+        """
+        (Re)build the user's model from their labelled transactions.
+        
+        Args:
+            user_id: ID of the user
+        
+        Returns:
+            The trained model
+        """
+        model = NaiveBayesCategorizer()
+        for note, category in _labelled_rows(user_id).yield_per(1000):
+            model.partial_fit(note, category)
+        
+        entry = UserCategorizer.query.filter_by(user_id=user_id).first()
+        if entry is None:
+            entry = UserCategorizer(user_id=user_id, version=0)
+            db.session.add(entry)
+        entry.state = model.to_bytes()
+        entry.n_samples = model.n_samples
+        entry.version = (entry.version or 0) + 1
+        entry.updated_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created the model first, use theirs
+            db.session.rollback()
+            return self._load(user_id)[1]
+        
+        self._remember(user_id, entry.version, model)
+        return model
+    
+    def _load(self, user_id: int) -> Optional[Tuple[int, NaiveBayesCategorizer]]:
+        row = db.session.query(UserCategorizer.version).filter_by(user_id=user_id).first()
+        if row is None:
+            return None
+        
+        with self._lock:
+            cached = self._models.get(user_id)
+            if cached is not None and cached[0] == row.version:
+                self._models.move_to_end(user_id)
+                return cached
+        
+        # Not loaded yet, or another worker updated the model since
+        entry = UserCategorizer.query.filter_by(user_id=user_id).first()
+        model = NaiveBayesCategorizer.from_bytes(entry.state)
+        self._remember(user_id, entry.version, model)
+        return entry.version, model
+    
+    def _queue_training(self, user_id: int):
+        if self.train_later is None:
+            self.train_from_history(user_id)
+            return
+        
+        # Once per user until the model shows up, or again after a failed training
+        now = time.monotonic()
+        with self._lock:
+            queued_at = self._queued.get(user_id)
+            if queued_at is not None and now - queued_at < self.requeue_seconds:
+                return
+            self._queued[user_id] = now
+        self.train_later(user_id)
+    
+    def _remember(self, user_id: int, version: int, model: NaiveBayesCategorizer):
+        with self._lock:
+            self._queued.pop(user_id, None)
+            self._models[user_id] = (version, model)
+            self._models.move_to_end(user_id)
+            while len(self._models) > self.max_users:
+                self._models.popitem(last=False)
+
+def evaluate_categorizer(user_id: int, zero_shot: Callable[[List[str]], List[str]],
+                         holdout: float = 0.2) -> Dict:
+    """
+    Compare the learned model with the zero-shot path on the user's own labels.
+    
+    The model is trained on the oldest (1 - holdout) of the user's labelled
+    transactions and scored on the newest ones. Only held-out notes the
+    keyword rules can't place are scored, since those are the notes the two
+    compete for.
+    
+    Args:
+        user_id: ID of the user
+        zero_shot: Batch zero-shot categorizer, taking a list of notes
+        holdout: Fraction of the labelled history held out for scoring
+    
+    Returns:
+        Dict with sample counts, and per categorizer its coverage, accuracy on
+        the notes it answered, overall accuracy and p50/p99 latency per note
+        in microseconds. zero_shot is None if the categorizer was unavailable.
+    """
+    rows = _labelled_rows(user_id).all()
+    split = int(len(rows) * (1 - holdout))
+    model = NaiveBayesCategorizer()
+    for note, category in rows[:split]:
+        model.partial_fit(note, category)
+    
+    held_out = [(note, category) for note, category in rows[split:] if categorize_expense(note) == 'Uncategorized']
+    notes = [note for note, _ in held_out]
+    labels = [category for _, category in held_out]
+    
+    predictions, latencies = [], []
+    for note in notes:
+        started = time.perf_counter()
+        predictions.append(model.predict(note))
+        latencies.append(time.perf_counter() - started)
+    
+    try:
+        started = time.perf_counter()
+        zero_shot_predictions = zero_shot(notes)
+        # One batched call, so only the mean latency per note is known
+        zero_shot_latencies = [(time.perf_counter() - started) / len(notes)] * len(notes) if notes else []
+    except CategorizerUnavailable:
+        zero_shot_predictions = None
+    
+    return {
+        'train_samples': model.n_samples,
+        'held_out': len(held_out),
+        'learned': _score(predictions, labels, latencies),
+        'zero_shot': _score(zero_shot_predictions, labels, zero_shot_latencies)
+            if zero_shot_predictions is not None else None,
+    }
+
+def _score(predictions: List[Optional[str]], labels: List[str], latencies: List[float]) -> Dict:
+    answered = [(prediction, label) for prediction, label in zip(predictions, labels) if prediction is not None]
+    correct = sum(prediction == label for prediction, label in answered)
+    latencies = sorted(latencies)
+    return {
+        'coverage': len(answered) / len(labels) if labels else None,
+        'accuracy_answered': correct / len(answered) if answered else None,
+        'accuracy': correct / len(labels) if labels else None,
+        'latency_us_p50': latencies[len(latencies) // 2] * 1e6 if latencies else None,
+        'latency_us_p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6 if latencies else None,
+    }